@@ -0,0 +1,93 @@
+"""Throughput of the sector/country tools under concurrent sessions: sync vs async.
+
+    python -m benchmarks.bench_concurrency --sessions 32 --calls 10
+
+"sync" calls the regular tool functions from coroutines on one event loop, the
+way a single uvicorn worker runs them today, so every call blocks the loop.
+"async" awaits the coroutine implementations from async_tools.py. Without --uri
+the data is synthetic and held in mongomock, and similarity lookups use the
+local vector backend.
+"""
+import argparse
+import asyncio
+import inspect
+import os
+import random
+import time
+
+
+def _workload(sector_agent, country_agent, sectors: list, countries: list, rng: random.Random) -> tuple:
+    choice = rng.randrange(5)
+    if choice == 0:
+        return sector_agent.get_sector_report, (rng.choice(sectors),)
+    if choice == 1:
+        return sector_agent.find_similar_sectors, (rng.choice(sectors) + " emissions",)
+    if choice == 2:
+        return country_agent.get_country_report, (rng.choice(countries),)
+    if choice == 3:
+        return sector_agent.compare_sectors, (rng.choice(sectors), rng.choice(sectors))
+    return country_agent.find_country_list, ()
+
+
+async def _session(sector_agent, country_agent, sectors, countries, calls: int, seed: int, latencies: list) -> None:
+    rng = random.Random(seed)
+    for _ in range(calls):
+        fn, args = _workload(sector_agent, country_agent, sectors, countries, rng)
+        start = time.perf_counter()
+        result = fn(*args)
+        if inspect.isawaitable(result):
+            await result
+        latencies.append(time.perf_counter() - start)
+
+
+async def _run(sector_agent, country_agent, sectors, countries, sessions: int, calls: int) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _session(sector_agent, country_agent, sectors, countries, calls, seed, latencies)
+        for seed in range(sessions)
+    ])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "calls_per_s": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=None, help="MongoDB URI to benchmark against instead of mongomock")
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--calls", type=int, default=10, help="tool calls per session")
+    parser.add_argument("--sector-rows", type=int, default=2000)
+    parser.add_argument("--country-rows", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ["MONGO_URI"] = args.uri or "mongomock://localhost"
+    if args.uri is None:
+        os.environ["VECTOR_BACKEND"] = "local"
+
+    from manager.common import db, models
+    from manager.sub_agents.analysis_sector_agent import agent as sector_agent, async_tools as sector_async
+    from manager.sub_agents.analysis_country_agent import agent as country_agent, async_tools as country_async
+    from benchmarks import synthetic
+
+    if args.uri is None:
+        synthetic.load_into(db.get_database(), db.SECTOR_COLLECTION, db.COUNTRY_COLLECTION, args.sector_rows, args.country_rows)
+        synthetic.embed_collection(db.get_sector_collection(), "Subsector_Name", models.encode)
+        synthetic.embed_collection(db.get_country_collection(), "Country", models.encode)
+        db.ensure_indexes()
+
+    sectors = db.distinct_sectors()
+    countries = db.distinct_countries()
+
+    print(f"{'mode':<8}{'sessions':>10}{'calls/s':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode, modules in (("sync", (sector_agent, country_agent)), ("async", (sector_async, country_async))):
+        stats = asyncio.run(_run(*modules, sectors, countries, args.sessions, args.calls))
+        print(f"{mode:<8}{args.sessions:>10}{stats['calls_per_s']:>12.1f}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
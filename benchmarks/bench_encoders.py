@@ -0,0 +1,112 @@
+"""Embedding backends compared: parity with sentence-transformers, latency and throughput.
+
+    python -m manager.common.models --output .models/all-MiniLM-L6-v2-int8
+    python -m benchmarks.bench_encoders --min-cosine 0.99
+
+The parity check encodes the sector, subsector and country vocabulary with both
+backends and compares the vectors row by row. It also reports how often both
+backends pick the same nearest neighbour for a term within the vocabulary.
+The exit status is 1 if the lowest cosine is below --min-cosine. With --uri the
+vocabulary is read from that deployment; otherwise a built-in list is used.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+COUNTRIES = [
+    "United States", "China", "India", "Russia", "Japan", "Germany", "Iran", "South Korea",
+    "Saudi Arabia", "Indonesia", "Canada", "Mexico", "Brazil", "South Africa", "Turkey",
+    "Australia", "United Kingdom", "Italy", "France", "Poland", "Kazakhstan", "Thailand",
+    "Malaysia", "Vietnam", "Egypt", "Spain", "Pakistan", "Argentina", "Nigeria", "Netherlands",
+]
+QUERIES = [
+    "emissions from planes", "shipping emissions", "coal power plants", "cars and trucks",
+    "heating homes", "farming", "landfills", "oil and gas production", "steel and cement",
+    "which country emits the most", "europe", "US", "UK",
+]
+
+
+def _vocabulary(uri: str) -> list:
+    from benchmarks import synthetic
+    if uri is None:
+        subsectors = [f"{sector} subsector {i}" for sector in synthetic.SECTORS for i in range(3)]
+        return synthetic.SECTORS + subsectors + synthetic.CONTINENTS + COUNTRIES + QUERIES
+    os.environ["MONGO_URI"] = uri
+    from manager.common import db
+    subsectors = db.get_sector_collection().distinct("Subsector_Name")
+    return db.distinct_sectors() + subsectors + db.distinct_countries() + QUERIES
+
+
+def _parity(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    cosines = np.sum(reference * candidate, axis=1)
+    # Nearest other term in the vocabulary, by each backend.
+    def neighbours(vectors):
+        scores = vectors @ vectors.T
+        np.fill_diagonal(scores, -np.inf)
+        return scores.argmax(axis=1)
+    agreement = float(np.mean(neighbours(reference) == neighbours(candidate)))
+    return {"min": float(cosines.min()), "mean": float(cosines.mean()), "neighbour_agreement": agreement}
+
+
+def _latency(encoder, texts: list, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        for text in texts:
+            start = time.perf_counter()
+            encoder.encode(text)
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"p50": pick(0.50), "p95": pick(0.95), "mean": statistics.fmean(samples)}
+
+
+def _throughput(encoder, texts: list, batch_size: int, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for i in range(0, len(texts), batch_size):
+            encoder.encode(texts[i:i + batch_size])
+    return repeat * len(texts) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=None, help="read the vocabulary from this MongoDB deployment")
+    parser.add_argument("--onnx-dir", default=None, help="exported model directory (default ONNX_MODEL_DIR)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 0], help="ONNX intra-op thread counts to try; 0 is onnxruntime's default")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+
+    from manager.common import models
+
+    texts = _vocabulary(args.uri)
+    backends = [("sentence-transformers", models.SentenceTransformerEncoder())]
+    for threads in args.threads:
+        onnx_options = {"intra_op_threads": threads}
+        if args.onnx_dir:
+            onnx_options["model_dir"] = args.onnx_dir
+        backends.append((f"onnx-int8 threads={threads or 'auto'}", models.OnnxEncoder(**onnx_options)))
+
+    reference = np.asarray(backends[0][1].encode(texts), dtype=np.float32)
+    parity = _parity(reference, np.asarray(backends[1][1].encode(texts), dtype=np.float32))
+    print(f"parity over {len(texts)} terms: min cosine {parity['min']:.4f}, mean {parity['mean']:.4f}, "
+          f"nearest-neighbour agreement {parity['neighbour_agreement']:.1%}")
+
+    print(f"\n{'backend':<30}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'texts/s':>12}")
+    for name, encoder in backends:
+        latency = _latency(encoder, texts, args.repeat)
+        throughput = _throughput(encoder, texts, args.batch_size, args.repeat)
+        print(f"{name:<30}{latency['p50']:>10.3f}{latency['p95']:>10.3f}{latency['mean']:>10.3f}{throughput:>12.1f}")
+
+    if parity["min"] < args.min_cosine:
+        print(f"\nFAIL: min cosine {parity['min']:.4f} < {args.min_cosine}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
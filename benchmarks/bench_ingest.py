@@ -0,0 +1,45 @@
+"""Ingestion throughput: rows/s and embeddings/s for synthetic monthly files.
+
+    python -m benchmarks.bench_ingest --rows 100000 --workers 0 2 4
+
+Writes a synthetic sector CSV, then loads it with manager.common.ingest once
+per worker count. Without --uri the target is an in-process mongomock store,
+whose writes are pure Python, so the rows/s column is a floor.
+"""
+import argparse
+import os
+import tempfile
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=None, help="MongoDB URI to load into instead of mongomock")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--subsectors", type=int, default=2000, help="distinct subsectors, i.e. distinct embedded texts per sector")
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2])
+    parser.add_argument("--chunk-rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    os.environ["MONGO_URI"] = args.uri or "mongomock://localhost"
+
+    import pandas as pd
+
+    from benchmarks import synthetic
+    from manager.common import ingest
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sector.csv")
+        docs = synthetic.sector_documents(args.rows, subsectors_per_sector=args.subsectors)
+        pd.DataFrame(docs).drop(columns=["Sector_name_norm"]).to_csv(path, index=False)
+
+        print(f"{'workers':>8}{'rows':>10}{'embedded':>10}{'seconds':>10}{'rows/s':>10}{'emb/s':>10}{'emb/s/wkr':>11}{'writes/s':>10}")
+        for workers in args.workers:
+            stats = ingest.ingest("sector", path, chunk_rows=args.chunk_rows, workers=workers)
+            print(
+                f"{workers:>8}{stats['rows']:>10}{stats['encoded']:>10}{stats['seconds']:>10.2f}{stats['rows_per_second']:>10.0f}"
+                f"{stats['embeddings_per_second']:>10.0f}{stats['encoder_embeddings_per_second']:>11.0f}{stats['writes_per_second']:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
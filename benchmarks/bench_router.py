@@ -0,0 +1,120 @@
+"""Intent router accuracy and latency on a labelled set of requests.
+
+    python -m benchmarks.bench_router --thresholds 0.5 0.6 0.7
+
+The requests are built from phrasings that differ from the router's exemplars,
+filled in with sector and country names from the data, plus requests the
+router should leave to the LLM. For each threshold the report shows:
+
+- coverage: the share of requests routed without the LLM;
+- target accuracy: the routed requests sent to the right agent or tool;
+- tool accuracy: the routed requests that also called the right tool with the right arguments;
+- the share of out-of-scope requests the router wrongly took.
+
+Latency is the routing time per request, measured with the encoder warm. Without --uri
+the names come from synthetic data in mongomock.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+# (expected intent, template). {sector}, {sector2} and {country} are filled in
+# with names from the data; None marks requests that should go to the LLM.
+LABELLED = [
+    ("sector_list", "which sectors can I ask about?"),
+    ("sector_list", "show all sectors"),
+    ("sector_list", "what are the sectors in the data"),
+    ("country_list", "which countries are covered?"),
+    ("country_list", "show all countries"),
+    ("country_list", "what countries are in the data"),
+    ("sector_report", "I need the {sector} report"),
+    ("sector_report", "emissions report for the {sector} sector"),
+    ("sector_report", "break down {sector} emissions by subsector"),
+    ("sector_trend", "how did {sector} emissions change month over month"),
+    ("sector_trend", "{sector} monthly trend"),
+    ("sector_compare", "compare {sector} vs {sector2}"),
+    ("sector_compare", "how does {sector} compare with {sector2}"),
+    ("country_report", "emissions report for {country}"),
+    ("country_report", "what are the emissions of {country}"),
+    ("country_report", "{country} report please"),
+    ("country_trend", "how did emissions in {country} change over time"),
+    ("country_trend", "{country} year over year change"),
+    ("country_plot", "chart the emissions trend of {country}"),
+    ("country_plot", "plot {country}"),
+    ("news", "any recent news about carbon taxes?"),
+    ("news", "latest news on the paris agreement"),
+    (None, "hello"),
+    (None, "what can you do?"),
+    (None, "thanks, that's all"),
+    (None, "explain what year to date means"),
+    (None, "write me a poem about the ocean"),
+]
+
+
+def build_requests(sectors: list, countries: list, per_template: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    requests = []
+    for intent, template in LABELLED:
+        for _ in range(per_template if "{" in template else 1):
+            sector, sector2 = rng.sample(sectors, 2)
+            requests.append((intent, template.format(sector=sector, sector2=sector2, country=rng.choice(countries))))
+    return requests
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=None, help="MongoDB URI to read entity names from instead of synthetic data")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7])
+    parser.add_argument("--margin", type=float, default=None)
+    parser.add_argument("--per-template", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["MONGO_URI"] = args.uri or "mongomock://localhost"
+    from manager.common import db, models, router
+
+    if args.uri is None:
+        from benchmarks import synthetic
+        database = db.get_database()
+        database[db.SECTOR_COLLECTION].insert_many(synthetic.sector_documents(500))
+        database[db.COUNTRY_COLLECTION].insert_many(synthetic.country_documents(100))
+
+    intents = {intent.name: intent for intent in router.INTENTS}
+    requests = build_requests(db.distinct_sectors(), db.distinct_countries(), args.per_template)
+    models.get_encoder()
+
+    print(f"{len(requests)} requests, encoder {models.ENCODER_ID}")
+    print(f"{'threshold':>10}{'coverage':>10}{'target acc':>12}{'tool acc':>10}{'oos taken':>11}{'p50 ms':>9}{'p95 ms':>9}")
+    for threshold in args.thresholds:
+        instance = router.Router(threshold=threshold, margin=args.margin)
+        instance.route("warm up")
+        routed = correct_target = correct_tool = out_of_scope = out_of_scope_taken = 0
+        latencies = []
+        for expected, text in requests:
+            start = time.perf_counter()
+            route, _ = instance.route(text)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if expected is None:
+                out_of_scope += 1
+                out_of_scope_taken += route is not None
+                continue
+            if route is None:
+                continue
+            routed += 1
+            want = intents[expected]
+            if route.target == (want.agent or want.tool):
+                correct_target += 1
+                if route.tool == want.tool and (route.intent == expected):
+                    correct_tool += 1
+        in_scope = len(requests) - out_of_scope
+        quantiles = statistics.quantiles(latencies, n=20)
+        print(
+            f"{threshold:>10.2f}{routed / in_scope:>10.1%}{correct_target / max(routed, 1):>12.1%}"
+            f"{correct_tool / max(routed, 1):>10.1%}{out_of_scope_taken / max(out_of_scope, 1):>11.1%}"
+            f"{statistics.median(latencies):>9.2f}{quantiles[18]:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Per-call latency of the sector and country tools: MongoDB path vs in-memory snapshot.
+
+    python -m benchmarks.bench_snapshot --sector-rows 5000 --country-rows 200
+
+Without --uri the data is generated into an in-process mongomock store. With
+--uri the tools read whatever is already loaded in that deployment; otherwise
+similarity lookups use the local vector backend.
+"""
+import argparse
+import os
+import statistics
+import time
+
+
+def _percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "mean": statistics.fmean(samples)}
+
+
+def _time_calls(fn, args_list: list, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        for args in args_list:
+            start = time.perf_counter()
+            fn(*args)
+            samples.append((time.perf_counter() - start) * 1000)
+    return _percentiles(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=None, help="MongoDB URI to benchmark against instead of mongomock")
+    parser.add_argument("--sector-rows", type=int, default=5000)
+    parser.add_argument("--country-rows", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["MONGO_URI"] = args.uri or "mongomock://localhost"
+    if args.uri is None:
+        # mongomock has no $vectorSearch; similarity fallbacks use the local index.
+        os.environ["VECTOR_BACKEND"] = "local"
+
+    from manager.common import db, models, snapshot
+    from manager.sub_agents.analysis_sector_agent import agent as sector_agent
+    from manager.sub_agents.analysis_country_agent import agent as country_agent
+    from benchmarks import synthetic
+
+    if args.uri is None:
+        synthetic.load_into(db.get_database(), db.SECTOR_COLLECTION, db.COUNTRY_COLLECTION, args.sector_rows, args.country_rows)
+        synthetic.embed_collection(db.get_sector_collection(), "Subsector_Name", models.encode)
+        synthetic.embed_collection(db.get_country_collection(), "Country", models.encode)
+        db.ensure_indexes()
+
+    sectors = db.distinct_sectors()
+    countries = db.distinct_countries()[:20]
+    cases = [
+        ("get_sector_report", sector_agent.get_sector_report, [(s,) for s in sectors]),
+        ("compare_sectors", sector_agent.compare_sectors, [(sectors[i], sectors[i - 1]) for i in range(len(sectors))]),
+        ("get_sector_list", sector_agent.get_sector_list, [()]),
+        ("find_country_list", country_agent.find_country_list, [()]),
+        ("get_country_report", country_agent.get_country_report, [(c,) for c in countries]),
+    ]
+
+    print(f"{'tool':<22}{'mode':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for name, fn, calls in cases:
+        for mode in ("mongo", "snapshot"):
+            snapshot.enable(mode == "snapshot")
+            if mode == "snapshot":
+                snapshot.refresh()
+            stats = _time_calls(fn, calls, args.repeat)
+            print(f"{name:<22}{mode:<10}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}{stats['mean']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
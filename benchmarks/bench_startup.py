@@ -0,0 +1,72 @@
+"""Cold-start cost of the agent package: import time, time to model readiness and peak RSS.
+
+    python -m benchmarks.bench_startup --repeat 5
+
+Every sample runs in a fresh interpreter. "import" only imports manager.agent;
+"ready" also waits for the shared embedding model to finish loading. Import time
+per top-level package, from one `python -X importtime` run, is listed at the end.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import manager.agent
+imported = time.perf_counter() - start
+ready = None
+if sys.argv[1] == "ready":
+    from manager.common import models
+    models.get_encoder()
+    ready = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"import_s": imported, "ready_s": ready, "peak_rss_mb": rss_kb / 1024}))
+"""
+
+
+def _run_probe(mode: str, env: dict) -> dict:
+    output = subprocess.run([sys.executable, "-c", _PROBE, mode], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# Self time from `python -X importtime`, summed per top-level package, so
+# pandas, google.* and so on each get one line.
+def _import_time_by_package(env: dict, top: int) -> list:
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import manager.agent"], env=env, capture_output=True, text=True, check=True).stderr
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(self_us)
+    return sorted(((us, package) for package, us in totals.items()), reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of packages to list")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("MONGO_URI", "mongomock://localhost")
+
+    print(f"{'mode':<10}{'p50 s':>10}{'max s':>10}{'peak RSS MB':>14}")
+    for mode in ("import", "ready"):
+        samples = [_run_probe(mode, env) for _ in range(args.repeat)]
+        seconds = [s["ready_s"] if mode == "ready" else s["import_s"] for s in samples]
+        rss = max(s["peak_rss_mb"] for s in samples)
+        print(f"{mode:<10}{statistics.median(seconds):>10.3f}{max(seconds):>10.3f}{rss:>14.1f}")
+
+    print("\nimport time by package (ms):")
+    for microseconds, name in _import_time_by_package(env, args.top):
+        print(f"  {microseconds / 1000:>9.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
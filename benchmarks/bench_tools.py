@@ -0,0 +1,222 @@
+"""Latency, throughput and peak memory of every agent tool, at cold and warm cache.
+
+    python -m benchmarks.bench_tools --sizes 1000 100000 --output bench.json
+    python -m benchmarks.bench_tools --sizes 1000 100000 --baseline benchmarks/baseline.json --threshold 0.25
+
+For each size the sector collection gets that many synthetic rows, with
+embeddings, in an in-process mongomock store. The country collection gets
+--country-rows rows, which is --sizes when not given. Then the same steps as a
+real load run: indexes, a published dataset version, the time series and the
+rollups. Every tool in TOOLS of both agents is then called with --calls
+argument sets.
+
+- cold: the tool, embedding and chart caches are cleared before every call.
+  Process state is warmed first by one untimed call per tool: the Mongo
+  client, the encoder, the local vector index and the chart workers.
+- warm: every argument set is called once, then timed --repeat times.
+
+The report has p50/p95/p99 latency, calls/s and the peak Python allocation
+during the calls (tracemalloc, measured in a separate pass so it does not
+slow the timings).
+
+--output writes the results as JSON. --baseline compares against such a file:
+a tool whose --metric grew by more than --threshold, and by more than
+--floor-ms, is a regression, and the exit status is 1. Record a baseline on
+the machine that runs the comparison. With --uri the tools read whatever is
+loaded in that deployment and nothing is generated.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "mean_ms")
+
+
+def _percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "mean_ms": statistics.fmean(samples)}
+
+
+# (tool, [args, ...]) for every tool of both agents.
+def _cases(sector_agent, country_agent, calls: int, seed: int = 0) -> list:
+    from manager.common import db
+
+    rng = random.Random(seed)
+    sectors = db.distinct_sectors()
+    countries = db.distinct_countries()
+    continents = db.distinct_continents()
+    pick = lambda names: [names[i % len(names)] for i in rng.sample(range(max(calls, len(names))), calls)]
+    some_sectors = pick(sectors)
+    some_countries = pick(countries)
+    return [
+        (sector_agent.introduction_to_data, [()]),
+        (sector_agent.get_sector_list, [()]),
+        (sector_agent.find_similar_sectors, [(f"{s} emissions",) for s in some_sectors]),
+        (sector_agent.get_sector_report, [(s,) for s in some_sectors]),
+        (sector_agent.compare_sectors, [tuple(rng.sample(sectors, 2)) for _ in range(calls)]),
+        (sector_agent.compare_sectors_many, [(rng.sample(sectors, 3),) for _ in range(calls)]),
+        (sector_agent.get_graph_report, [(s, "2025_YTD") for s in some_sectors]),
+        (sector_agent.get_sector_trend, [(s,) for s in some_sectors]),
+        (sector_agent.rank_subsectors, [("2025_YTD", 10, s) for s in some_sectors]),
+        (country_agent.introduction_to_data, [()]),
+        (country_agent.find_country_list, [()]),
+        (country_agent.find_similar_countries, [(c.lower(),) for c in some_countries]),
+        (country_agent.get_country_report, [(c,) for c in some_countries]),
+        (country_agent.plot_emissions_trend, [(c,) for c in some_countries]),
+        (country_agent.get_country_trend, [(c,) for c in some_countries]),
+        (country_agent.rank_countries, [("2025_YTD", 10, c) for c in pick(continents)]),
+        (country_agent.continent_summary, [(field,) for field in ("2025_YTD", "Mar_2025_Total", "Monthly_%_change")]),
+    ]
+
+
+def _clear_caches() -> None:
+    from manager.common.charts import chart_cache
+    from manager.common.embedding_cache import embedding_cache
+    from manager.common.tool_cache import tool_cache
+
+    tool_cache.clear()
+    embedding_cache.clear()
+    chart_cache.clear()
+
+
+def _calls(fn, args_list: list, cache: str, repeat: int, timed: bool) -> list:
+    samples = []
+    if cache == "warm":
+        for args in args_list:
+            fn(*args)
+    for _ in range(1 if cache == "cold" else repeat):
+        for args in args_list:
+            if cache == "cold":
+                _clear_caches()
+            start = time.perf_counter()
+            fn(*args)
+            if timed:
+                samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _measure(fn, args_list: list, cache: str, repeat: int) -> dict:
+    samples = _calls(fn, args_list, cache, repeat, timed=True)
+    result = _percentiles(samples)
+    result["calls"] = len(samples)
+    result["calls_per_s"] = len(samples) / (sum(samples) / 1000) if sum(samples) else 0.0
+    tracemalloc.start()
+    try:
+        _calls(fn, args_list, cache, 1, timed=False)
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+# Rows of current whose metric grew past both limits relative to the
+# baseline row with the same size, tool and cache.
+def regressions(current: dict, baseline: dict, metric: str, threshold: float, floor_ms: float) -> list:
+    previous = {(r["rows"], r["tool"], r["cache"]): r for r in baseline["results"]}
+    found = []
+    for row in current["results"]:
+        before = previous.get((row["rows"], row["tool"], row["cache"]))
+        if before is None:
+            continue
+        if row[metric] > before[metric] * (1 + threshold) and row[metric] - before[metric] > floor_ms:
+            found.append((row, before[metric]))
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default=None, help="MongoDB URI to benchmark against instead of generated data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="sector rows per run, 1k to 1M")
+    parser.add_argument("--country-rows", type=int, default=None, help="country rows per run; defaults to the size")
+    parser.add_argument("--calls", type=int, default=10, help="argument sets per tool")
+    parser.add_argument("--repeat", type=int, default=5, help="timed passes over the argument sets at warm cache")
+    parser.add_argument("--tools", nargs="+", default=None, help="only these tools")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this path")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against")
+    parser.add_argument("--metric", choices=METRICS, default="p50_ms")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative growth of --metric")
+    parser.add_argument("--floor-ms", type=float, default=0.05, help="ignore growth smaller than this")
+    args = parser.parse_args()
+
+    os.environ["MONGO_URI"] = args.uri or "mongomock://localhost"
+    if args.uri is None:
+        # mongomock has no $vectorSearch; similarity lookups use the local index.
+        os.environ["VECTOR_BACKEND"] = "local"
+        os.environ.setdefault("BLOB_BACKEND", "local")
+        os.environ.setdefault("LOCAL_BLOB_DIR", tempfile.mkdtemp(prefix="bench_tools_"))
+
+    from benchmarks import synthetic
+    from manager.common import models
+    from manager.sub_agents.analysis_sector_agent import agent as sector_agent
+    from manager.sub_agents.analysis_country_agent import agent as country_agent
+
+    models.get_encoder()
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "encoder": models.ENCODER_ID,
+            "store": "uri" if args.uri else "mongomock",
+            "calls": args.calls,
+            "repeat": args.repeat,
+        },
+        "loads": [],
+        "results": [],
+    }
+    covered = set()
+
+    print(f"{'rows':>9} {'tool':<24}{'cache':<6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'calls/s':>11}{'peak MB':>9}")
+    for size in ([None] if args.uri else args.sizes):
+        if args.uri is None:
+            seconds = synthetic.build_dataset(size, args.country_rows or size)
+            report["loads"].append({"rows": size, "country_rows": args.country_rows or size, "seconds": seconds})
+        for fn, args_list in _cases(sector_agent, country_agent, args.calls):
+            name = fn.__name__
+            if args.tools and name not in args.tools:
+                continue
+            covered.add(name)
+            fn(*args_list[0])
+            for cache in ("cold", "warm"):
+                row = {"rows": size, "tool": f"{fn.__module__.split('.')[-2]}.{name}", "cache": cache}
+                row.update(_measure(fn, args_list, cache, args.repeat))
+                report["results"].append(row)
+                print(
+                    f"{size or '-':>9} {name:<24}{cache:<6}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}"
+                    f"{row['p99_ms']:>10.3f}{row['calls_per_s']:>11.1f}{row['peak_mb']:>9.2f}"
+                )
+
+    missing = {tool.__name__ for tool in sector_agent.TOOLS + country_agent.TOOLS} - covered
+    if missing and not args.tools:
+        print(f"\nno benchmark case for: {', '.join(sorted(missing))}")
+    report["meta"]["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\npeak RSS {report['meta']['peak_rss_mb']:.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(report, baseline, args.metric, args.threshold, args.floor_ms)
+        if not found:
+            print(f"no regressions against {args.baseline} ({args.metric}, threshold {args.threshold:.0%})")
+            return
+        print(f"{len(found)} regressions against {args.baseline} ({args.metric}, threshold {args.threshold:.0%}):")
+        for row, before in found:
+            print(f"  {row['rows'] or '-':>9} {row['tool']:<44}{row['cache']:<6}{before:>10.3f} -> {row[args.metric]:.3f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
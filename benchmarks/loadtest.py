@@ -0,0 +1,532 @@
+"""Load test of the FastAPI app: replays multi-turn session traces at a given concurrency.
+
+    python -m benchmarks.loadtest generate --sessions 200 --output traces.jsonl
+    python -m benchmarks.loadtest run --traces traces.jsonl --concurrency 16 --workers 2
+    python -m benchmarks.loadtest record --url http://localhost:8080 --user-id alice --output traces.jsonl
+    python -m benchmarks.loadtest scale --traces traces.jsonl --workers 1 2 4 --output scale.json
+
+"run" serves benchmarks.loadtest_server with uvicorn: main.py's app with a
+stub LLM in every agent and synthetic data in mongomock, so no Gemini, Atlas
+or GCS is needed. The stub replays the function calls recorded in the traces, so every
+turn runs the same tools as the recorded one. With --url the traces are sent
+to a running server instead, and nothing is started.
+
+Each trace line is one session:
+
+    {"session": "s1", "turns": [{"text": "...", "calls": [["tool", {args}], ...], "reply": "..."}]}
+
+"generate" writes traces for the synthetic data. "record" converts the
+sessions of one user on a running server into traces.
+
+The report shows:
+
+- turns/s;
+- per-turn latency percentiles;
+- errors, and turns whose tool calls differed from the trace;
+- peak and final RSS, PSS and USS of every server process, read from /proc (Linux only).
+
+"run --server prefork" starts serve.py's pre-fork workers instead of
+"uvicorn --workers". "scale" runs the replay at each --workers count with
+each server and compares throughput and per-worker memory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+APP_NAME = "manager"
+SERVERS = ("uvicorn", "prefork")
+SECTOR_AGENT = "CO2_Emission_analysis_sector_agent"
+COUNTRY_AGENT = "CO2_Emission_analysis_country_agent"
+
+
+def load_traces(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Multi-turn sessions over the synthetic data: reports, comparisons, trends,
+# rankings, charts, news, and small talk the agents answer without tools.
+def generate_traces(sessions: int, country_rows: int, seed: int = 0) -> list:
+    from benchmarks import synthetic
+
+    rng = random.Random(seed)
+    sectors = synthetic.SECTORS
+    countries = [f"Country {i:05d}" for i in range(country_rows)]
+
+    def sector(calls):
+        return [["transfer_to_agent", {"agent_name": SECTOR_AGENT}]] + calls
+
+    def country(calls):
+        return [["transfer_to_agent", {"agent_name": COUNTRY_AGENT}]] + calls
+
+    def turn():
+        s, s2 = rng.sample(sectors, 2)
+        c = rng.choice(countries)
+        choices = [
+            (f"Give me the emissions report for {s}", sector([["get_sector_report", {"sector_name": s}]])),
+            (f"Compare {s} and {s2}", sector([["compare_sectors", {"sector1": s, "sector2": s2}]])),
+            (f"How did {s} emissions change month over month?", sector([["get_sector_trend", {"sector_name": s}]])),
+            (f"Which {s} subsectors emit the most?", sector([["rank_subsectors", {"field": "2025_YTD", "limit": 10, "sector_name": s}]])),
+            (f"Plot {s} by subsector", sector([["get_graph_report", {"sector_name": s, "parameter": "2025_YTD"}]])),
+            ("Which sectors can I ask about?", sector([["get_sector_list", {}]])),
+            (f"What are the emissions of {c}?", country([["get_country_report", {"country": c}]])),
+            (f"Show me the monthly trend for {c}", country([["get_country_trend", {"country": c}], ["plot_emissions_trend", {"country": c}]])),
+            ("Top 10 countries by 2025 YTD emissions", country([["rank_countries", {"field": "2025_YTD", "limit": 10}]])),
+            ("Totals per continent", country([["continent_summary", {"sort_by": "2025_YTD"}]])),
+            (f"Find countries like {c.lower()}", country([["find_similar_countries", {"query": c.lower()}]])),
+            ("Any recent news about carbon taxes?", [["news_analyst", {"request": "recent news about carbon taxes"}]]),
+            ("Thanks, that's all", []),
+        ]
+        text, calls = rng.choice(choices)
+        return {"text": text, "calls": calls, "reply": f"Here is what I found for: {text}"}
+
+    return [{"session": f"s{i:05d}", "turns": [turn() for _ in range(rng.randint(2, 5))]} for i in range(sessions)]
+
+
+# Sessions of one user on a running server, as traces.
+def record_traces(url: str, user_id: str) -> list:
+    import httpx
+
+    traces = []
+    with httpx.Client(base_url=url, timeout=60) as client:
+        for listed in client.get(f"/apps/{APP_NAME}/users/{user_id}/sessions").json():
+            session = client.get(f"/apps/{APP_NAME}/users/{user_id}/sessions/{listed['id']}").json()
+            turns = []
+            for event in session.get("events", []):
+                parts = (event.get("content") or {}).get("parts") or []
+                if event.get("author") == "user":
+                    text = "".join(part.get("text") or "" for part in parts)
+                    if text:
+                        turns.append({"text": text, "calls": [], "reply": None})
+                    continue
+                if not turns:
+                    continue
+                for part in parts:
+                    call = part.get("functionCall") or part.get("function_call")
+                    if call:
+                        turns[-1]["calls"].append([call["name"], call.get("args") or {}])
+                    elif part.get("text"):
+                        turns[-1]["reply"] = part["text"]
+            if turns:
+                traces.append({"session": session["id"], "turns": turns})
+    return traces
+
+
+# (pid, depth) of a process and every process under it.
+def _descendants(pid: int) -> list:
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    found, pending = [], [(pid, 0)]
+    while pending:
+        current, depth = pending.pop()
+        found.append((current, depth))
+        pending.extend((child, depth + 1) for child in children.get(current, []))
+    return found
+
+
+# Resident, proportional and unique set size in MB. PSS splits pages shared
+# with other processes (copy-on-write after fork) between them, so it adds up
+# across processes where RSS does not. USS counts only private pages: what
+# the process would free on exit. RSS - USS is the part it shares.
+def _memory_mb(pid: int):
+    values = {}
+    fields = ("VmRSS:", "Pss:", "Private_Clean:", "Private_Dirty:")
+    for path in (f"/proc/{pid}/status", f"/proc/{pid}/smaps_rollup"):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(fields):
+                        values[line.split(":")[0]] = int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    if "VmRSS" not in values:
+        return None
+    uss = values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0) if "Pss" in values else values["VmRSS"]
+    return values["VmRSS"], values.get("Pss", values["VmRSS"]), uss
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode(errors="replace")
+    except OSError:
+        return ""
+
+
+class MemorySampler:
+    """Peak and last RSS, PSS and USS of a process and its descendants, sampled in a thread."""
+
+    def __init__(self, pid: int, interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak = {}
+        self.last = {}
+        self.depth = {}
+        self.command = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            for pid, depth in _descendants(self.pid):
+                memory = _memory_mb(pid)
+                if memory is not None:
+                    self.depth[pid] = depth
+                    if pid not in self.command:
+                        self.command[pid] = _cmdline(pid)
+                    self.last[pid] = memory
+                    peak = self.peak.get(pid, (0.0, 0.0, 0.0))
+                    self.peak[pid] = tuple(max(old, new) for old, new in zip(peak, memory))
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        return {
+            pid: {
+                "depth": self.depth[pid],
+                "command": self.command[pid],
+                "peak_rss_mb": self.peak[pid][0],
+                "peak_pss_mb": self.peak[pid][1],
+                "peak_uss_mb": self.peak[pid][2],
+                "last_rss_mb": self.last[pid][0],
+                "last_pss_mb": self.last[pid][1],
+                "last_uss_mb": self.last[pid][2],
+            }
+            for pid in sorted(self.peak)
+        }
+
+
+# With one worker uvicorn serves from the process it was started in; with
+# more, that process only supervises the spawned workers. serve.py always
+# supervises, and its workers are forks one level below it. Processes below a
+# worker are the chart forkserver and the render workers it forks.
+def _role(command: str, depth: int, workers: int, server: str = "uvicorn") -> str:
+    if "resource_tracker" in command:
+        return "resource tracker"
+    if server == "prefork":
+        return ("supervisor", "worker")[depth] if depth < 2 else "chart render"
+    if depth == 0:
+        return "worker" if workers == 1 else "supervisor"
+    if depth == 1 and workers > 1 and "spawn_main" in command:
+        return "worker"
+    return "chart render"
+
+
+def _start_server(args, traces_path: str) -> subprocess.Popen:
+    import httpx
+
+    env = dict(os.environ)
+    env.update({
+        "LOADTEST_SECTOR_ROWS": str(args.sector_rows),
+        "LOADTEST_COUNTRY_ROWS": str(args.country_rows),
+        "LLM_STUB": "true",
+        "LLM_STUB_TRACES": os.path.abspath(traces_path),
+        "LLM_STUB_LATENCY_MS": str(args.llm_latency_ms),
+    })
+    # mongomock lives inside each worker, so the workers share sessions
+    # through a SQLite file of this run instead.
+    env.setdefault("SESSION_BACKEND", "sqlite")
+    env.setdefault("SESSION_SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="loadtest_"), "sessions.db"))
+    # A process group of its own, so stopping it also stops the uvicorn and
+    # chart render workers.
+    if args.server == "prefork":
+        command = [
+            sys.executable, "serve.py", "--app", "benchmarks.loadtest_server:app",
+            "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(args.workers),
+        ]
+    else:
+        command = [
+            sys.executable, "-m", "uvicorn", "benchmarks.loadtest_server:app",
+            "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning",
+        ]
+    process = subprocess.Popen(command, env=env, start_new_session=True)
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/readyz", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    _stop_server(process)
+    raise RuntimeError(f"server not ready after {args.startup_timeout}s")
+
+
+# Stops the server, then whatever is left in its group, such as chart render
+# workers that have not noticed their parent exit yet.
+def _stop_server(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def _called(events: list) -> list:
+    names = []
+    for event in events:
+        for part in (event.get("content") or {}).get("parts") or []:
+            call = part.get("functionCall") or part.get("function_call")
+            if call:
+                names.append(call["name"])
+    return names
+
+
+async def _session(client, trace: dict, user_id: str, think_ms: float, results: list) -> None:
+    response = await client.post(f"/apps/{APP_NAME}/users/{user_id}/sessions")
+    if response.status_code != 200:
+        results.append({"ok": False, "latency_ms": 0.0, "matched": False})
+        return
+    session_id = response.json()["id"]
+    for turn in trace["turns"]:
+        body = {
+            "app_name": APP_NAME,
+            "user_id": user_id,
+            "session_id": session_id,
+            "new_message": {"role": "user", "parts": [{"text": turn["text"]}]},
+        }
+        start = time.perf_counter()
+        try:
+            response = await client.post("/run", json=body)
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        latency = (time.perf_counter() - start) * 1000
+        expected = [name for name, _ in turn.get("calls", []) if name != "transfer_to_agent"]
+        called = [name for name in _called(response.json()) if name != "transfer_to_agent"] if ok else []
+        results.append({"ok": ok, "latency_ms": latency, "matched": ok and called == expected, "text": turn["text"], "expected": expected, "called": called})
+        if think_ms:
+            await asyncio.sleep(think_ms / 1000)
+
+
+async def _replay(url: str, traces: list, concurrency: int, loops: int, think_ms: float, timeout: float) -> tuple:
+    import httpx
+
+    results = []
+    queue = asyncio.Queue()
+    for loop in range(loops):
+        for trace in traces:
+            queue.put_nowait((loop, trace))
+
+    async def worker(client):
+        while not queue.empty():
+            loop, trace = queue.get_nowait()
+            await _session(client, trace, f"load-{loop}-{trace['session']}-{uuid.uuid4().hex[:6]}", think_ms, results)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def _percentile(samples: list, q: float) -> float:
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+
+def run(args) -> dict:
+    traces = load_traces(args.traces)
+    process = None if args.url else _start_server(args, args.traces)
+    url = args.url or f"http://127.0.0.1:{args.port}"
+    sampler = MemorySampler(process.pid) if process else None
+    try:
+        if sampler:
+            sampler.start()
+        results, elapsed = asyncio.run(_replay(url, traces, args.concurrency, args.loops, args.think_ms, args.timeout))
+    finally:
+        memory = sampler.stop() if sampler else {}
+        if process:
+            _stop_server(process)
+
+    latencies = sorted(r["latency_ms"] for r in results if r["ok"])
+    report = {
+        "sessions": len(traces) * args.loops,
+        "turns": len(results),
+        "errors": sum(1 for r in results if not r["ok"]),
+        "mismatched": sum(1 for r in results if r["ok"] and not r["matched"]),
+        "concurrency": args.concurrency,
+        "workers": None if args.url else args.workers,
+        "server": None if args.url else args.server,
+        "seconds": elapsed,
+        "turns_per_s": len(results) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": _percentile(latencies, 0.50),
+            "p90": _percentile(latencies, 0.90),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+            "mean": statistics.fmean(latencies) if latencies else 0.0,
+        },
+        # With ROUTER=on the router can answer a turn with other calls than
+        # the recorded ones; these are the first few.
+        "mismatch_examples": [
+            {key: r[key] for key in ("text", "expected", "called")}
+            for r in results if r["ok"] and not r["matched"]
+        ][:5],
+        "memory": [
+            {"pid": pid, "role": _role(values.pop("command"), values.pop("depth"), args.workers, args.server), **values}
+            for pid, values in memory.items()
+        ],
+    }
+    return report
+
+
+def _print_report(report: dict) -> None:
+    latency = report["latency_ms"]
+    print(
+        f"{report['turns']} turns in {report['sessions']} sessions, concurrency {report['concurrency']}, "
+        f"workers {report['workers'] or '-'} ({report['server'] or 'external'})"
+    )
+    print(f"{report['turns_per_s']:.1f} turns/s over {report['seconds']:.1f}s, {report['errors']} errors, {report['mismatched']} turns with other tool calls than the trace")
+    print(f"latency ms: p50 {latency['p50']:.1f}  p90 {latency['p90']:.1f}  p95 {latency['p95']:.1f}  p99 {latency['p99']:.1f}  max {latency['max']:.1f}")
+    for example in report["mismatch_examples"]:
+        print(f"  {example['text']!r}: expected {example['expected']}, called {example['called']}")
+    for process in report["memory"]:
+        print(
+            f"{process['role']:<17}{process['pid']:>8}  peak RSS {process['peak_rss_mb']:>7.1f} MB  PSS {process['peak_pss_mb']:>7.1f} MB"
+            f"  last RSS {process['last_rss_mb']:>7.1f} MB  PSS {process['last_pss_mb']:>7.1f} MB  USS {process['last_uss_mb']:>7.1f} MB"
+        )
+
+
+# Throughput and per-worker memory of the two servers at each worker count.
+# Speedup is relative to the same server's smallest worker count.
+def run_scaling(args) -> dict:
+    rows = []
+    reports = []
+    for server in args.servers:
+        baseline = None
+        for workers in sorted(args.workers):
+            run_args = argparse.Namespace(**vars(args))
+            run_args.url = None
+            run_args.server = server
+            run_args.workers = workers
+            report = run(run_args)
+            reports.append(report)
+            worker_memory = [p for p in report["memory"] if p["role"] == "worker"]
+            mean = lambda key: statistics.fmean(p[key] for p in worker_memory) if worker_memory else 0.0
+            baseline = baseline or report["turns_per_s"]
+            rows.append({
+                "server": server,
+                "workers": workers,
+                "turns_per_s": report["turns_per_s"],
+                "speedup": report["turns_per_s"] / baseline if baseline else 0.0,
+                "p50_ms": report["latency_ms"]["p50"],
+                "errors": report["errors"],
+                "total_pss_mb": sum(p["last_pss_mb"] for p in report["memory"]),
+                "worker_rss_mb": mean("last_rss_mb"),
+                "worker_pss_mb": mean("last_pss_mb"),
+                "worker_uss_mb": mean("last_uss_mb"),
+                "worker_shared_mb": mean("last_rss_mb") - mean("last_uss_mb"),
+            })
+    return {"rows": rows, "reports": reports}
+
+
+def _print_scaling(report: dict) -> None:
+    print(
+        f"{'server':<9}{'workers':>8}{'turns/s':>9}{'speedup':>9}{'p50 ms':>9}{'errors':>7}"
+        f"{'total PSS':>11}{'worker RSS':>12}{'PSS':>8}{'USS':>8}{'shared':>8}"
+    )
+    for row in report["rows"]:
+        print(
+            f"{row['server']:<9}{row['workers']:>8}{row['turns_per_s']:>9.1f}{row['speedup']:>8.2f}x{row['p50_ms']:>9.1f}{row['errors']:>7}"
+            f"{row['total_pss_mb']:>11.1f}{row['worker_rss_mb']:>12.1f}{row['worker_pss_mb']:>8.1f}{row['worker_uss_mb']:>8.1f}{row['worker_shared_mb']:>8.1f}"
+        )
+    print("memory in MB; total PSS covers every server process, worker columns are means per worker")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write synthetic session traces")
+    generate.add_argument("--sessions", type=int, default=200)
+    generate.add_argument("--country-rows", type=int, default=200, help="countries in the data the traces will run against")
+    generate.add_argument("--seed", type=int, default=0)
+    generate.add_argument("--output", required=True)
+
+    record = commands.add_parser("record", help="convert a user's sessions on a running server into traces")
+    record.add_argument("--url", required=True)
+    record.add_argument("--user-id", required=True)
+    record.add_argument("--output", required=True)
+
+    replay_options = argparse.ArgumentParser(add_help=False)
+    replay_options.add_argument("--traces", required=True)
+    replay_options.add_argument("--concurrency", type=int, default=8, help="sessions in flight")
+    replay_options.add_argument("--loops", type=int, default=1, help="times to replay the trace file")
+    replay_options.add_argument("--think-ms", type=float, default=0.0, help="pause between the turns of a session")
+    replay_options.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    replay_options.add_argument("--port", type=int, default=8765)
+    replay_options.add_argument("--sector-rows", type=int, default=5000)
+    replay_options.add_argument("--country-rows", type=int, default=200)
+    replay_options.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated model latency per LLM call")
+    replay_options.add_argument("--startup-timeout", type=float, default=300.0)
+    replay_options.add_argument("--output", default=None, help="write the report as JSON to this path")
+
+    replay = commands.add_parser("run", parents=[replay_options], help="replay traces against the stub server or --url")
+    replay.add_argument("--url", default=None, help="send the traces to this server instead of starting one")
+    replay.add_argument("--workers", type=int, default=1, help="workers of the started server")
+    replay.add_argument("--server", choices=SERVERS, default="uvicorn", help="uvicorn --workers, or serve.py's pre-fork workers")
+
+    scale = commands.add_parser("scale", parents=[replay_options], help="run at each worker count with each server")
+    scale.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    scale.add_argument("--servers", choices=SERVERS, nargs="+", default=list(SERVERS))
+    args = parser.parse_args()
+
+    if args.command == "scale":
+        report = run_scaling(args)
+        _print_scaling(report)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        return
+
+    if args.command == "generate":
+        traces = generate_traces(args.sessions, args.country_rows, args.seed)
+    elif args.command == "record":
+        traces = record_traces(args.url, args.user_id)
+    else:
+        report = run(args)
+        _print_report(report)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        return
+
+    with open(args.output, "w") as f:
+        for trace in traces:
+            f.write(json.dumps(trace) + "\n")
+    print(f"{len(traces)} sessions, {sum(len(t['turns']) for t in traces)} turns written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
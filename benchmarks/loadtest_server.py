@@ -0,0 +1,30 @@
+"""The main.py app on synthetic data with the stub LLM, for benchmarks.loadtest.
+
+    python -m uvicorn benchmarks.loadtest_server:app --workers 2
+
+Every uvicorn worker imports this module, so each worker builds its own
+in-process mongomock store before it starts serving. The sizes come from
+LOADTEST_SECTOR_ROWS and LOADTEST_COUNTRY_ROWS. Chart images go to a local
+directory and similarity lookups use the local vector index. The stub LLM
+takes its scripts from LLM_STUB_TRACES. Sessions go to the SQLite file in
+SESSION_SQLITE_PATH, which all workers share. The answer cache is off so
+every turn runs its trace; set ANSWER_CACHE=true to measure it.
+"""
+import os
+
+os.environ.setdefault("MONGO_URI", "mongomock://localhost")
+os.environ.setdefault("VECTOR_BACKEND", "local")
+os.environ.setdefault("BLOB_BACKEND", "local")
+os.environ.setdefault("LLM_STUB", "true")
+os.environ.setdefault("MODEL_WARMUP", "eager")
+os.environ.setdefault("SESSION_BACKEND", "sqlite")
+os.environ.setdefault("ANSWER_CACHE", "false")
+
+SECTOR_ROWS = int(os.environ.get("LOADTEST_SECTOR_ROWS", "5000"))
+COUNTRY_ROWS = int(os.environ.get("LOADTEST_COUNTRY_ROWS", "200"))
+
+from benchmarks import synthetic  # noqa: E402
+
+synthetic.build_dataset(SECTOR_ROWS, COUNTRY_ROWS)
+
+from main import app  # noqa: E402,F401
@@ -0,0 +1,123 @@
+import random
+import time
+
+SECTORS = [
+    "Power",
+    "Industry",
+    "Ground Transport",
+    "Residential",
+    "Domestic Aviation",
+    "International Aviation",
+    "International Shipping",
+    "Agriculture",
+    "Waste",
+    "Fossil Fuel Operations",
+]
+CONTINENTS = ["Africa", "Asia", "Europe", "North America", "Oceania", "South America"]
+NUMERIC_FIELDS = [
+    "Mar_2025_Total",
+    "Prev_Month",
+    "Mar_2024_Total",
+    "Monthly_%_change",
+    "2025_YTD",
+    "2024_YTD",
+    "2023_YTD",
+    "2022_YTD",
+    "2021_YTD",
+]
+
+
+def _numbers(rng: random.Random) -> dict:
+    base = rng.uniform(10, 10000)
+    values = {
+        "Mar_2025_Total": round(base, 3),
+        "Prev_Month": round(base * rng.uniform(0.8, 1.2), 3),
+        "Mar_2024_Total": round(base * rng.uniform(0.8, 1.2), 3),
+    }
+    values["Monthly_%_change"] = round((values["Mar_2025_Total"] / values["Prev_Month"] - 1) * 100, 3)
+    for year in range(2021, 2026):
+        values[f"{year}_YTD"] = round(base * 3 * rng.uniform(0.7, 1.3), 3)
+    return values
+
+
+# Sector documents shaped like Emission_data_feb: n_rows rows spread over the
+# sectors above, each with its own numbered subsectors.
+def sector_documents(n_rows: int, subsectors_per_sector: int = 25, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_rows):
+        sector = SECTORS[i % len(SECTORS)]
+        doc = {
+            "Sector_name": sector,
+            "Sector_name_norm": sector.lower(),
+            "Subsector_Name": f"{sector} subsector {rng.randrange(subsectors_per_sector)}",
+        }
+        doc.update(_numbers(rng))
+        docs.append(doc)
+    return docs
+
+
+# Country documents shaped like Emission_data_feb_country.
+def country_documents(n_rows: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_rows):
+        doc = {
+            "Continent": CONTINENTS[i % len(CONTINENTS)],
+            "Country": f"Country {i:05d}",
+        }
+        doc.update(_numbers(rng))
+        docs.append(doc)
+    return docs
+
+
+def load_into(database, sector_collection: str, country_collection: str, n_sector_rows: int, n_country_rows: int) -> None:
+    database[sector_collection].drop()
+    database[country_collection].drop()
+    database[sector_collection].insert_many(sector_documents(n_sector_rows))
+    database[country_collection].insert_many(country_documents(n_country_rows))
+
+
+# Sets doc["embedding"] on documents not yet inserted, encoding each distinct
+# text once. Much faster than embed_collection for large row counts, where
+# the texts repeat.
+def attach_embeddings(docs: list, text_field: str, encode, batch_size: int = 256) -> list:
+    texts = list(dict.fromkeys(doc[text_field] for doc in docs))
+    vectors = {}
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        for text, vector in zip(batch, encode(batch)):
+            vectors[text] = [float(x) for x in vector]
+    for doc in docs:
+        doc["embedding"] = vectors[doc[text_field]]
+    return docs
+
+
+# Stores encode(doc[text_field]) as the embedding of every document, batched.
+def embed_collection(collection, text_field: str, encode, batch_size: int = 256) -> None:
+    docs = list(collection.find({}, {text_field: 1}))
+    for start in range(0, len(docs), batch_size):
+        batch = docs[start:start + batch_size]
+        vectors = encode([doc[text_field] for doc in batch])
+        for doc, vector in zip(batch, vectors):
+            collection.update_one({"_id": doc["_id"]}, {"$set": {"embedding": [float(x) for x in vector]}})
+
+
+# Loads size sector rows and country_rows country rows with embeddings, then
+# runs the same steps as a real load: indexes, a published dataset version,
+# the time series and the rollups. Returns the seconds taken.
+def build_dataset(size: int, country_rows: int) -> float:
+    from manager.common import dataset, db, models, rollups, timeseries, vector_index
+
+    start = time.perf_counter()
+    database = db.get_database()
+    for name in (db.SECTOR_COLLECTION, db.COUNTRY_COLLECTION, timeseries.TIMESERIES_COLLECTION):
+        database[name].drop()
+    database[db.SECTOR_COLLECTION].insert_many(attach_embeddings(sector_documents(size), "Subsector_Name", models.encode))
+    database[db.COUNTRY_COLLECTION].insert_many(attach_embeddings(country_documents(country_rows), "Country", models.encode))
+    db.ensure_indexes()
+    version = dataset.publish_version()
+    timeseries.load_from_wide(version=version)
+    rollups.rebuild(version)
+    vector_index.invalidate()
+    return time.perf_counter() - start
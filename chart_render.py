@@ -0,0 +1,41 @@
+"""Chart rendering for the render worker processes.
+
+manager.common.charts runs render_png in processes started with forkserver
+(spawn where that is unavailable). Unpickling the call imports this module
+in the worker, so it lives outside the manager package and imports nothing
+but matplotlib. Importing manager would load every agent and the encoder.
+"""
+import io
+
+# Plot styles shared by the sector and country charts. Changing one of these
+# changes every cache key that uses it.
+STYLES = {
+    "subsector_line": {"figsize": (20, 6), "xlabel": "Subsector", "ylabel": "CO2 Emissions", "grid": False},
+    "trend_line": {"figsize": (20, 6), "xlabel": "Year", "ylabel": "CO2 Emissions", "grid": True},
+    "monthly_line": {"figsize": (20, 6), "xlabel": "Month", "ylabel": "CO2 Emissions", "grid": True},
+}
+
+
+# Only the spec's plain fields cross the process boundary and PNG bytes come
+# back.
+def render_png(title: str, labels: list, values: list, style: str) -> bytes:
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    options = STYLES[style]
+    figure = Figure(figsize=options["figsize"])
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    positions = range(len(values))
+    axes.plot(positions, values)
+    axes.set_xticks(list(positions))
+    axes.set_xticklabels(labels, rotation=45, ha="right")
+    axes.set_title(title)
+    axes.set_xlabel(options["xlabel"])
+    axes.set_ylabel(options["ylabel"])
+    if options["grid"]:
+        axes.grid(True)
+    figure.tight_layout()
+    buf = io.BytesIO()
+    figure.savefig(buf, format="png")
+    return buf.getvalue()
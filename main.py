@@ -1,8 +1,18 @@
 import os
 
 import uvicorn
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
 from google.adk.cli.fast_api import get_fast_api_app
 
+from manager.common import charts, metrics, models, session_store, storage
+from manager.common.answer_cache import answer_cache
+from manager.common.embedding_cache import embedding_cache
+from manager.common.tool_cache import tool_cache
+from manager.common.resolver import resolver_stats
+from manager.common.router import router_stats
+from manager.common.tool_output import output_stats
+
 # Get the directory where main.py is located
 AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
 print(f"Agent directory: {AGENT_DIR}")
@@ -11,15 +21,86 @@ ALLOWED_ORIGINS = ["http://localhost", "http://localhost:8000", "*"]
 # Set web=True if you intend to serve a web interface, False otherwise
 SERVE_WEB_INTERFACE = True
 
+# Load the embedding model off the request path. The server starts accepting
+# connections immediately and /readyz reports when the model is available.
+if models.MODEL_WARMUP == "eager":
+    models.get_encoder()
+elif models.MODEL_WARMUP == "background":
+    models.start_warmup()
+
 # Call the function to get the FastAPI app instance
 # Ensure the agent directory name ('capital_agent') matches your agent folder
 app = get_fast_api_app(
     agents_dir=AGENT_DIR,
     allow_origins=ALLOWED_ORIGINS,
     web=SERVE_WEB_INTERFACE,
+    # SESSION_BACKEND=mongo or sqlite keeps sessions where any worker can
+    # serve any conversation; the default (local) keeps ADK's per-agent store.
+    session_service_uri=session_store.service_uri(),
 )
 
 
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    status = models.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "tools": tool_cache.stats(),
+        "embeddings": embedding_cache.stats(),
+        "charts": charts.chart_cache.stats(),
+        "answers": answer_cache.stats(),
+    }
+
+
+# Size of the tool results sent back to the model, per tool.
+@app.get("/tools/output-stats")
+def tool_output_stats():
+    return output_stats.stats()
+
+
+# Prometheus text exposition of the tool, MongoDB, encode, render and upload
+# timings and the cache counters.
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Event batching and compression of the session store.
+@app.get("/sessions/stats")
+def session_store_stats():
+    service = session_store.get_service()
+    return service.stats() if service is not None else {"backend": "local"}
+
+
+# Fast-path routing decisions, latency, and agreement with the LLM in shadow mode.
+@app.get("/router/stats")
+def router_stats_view():
+    return router_stats.stats()
+
+
+# Name lookups by how they matched (exact, alias, fused, unresolved) and their
+# mean latency.
+@app.get("/resolver/stats")
+def resolver_stats_view():
+    return resolver_stats.stats()
+
+
+# With the local blob backend, chart images are written to LOCAL_BLOB_DIR and
+# served by this app.
+if storage.BLOB_BACKEND == "local":
+    os.makedirs(storage.LOCAL_BLOB_DIR, exist_ok=True)
+    app.mount(storage.LOCAL_BLOB_URL_PATH, StaticFiles(directory=storage.LOCAL_BLOB_DIR), name="blobs")
+
+
 if __name__ == "__main__":
     # Use the PORT environment variable provided by Cloud Run, defaulting to 8080
     uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
\ No newline at end of file
@@ -1,10 +1,13 @@
 from google.adk.agents import Agent
+from google.adk.apps import App
 from google.adk.tools.agent_tool import AgentTool
 
 from .sub_agents.analysis_sector_agent.agent import analysis_sector_agent
 from .sub_agents.analysis_country_agent.agent import analysis_country_agent
 from .sub_agents.news_analyst.agent import news_analyst
 
+from .common import answer_cache, router, stub_llm, tool_output
+
 from dotenv import load_dotenv
 load_dotenv()
 import os
@@ -34,4 +37,17 @@ root_agent = Agent(
         AgentTool(news_analyst)
         
     ],
+    before_model_callback=router.route_manager_request,
+    after_model_callback=router.record_manager_choice,
+    after_tool_callback=tool_output.record_tool_output,
+)
+# Load tests replace Gemini in every agent with a scripted local stub.
+if stub_llm.LLM_STUB:
+    stub_llm.install(root_agent)
+
+# The app the ADK server runs: root_agent behind the answer cache.
+app = App(
+    name="manager",
+    root_agent=root_agent,
+    plugins=[answer_cache.AnswerCachePlugin(root_agent.name)],
 )
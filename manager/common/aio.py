@@ -0,0 +1,67 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+
+# Serve the analysis agents with their coroutine tool implementations so
+# blocking work does not stall the uvicorn event loop.
+ASYNC_TOOLS = os.environ.get("ASYNC_TOOLS", "false").lower() in ("1", "true", "yes", "on")
+
+# Thread pools for the blocking parts of the async tools. model.encode and
+# NumPy release the GIL for most of their work, so a few encode threads do run
+# in parallel.
+ENCODE_WORKERS = int(os.environ.get("ENCODE_WORKERS", "2"))
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "16"))
+# Maximum number of concurrent calls of any single async tool per process.
+TOOL_CONCURRENCY = int(os.environ.get("TOOL_CONCURRENCY", "8"))
+
+_executors = {}
+
+
+def get_executor(kind: str) -> ThreadPoolExecutor:
+    executor = _executors.get(kind)
+    if executor is None:
+        workers = {"encode": ENCODE_WORKERS, "io": IO_WORKERS}[kind]
+        executor = _executors.setdefault(kind, ThreadPoolExecutor(max_workers=workers, thread_name_prefix=kind))
+    return executor
+
+
+# The caller's context variables (e.g. the current trace span) carry over to
+# the worker thread.
+async def run_blocking(kind: str, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(kind), functools.partial(context.run, fn, *args, **kwargs))
+
+
+# Caps the number of in-flight calls of the decorated coroutine function. One
+# semaphore is kept per event loop, since asyncio primitives are loop-bound.
+def limit_concurrency(limit: int = None):
+    def decorator(fn):
+        semaphores = {}
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            semaphore = semaphores.get(loop)
+            if semaphore is None:
+                semaphore = semaphores.setdefault(loop, asyncio.Semaphore(limit or TOOL_CONCURRENCY))
+            async with semaphore:
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def shutdown() -> None:
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
+
+
+# Threads do not survive fork; a forked server worker starts its own pools.
+os.register_at_fork(after_in_child=_executors.clear)
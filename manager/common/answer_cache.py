@@ -0,0 +1,330 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from google.adk.plugins.base_plugin import BasePlugin
+
+from . import aio, dataset, metrics
+from .vector_index import normalize_rows
+
+# Answers whole turns from earlier answers to the same question, in front of
+# the manager: "emissions of India" and "India CO2 report" are one lookup
+# apart instead of a manager -> sub-agent -> tools -> LLM chain each.
+#
+# The request is embedded with the shared encoder after the router's entity
+# dictionary has replaced sector and country names with their kind, so the
+# similarity is between what is asked. A cached answer is only served when,
+# on top of the similarity threshold, the request has the same best router
+# intent, names the same entities and the same other terms (words that are
+# not known domain or filler words: years, limits, names the dictionary does
+# not know), and the answer was given for the same dataset version. Only the
+# first turn of a session is looked up or stored, because later turns can
+# depend on the conversation ("now compare with Industry"), which the key
+# does not hold. The cache is off by default, because a wrong hit serves one
+# user's answer to another. A hit is an in-memory matrix product; the encode
+# is usually an embedding cache hit and the dataset version is the cached one.
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE", "false").lower() in ("1", "true", "yes", "on")
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Minimum cosine similarity between the masked requests.
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.85"))
+# Turns that called one of these tools are not cached (their answers are not
+# derived from the dataset).
+ANSWER_CACHE_SKIP_TOOLS = [
+    name.strip() for name in os.environ.get("ANSWER_CACHE_SKIP_TOOLS", "news_analyst").split(",") if name.strip()
+]
+
+_WORD = re.compile(r"[\w'&.-]+")
+# Words a rephrased request can use without changing what it asks, on top of
+# the router's exemplars.
+KNOWN_WORDS = {
+    "sector", "subsector", "country", "co2", "carbon", "emission", "emissions", "emitted", "emit", "emits",
+    "report", "reports", "data", "figures", "numbers", "stats", "statistics", "summary", "overview",
+    "total", "totals", "level", "levels", "output", "pollution", "footprint",
+    "please", "me", "my", "the", "a", "an", "of", "for", "in", "on", "to", "and", "is", "are", "was", "by",
+    "from", "with", "what", "whats", "what's", "how", "show", "give", "get", "tell", "about", "can", "could",
+    "would", "you", "i", "we", "want", "need", "like", "see", "do", "does", "some", "any", "this", "that",
+}
+
+
+@dataclass
+class _Entry:
+    slot: int
+    text: str
+    version: str
+    agent: str
+    intent: str
+    entities: frozenset
+    terms: frozenset
+    answer: str
+    cost_seconds: float
+    created: float
+    hits: int = 0
+
+
+class AnswerCache:
+    """Bounded LRU of turn answers, looked up by cosine similarity.
+
+    Vectors live in one preallocated matrix with a row per slot, so a lookup
+    is a single matrix-vector product. Entries of another dataset version are
+    dropped as soon as a lookup or store sees the new one.
+    """
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._slots = [None] * max_size
+        self._free = list(range(max_size - 1, -1, -1))
+        self._vectors = None
+        self._version = None
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+        self.lookup_seconds = 0.0
+
+    def _remove(self, entry: _Entry) -> None:
+        del self._entries[entry.slot]
+        self._slots[entry.slot] = None
+        self._vectors[entry.slot] = 0.0
+        self._free.append(entry.slot)
+
+    def _check_version(self, version: str) -> None:
+        if version != self._version:
+            self.invalidations += len(self._entries)
+            for entry in list(self._entries.values()):
+                self._remove(entry)
+            self._version = version
+
+    # The best entry above the threshold that passes every check, or None.
+    def lookup(self, version: str, vector, intent: str, entities: frozenset, terms: frozenset) -> Optional[_Entry]:
+        start = time.perf_counter()
+        with self._lock:
+            self.lookups += 1
+            self._check_version(version)
+            found = None
+            if self._entries:
+                scores = self._vectors @ normalize_rows(vector)[0]
+                candidates = np.flatnonzero(scores >= self.threshold)
+                now = time.monotonic()
+                for slot in candidates[np.argsort(-scores[candidates])]:
+                    entry = self._slots[slot]
+                    if entry is None:
+                        continue
+                    if entry.intent != intent or entry.entities != entities or entry.terms != terms:
+                        continue
+                    if now - entry.created > self.ttl_seconds:
+                        self._remove(entry)
+                        self.expirations += 1
+                        continue
+                    found = entry
+                    break
+            seconds = time.perf_counter() - start
+            self.lookup_seconds += seconds
+            if found is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(found.slot)
+            found.hits += 1
+            self.hits += 1
+            self.saved_seconds += max(0.0, found.cost_seconds - seconds)
+            return found
+
+    def store(self, version: str, vector, text: str, agent: str, intent: str, entities: frozenset,
+              terms: frozenset, answer: str, cost_seconds: float) -> None:
+        vector = normalize_rows(vector)[0]
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, len(vector)), dtype=np.float32)
+            if not self._free:
+                self._remove(next(iter(self._entries.values())))
+                self.evictions += 1
+            slot = self._free.pop()
+            entry = _Entry(slot, text, version, agent, intent, entities, terms, answer, cost_seconds, time.monotonic())
+            self._slots[slot] = entry
+            self._vectors[slot] = vector
+            self._entries[slot] = entry
+            self.stores += 1
+
+    def record_skip(self) -> None:
+        with self._lock:
+            self.skipped += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / self.lookups if self.lookups else 0.0,
+                "skipped": self.skipped,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "saved_seconds": self.saved_seconds,
+                "lookup_mean_us": self.lookup_seconds / self.lookups * 1e6 if self.lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in list(self._entries.values()):
+                self._remove(entry)
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+
+answer_cache = AnswerCache()
+os.register_at_fork(after_in_child=answer_cache._reset_after_fork)
+metrics.registry.register_stats(
+    "answer_cache", "Semantic cache of turn answers.", answer_cache.stats,
+    counters=("lookups", "hits", "misses", "skipped", "stores", "evictions", "expirations", "invalidations", "saved_seconds"),
+)
+
+
+def _text(content) -> str:
+    if content is None or not content.parts:
+        return ""
+    return " ".join(part.text for part in content.parts if part.text).strip()
+
+
+_vocabulary = None
+
+
+# KNOWN_WORDS and the words of the router's exemplars.
+def _known_words(router) -> frozenset:
+    global _vocabulary
+    if _vocabulary is None:
+        words = set(KNOWN_WORDS)
+        for intent in router.intents:
+            for exemplar in intent.exemplars:
+                words.update(word.strip(".-'") for word in _WORD.findall(exemplar.lower()))
+        _vocabulary = frozenset(word for word in words if not word.isdigit())
+    return _vocabulary
+
+
+# The masked request's vector, its best router intent, its entities and its
+# other terms.
+def describe(text: str) -> tuple:
+    from .router import router
+
+    vector, entities, masked = router.embed(text)
+    intent = router.intents[int(np.argmax(router.score_vector(vector)))].name
+    return vector, intent, frozenset(entities), terms(masked, router)
+
+
+# Words of a masked request that are neither known words nor entity kinds:
+# numbers, and names the entity dictionary does not have.
+def terms(masked: str, router) -> frozenset:
+    words = (word.strip(".-'") for word in _WORD.findall(masked.lower()))
+    return frozenset(word for word in words if word) - _known_words(router)
+
+
+class _Turn:
+    def __init__(self, text: str, version: str, vector, intent: str, entities: frozenset, terms: frozenset):
+        self.text = text
+        self.version = version
+        self.vector = vector
+        self.intent = intent
+        self.entities = entities
+        self.terms = terms
+        self.started = time.perf_counter()
+        self.hit = None
+        self.answer = None
+        self.agent = None
+        self.cacheable = True
+
+
+class AnswerCachePlugin(BasePlugin):
+    """Serves cached answers before the turn's first agent runs and records new ones."""
+
+    def __init__(self, root_agent_name: str, cache: AnswerCache = answer_cache):
+        super().__init__(name="answer_cache")
+        self.root_agent_name = root_agent_name
+        self.cache = cache
+        # Turns in flight by invocation id. A turn that fails never reaches
+        # after_run, so the oldest are dropped past a bound.
+        self._turns = OrderedDict()
+
+    def _remember(self, invocation_id: str, turn: _Turn) -> None:
+        self._turns[invocation_id] = turn
+        while len(self._turns) > 1000:
+            self._turns.popitem(last=False)
+
+    async def before_run_callback(self, *, invocation_context):
+        agent = invocation_context.agent
+        # Plugins are inherited by AgentTool runs (news_analyst); only turns of
+        # this app's root are cached.
+        if not ANSWER_CACHE_ENABLED or agent is None or agent.root_agent.name != self.root_agent_name:
+            return None
+        text = _text(invocation_context.user_content)
+        if not text:
+            return None
+        # The user's message is already in the session: any other one makes
+        # this a follow-up.
+        if sum(1 for event in invocation_context.session.events if event.author == "user") > 1:
+            self.cache.record_skip()
+            return None
+        vector, intent, entities, words = await aio.run_blocking("encode", describe, text)
+        version = dataset.peek_version() or await aio.run_blocking("io", dataset.current_version)
+        turn = _Turn(text, version, vector, intent, entities, words)
+        turn.hit = self.cache.lookup(version, vector, intent, entities, words)
+        self._remember(invocation_context.invocation_id, turn)
+        return None
+
+    # The hit is returned by the first agent of the turn, which ends the
+    # invocation without a model call.
+    async def before_agent_callback(self, *, agent, callback_context):
+        turn = self._turns.get(callback_context.invocation_id)
+        if turn is None or turn.hit is None:
+            return None
+        del self._turns[callback_context.invocation_id]
+        from google.genai import types
+
+        return types.Content(role="model", parts=[types.Part(text=turn.hit.answer)])
+
+    async def on_event_callback(self, *, invocation_context, event):
+        turn = self._turns.get(invocation_context.invocation_id)
+        if turn is None or event.partial:
+            return None
+        if event.error_code:
+            turn.cacheable = False
+        for call in event.get_function_calls():
+            if call.name in ANSWER_CACHE_SKIP_TOOLS:
+                turn.cacheable = False
+        if event.author != "user" and event.is_final_response() and not event.get_function_responses():
+            text = _text(event.content)
+            if text:
+                turn.answer, turn.agent = text, event.author
+        return None
+
+    async def after_run_callback(self, *, invocation_context):
+        turn = self._turns.pop(invocation_context.invocation_id, None)
+        if turn is None or turn.hit is not None or not turn.cacheable or not turn.answer:
+            return None
+        self.cache.store(turn.version, turn.vector, turn.text, turn.agent, turn.intent, turn.entities, turn.terms,
+                         turn.answer, time.perf_counter() - turn.started)
+        return None
@@ -0,0 +1,114 @@
+import asyncio
+import os
+
+import pymongo
+
+from . import aio, db, metrics, vector_index
+
+
+# Async counterparts of the query helpers in db.py, backed by pymongo's native
+# AsyncMongoClient and sharing db.py's pool settings. mongomock has no async
+# API, so with a mongomock:// URI the sync helpers run on the IO thread pool.
+_clients = {}
+
+
+def _use_sync_fallback() -> bool:
+    return bool(db.MONGO_URI) and db.MONGO_URI.startswith(db.MOCK_URI_PREFIX)
+
+
+# AsyncMongoClient is bound to the event loop it is first used on.
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = pymongo.AsyncMongoClient(
+            db.MONGO_URI,
+            maxPoolSize=db.MONGO_MAX_POOL_SIZE,
+            minPoolSize=db.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=db.MONGO_MAX_IDLE_TIME_MS,
+            connectTimeoutMS=db.MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=db.MONGO_SOCKET_TIMEOUT_MS,
+            serverSelectionTimeoutMS=db.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            readPreference=db.MONGO_READ_PREFERENCE,
+            appname="co2-emission-agents",
+            event_listeners=metrics.mongo_listeners(),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_async_clients() -> None:
+    for client in list(_clients.values()):
+        await client.close()
+    _clients.clear()
+
+
+os.register_at_fork(after_in_child=_clients.clear)
+
+
+def _database():
+    return get_async_client()[db.MONGO_DB_NAME]
+
+
+async def _aggregate(collection_name: str, pipeline: list) -> list:
+    cursor = await _database()[collection_name].aggregate(pipeline)
+    return await cursor.to_list(None)
+
+
+async def distinct_sectors() -> list:
+    if _use_sync_fallback():
+        return await aio.run_blocking("io", db.distinct_sectors)
+    return await _database()[db.SECTOR_COLLECTION].distinct("Sector_name")
+
+
+async def distinct_countries() -> list:
+    if _use_sync_fallback():
+        return await aio.run_blocking("io", db.distinct_countries)
+    return await _database()[db.COUNTRY_COLLECTION].distinct("Country")
+
+
+async def find_sector_rows(sector_name: str, fields: list = db.SECTOR_FIELDS) -> list:
+    if _use_sync_fallback():
+        return await aio.run_blocking("io", db.find_sector_rows, sector_name, fields)
+    return await _aggregate(db.SECTOR_COLLECTION, [
+        {"$match": {db.SECTOR_NAME_KEY: db.normalize_name(sector_name)}},
+        {"$project": db.projection(fields)},
+    ])
+
+
+async def find_country_rows(country: str, fields: list = db.COUNTRY_FIELDS) -> list:
+    if _use_sync_fallback():
+        return await aio.run_blocking("io", db.find_country_rows, country, fields)
+    return await _database()[db.COUNTRY_COLLECTION].find({"Country": country}, db.projection(fields)).limit(1).to_list(None)
+
+
+async def _vector_search(collection_name: str, index: str, query_vector: list, num_candidates: int, limit: int, fields: list) -> list:
+    return await _aggregate(collection_name, [
+        {
+            "$vectorSearch": {
+                "index": index,
+                "path": "embedding",
+                "queryVector": query_vector,
+                "numCandidates": num_candidates,
+                "limit": limit,
+            }
+        },
+        {"$project": db.projection(fields)},
+    ])
+
+
+# The local vector backend is a matrix product once its index is built, but
+# the first call (and the first after a new load) builds it from the
+# database, so it runs on the IO pool like the other sync helpers.
+async def vector_search_sectors(query_vector: list, num_candidates: int = 100, limit: int = 20,
+                                fields: list = db.SECTOR_FIELDS) -> list:
+    if vector_index.use_local_backend() or _use_sync_fallback():
+        return await aio.run_blocking("io", db.vector_search_sectors, query_vector, num_candidates, limit, fields)
+    return await _vector_search(db.SECTOR_COLLECTION, "vector_index", query_vector, num_candidates, limit, fields)
+
+
+async def vector_search_countries(query_vector: list, num_candidates: int = 10, limit: int = 1,
+                                  fields: list = db.COUNTRY_FIELDS) -> list:
+    if vector_index.use_local_backend() or _use_sync_fallback():
+        return await aio.run_blocking("io", db.vector_search_countries, query_vector, num_candidates, limit, fields)
+    return await _vector_search(db.COUNTRY_COLLECTION, "vector_index_country", query_vector, num_candidates, limit, fields)
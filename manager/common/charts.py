@@ -0,0 +1,173 @@
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from chart_render import STYLES, render_png
+
+from . import metrics, storage
+
+# Charts are rendered with matplotlib's object-oriented Agg API in a pool of
+# worker processes, so no pyplot global state is shared and a slow render never
+# holds the GIL of the serving process. 0 renders in-process.
+CHART_WORKERS = int(os.environ.get("CHART_WORKERS", "2"))
+CHART_CACHE_SIZE = int(os.environ.get("CHART_CACHE_SIZE", "1024"))
+# Longest a caller waits for a render, queueing for a worker included.
+CHART_RENDER_TIMEOUT_SECONDS = float(os.environ.get("CHART_RENDER_TIMEOUT_SECONDS", "30"))
+CHART_STYLE_VERSION = "1"
+
+
+class ChartSpec:
+    """Everything that determines a chart's pixels."""
+
+    def __init__(self, entity: str, parameter: str, labels: list, values: list, title: str, style: str):
+        self.entity = entity
+        self.parameter = parameter
+        self.labels = [str(label) for label in labels]
+        self.values = [float(value) for value in values]
+        self.title = title
+        self.style = style
+
+    def cache_key(self) -> str:
+        payload = json.dumps(
+            [CHART_STYLE_VERSION, self.entity, self.parameter, self.labels, self.values, self.title, self.style, STYLES[self.style]],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ChartCache:
+    """Maps a chart's content hash to the URL it was uploaded to."""
+
+    def __init__(self, max_size: int = CHART_CACHE_SIZE):
+        self.max_size = max_size
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            url = self._urls.get(key)
+            if url is None:
+                self.misses += 1
+                return None
+            self._urls.move_to_end(key)
+            self.hits += 1
+            return url
+
+    def put(self, key: str, url: str) -> None:
+        with self._lock:
+            self._urls[key] = url
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.max_size:
+                self._urls.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._urls), "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._urls.clear()
+
+
+chart_cache = ChartCache()
+metrics.registry.register_stats("chart_cache", "Rendered chart URL cache.", chart_cache.stats, counters=("hits", "misses"))
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Forking this process while one of its threads (encoder,
+                # warm-up, uploads, executors, watchers) holds a lock can
+                # deadlock the child. Workers are forked from a fresh
+                # forkserver instead, which has imported only chart_render.
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    context.set_forkserver_preload(["chart_render"])
+                else:
+                    context = multiprocessing.get_context("spawn")
+                _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=context)
+    return _pool
+
+
+def submit_render(spec: ChartSpec):
+    args = (spec.title, spec.labels, spec.values, spec.style)
+    if CHART_WORKERS <= 0:
+        from concurrent.futures import Future
+        future = Future()
+        with metrics.timer(metrics.RENDER_SECONDS, "chart.render", style=spec.style):
+            future.set_result(render_png(*args))
+        return future
+    start = time.perf_counter()
+    future = _get_pool().submit(render_png, *args)
+    future.add_done_callback(lambda _: metrics.RENDER_SECONDS.observe(time.perf_counter() - start, style=spec.style))
+    return future
+
+
+# Returns the URL of the chart described by spec. An identical chart that was
+# already rendered is served from the cache without rendering or uploading;
+# new charts are handed to the blob store, which names them by content hash.
+# The URL is only cached once its upload has succeeded, so a failed upload is
+# retried by the next request instead of being served from the cache. A render
+# that takes longer than CHART_RENDER_TIMEOUT_SECONDS raises RuntimeError.
+def chart_url(spec: ChartSpec) -> str:
+    key = spec.cache_key()
+    url = chart_cache.get(key)
+    if url is not None:
+        return url
+    future = submit_render(spec)
+    try:
+        image_data = future.result(timeout=CHART_RENDER_TIMEOUT_SECONDS)
+    except TimeoutError:
+        future.cancel()
+        raise RuntimeError(f"chart render timed out after {CHART_RENDER_TIMEOUT_SECONDS:g}s")
+    return storage.publish(image_data, "image/png", on_uploaded=lambda url: chart_cache.put(key, url))
+
+
+async def chart_url_async(spec: ChartSpec) -> str:
+    import asyncio
+    from . import aio
+    key = spec.cache_key()
+    url = chart_cache.get(key)
+    if url is not None:
+        return url
+    try:
+        image_data = await asyncio.wait_for(asyncio.wrap_future(submit_render(spec)), CHART_RENDER_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"chart render timed out after {CHART_RENDER_TIMEOUT_SECONDS:g}s")
+    return await aio.run_blocking(
+        "io", storage.publish, image_data, "image/png", on_uploaded=lambda url: chart_cache.put(key, url)
+    )
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# A pool created before a fork belongs to the parent; a forked server worker
+# starts its own render workers.
+def _reset_after_fork() -> None:
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,89 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import db
+
+# Identifies the data currently loaded in the emission collections. Caches
+# that hold derived answers tag their entries with it, so a new monthly load
+# makes them miss instead of serving the previous month.
+#
+# The version is derived from each collection's document count and newest _id.
+# A loader can also publish an explicit version to DATASET_META_COLLECTION,
+# which is combined with that fingerprint, not used instead of it: an in-place
+# edit published by the loader changes the version, and so does a manual load
+# or mongoimport that never publishes one. DATASET_VERSION pins it (e.g. for a
+# read-only replica).
+DATASET_VERSION = os.environ.get("DATASET_VERSION")
+DATASET_META_COLLECTION = os.environ.get("DATASET_META_COLLECTION", "dataset_meta")
+DATASET_VERSION_TTL_SECONDS = float(os.environ.get("DATASET_VERSION_TTL_SECONDS", "30"))
+
+_VERSION_ID = "version"
+
+_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_meta_collection():
+    return db.get_database()[DATASET_META_COLLECTION]
+
+
+def _probe() -> str:
+    parts = []
+    for collection in (db.get_sector_collection(), db.get_country_collection()):
+        newest = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        parts.append(f"{collection.name}:{collection.estimated_document_count()}:{newest['_id'] if newest else ''}")
+    fingerprint = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+    meta = get_meta_collection().find_one({"_id": _VERSION_ID})
+    if meta is not None and meta.get("version"):
+        return f"{meta['version']}-{fingerprint}"
+    return fingerprint
+
+
+# The cached version, or None when it is due to be checked again. Lets async
+# callers avoid a blocking probe on the event loop.
+def peek_version():
+    if DATASET_VERSION:
+        return DATASET_VERSION
+    if _version is not None and time.monotonic() - _checked_at < DATASET_VERSION_TTL_SECONDS:
+        return _version
+    return None
+
+
+def current_version() -> str:
+    global _version, _checked_at
+    version = peek_version()
+    if version is not None:
+        return version
+    with _lock:
+        version = peek_version()
+        if version is None:
+            version = _probe()
+            _version, _checked_at = version, time.monotonic()
+    return version
+
+
+# Forces the next current_version() call to re-read the database.
+def invalidate() -> None:
+    global _checked_at
+    _checked_at = 0.0
+
+
+# Called by a loader once a new load is complete. Returns the resulting
+# current_version(), which is what derived data (rollups, time series) must be
+# tagged with.
+def publish_version(version: str = None) -> str:
+    version = version or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    get_meta_collection().update_one(
+        {"_id": _VERSION_ID},
+        {"$set": {"version": version, "published_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    invalidate()
+    return current_version()
@@ -0,0 +1,389 @@
+import threading
+from typing import Optional, TypedDict
+
+import pymongo
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import metrics
+
+
+MONGO_URI = os.environ.get("MONGO_URI")
+MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "CO2_Emission_data")
+SECTOR_COLLECTION = os.environ.get("SECTOR_COLLECTION", "Emission_data_feb")
+COUNTRY_COLLECTION = os.environ.get("COUNTRY_COLLECTION", "Emission_data_feb_country")
+
+# Pool settings for the process-wide client. The defaults match pymongo's own
+# except for the server selection timeout, which is shortened so a missing
+# cluster fails a tool call quickly instead of hanging the turn for 30s.
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "primaryPreferred")
+
+# URIs starting with mongomock:// are served by an in-process mongomock client,
+# so the tools can run offline without Atlas.
+MOCK_URI_PREFIX = "mongomock://"
+
+# Lower-cased, whitespace-collapsed copy of Sector_name kept on every sector
+# document so exact lookups can use a regular index.
+SECTOR_NAME_KEY = "Sector_name_norm"
+
+SECTOR_FIELDS = [
+    "Sector_name",
+    "Subsector_Name",
+    "Mar_2025_Total",
+    "Prev_Month",
+    "Mar_2024_Total",
+    "Monthly_%_change",
+    "2025_YTD",
+    "2024_YTD",
+    "2023_YTD",
+    "2022_YTD",
+    "2021_YTD",
+]
+COUNTRY_FIELDS = [
+    "Continent",
+    "Country",
+    "Mar_2025_Total",
+    "Prev_Month",
+    "Mar_2024_Total",
+    "Monthly_%_change",
+    "2025_YTD",
+    "2024_YTD",
+    "2023_YTD",
+    "2022_YTD",
+    "2021_YTD",
+]
+
+# Column names such as "Monthly_%_change" are not identifiers, hence the
+# functional TypedDict syntax.
+SectorRecord = TypedDict("SectorRecord", {
+    "Sector_name": str,
+    "Subsector_Name": str,
+    "Mar_2025_Total": float,
+    "Prev_Month": float,
+    "Mar_2024_Total": float,
+    "Monthly_%_change": float,
+    "2025_YTD": float,
+    "2024_YTD": float,
+    "2023_YTD": float,
+    "2022_YTD": float,
+    "2021_YTD": float,
+}, total=False)
+CountryRecord = TypedDict("CountryRecord", {
+    "Continent": str,
+    "Country": str,
+    "Mar_2025_Total": float,
+    "Prev_Month": float,
+    "Mar_2024_Total": float,
+    "Monthly_%_change": float,
+    "2025_YTD": float,
+    "2024_YTD": float,
+    "2023_YTD": float,
+    "2022_YTD": float,
+    "2021_YTD": float,
+}, total=False)
+
+# Numeric columns the ranking tools can order by. Monthly_%_change is a rate,
+# so aggregates average it; every other column is summed.
+RANK_FIELDS = [
+    "Mar_2025_Total",
+    "Prev_Month",
+    "Mar_2024_Total",
+    "Monthly_%_change",
+    "2025_YTD",
+    "2024_YTD",
+    "2023_YTD",
+    "2022_YTD",
+    "2021_YTD",
+]
+MEAN_RANK_FIELDS = ["Monthly_%_change"]
+# Columns with a sort index on the country collection, globally and within a
+# continent. Ranking by other columns sorts in memory, which is cheap at one
+# document per country.
+RANK_INDEXED_FIELDS = ["Mar_2025_Total", "Monthly_%_change", "2025_YTD"]
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def projection(fields: list) -> dict:
+    proj = {"_id": 0}
+    for field in fields:
+        proj[field] = 1
+    return proj
+
+
+def _create_client(uri: Optional[str]):
+    if uri and uri.startswith(MOCK_URI_PREFIX):
+        import mongomock
+        return mongomock.MongoClient()
+    return pymongo.MongoClient(
+        uri,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        readPreference=MONGO_READ_PREFERENCE,
+        appname="co2-emission-agents",
+        event_listeners=metrics.mongo_listeners(),
+    )
+
+
+# Returns the shared client, creating it on first use. MongoClient is
+# thread-safe and pools its own connections, so one instance per process is
+# all the tools need.
+def get_mongo_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client(MONGO_URI)
+    return _client
+
+
+# True when the shared client is an in-process mongomock client, which lacks
+# some server features (aggregation window stages, newer bulk_write options).
+def is_mock_client() -> bool:
+    return type(get_mongo_client()).__module__.startswith("mongomock")
+
+
+# Replaces the shared client, e.g. with a mongomock client holding fixture data.
+def set_mongo_client(client) -> None:
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def close_mongo_client() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+# pymongo clients are not fork-safe, so a forked server worker opens its own
+# connections. A mongomock client holds the data itself and is kept.
+def _reset_after_fork() -> None:
+    global _client, _client_lock
+    _client_lock = threading.Lock()
+    if _client is not None and not type(_client).__module__.startswith("mongomock"):
+        _client = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_database():
+    return get_mongo_client()[MONGO_DB_NAME]
+
+
+def get_sector_collection():
+    return get_database()[SECTOR_COLLECTION]
+
+
+def get_country_collection():
+    return get_database()[COUNTRY_COLLECTION]
+
+
+def distinct_sectors() -> list:
+    return get_sector_collection().distinct("Sector_name")
+
+
+def distinct_subsectors() -> list:
+    return get_sector_collection().distinct("Subsector_Name")
+
+
+def distinct_countries() -> list:
+    return get_country_collection().distinct("Country")
+
+
+def distinct_continents() -> list:
+    return get_country_collection().distinct("Continent")
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(str(name).split()).lower()
+
+
+# Returns every row of the sector, matched on the indexed normalized name.
+def find_sector_rows(sector_name: str, fields: list = SECTOR_FIELDS) -> list[SectorRecord]:
+    pipeline = [
+        {"$match": {SECTOR_NAME_KEY: normalize_name(sector_name)}},
+        {"$project": projection(fields)},
+    ]
+    return list(get_sector_collection().aggregate(pipeline))
+
+
+# Rows of several sectors in one round trip.
+def find_rows_for_sectors(sector_names: list, fields: list = SECTOR_FIELDS) -> list[SectorRecord]:
+    pipeline = [
+        {"$match": {SECTOR_NAME_KEY: {"$in": [normalize_name(name) for name in sector_names]}}},
+        {"$project": projection(fields)},
+    ]
+    return list(get_sector_collection().aggregate(pipeline))
+
+
+# The country's row, matched on its exact name. Names are resolved to the
+# dataset's spelling first (see resolver.py).
+def find_country_rows(country: str, fields: list = COUNTRY_FIELDS) -> list[CountryRecord]:
+    return list(get_country_collection().find({"Country": country}, projection(fields)).limit(1))
+
+
+# The rank field a user or model means by e.g. "2025 YTD" or "mar_2025_total".
+def rank_field(name: str) -> Optional[str]:
+    key = "_".join(str(name).split()).lower()
+    for field in RANK_FIELDS:
+        if field.lower() == key:
+            return field
+    return None
+
+
+def _group_accumulator(field: str) -> dict:
+    return {"$avg" if field in MEAN_RANK_FIELDS else "$sum": f"${field}"}
+
+
+# Top countries by one column. The $sort + $limit pair is answered from the
+# field's index (with the continent prefix when filtering) for the columns in
+# RANK_INDEXED_FIELDS.
+def rank_countries_pipeline(field: str, limit: int, continent: Optional[str] = None, ascending: bool = False) -> list:
+    match = {field: {"$type": "number"}}
+    if continent is not None:
+        match["Continent"] = continent
+    return [
+        {"$match": match},
+        {"$sort": {field: 1 if ascending else -1, "Country": 1}},
+        {"$limit": limit},
+        {"$project": projection(["Continent", "Country", field])},
+    ]
+
+
+# Per-continent totals of every rank field, with the number of countries,
+# ordered by sort_field.
+def continent_summary_pipeline(sort_field: str = "2025_YTD") -> list:
+    group = {"_id": "$Continent", "countries": {"$sum": 1}}
+    for field in RANK_FIELDS:
+        group[field] = _group_accumulator(field)
+    return [
+        {"$group": group},
+        {"$sort": {sort_field: -1, "_id": 1}},
+        {"$project": {"_id": 0, "Continent": "$_id", "countries": 1, **{field: 1 for field in RANK_FIELDS}}},
+    ]
+
+
+# Top subsectors by one column, summed over each subsector's rows, across all
+# sectors or within one (matched on the indexed normalized name).
+def rank_subsectors_pipeline(field: str, limit: int, sector_name: Optional[str] = None, ascending: bool = False) -> list:
+    pipeline = []
+    if sector_name is not None:
+        pipeline.append({"$match": {SECTOR_NAME_KEY: normalize_name(sector_name)}})
+    pipeline += [
+        {"$group": {"_id": {"Sector_name": "$Sector_name", "Subsector_Name": "$Subsector_Name"}, field: _group_accumulator(field)}},
+        {"$sort": {field: 1 if ascending else -1, "_id.Subsector_Name": 1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "Sector_name": "$_id.Sector_name", "Subsector_Name": "$_id.Subsector_Name", field: 1}},
+    ]
+    return pipeline
+
+
+def rank_countries(field: str, limit: int = 10, continent: Optional[str] = None, ascending: bool = False) -> list[CountryRecord]:
+    return list(get_country_collection().aggregate(rank_countries_pipeline(field, limit, continent, ascending)))
+
+
+def continent_summary(sort_field: str = "2025_YTD") -> list[dict]:
+    return list(get_country_collection().aggregate(continent_summary_pipeline(sort_field)))
+
+
+def rank_subsectors(field: str, limit: int = 10, sector_name: Optional[str] = None, ascending: bool = False) -> list[SectorRecord]:
+    return list(get_sector_collection().aggregate(rank_subsectors_pipeline(field, limit, sector_name, ascending), allowDiskUse=True))
+
+
+def _vector_search(collection, index: str, query_vector: list, num_candidates: int, limit: int, fields: list) -> list:
+    from . import vector_index
+    if vector_index.use_local_backend():
+        return vector_index.get_local_index(collection).search(query_vector, num_candidates, limit, fields)
+    pipeline = [
+        {
+            "$vectorSearch": {
+                "index": index,
+                "path": "embedding",
+                "queryVector": query_vector,
+                "numCandidates": num_candidates,
+                "limit": limit,
+            }
+        },
+        {"$project": projection(fields)},
+    ]
+    return list(collection.aggregate(pipeline))
+
+
+def vector_search_sectors(query_vector: list, num_candidates: int = 100, limit: int = 20,
+                          fields: list = SECTOR_FIELDS) -> list[SectorRecord]:
+    return _vector_search(get_sector_collection(), "vector_index", query_vector, num_candidates, limit, fields)
+
+
+# One result list per query vector. The local backend answers the whole batch
+# with a single matrix product; Atlas runs one pipeline per vector.
+def vector_search_sectors_many(query_vectors: list, num_candidates: int = 100, limit: int = 1,
+                               fields: list = SECTOR_FIELDS) -> list[list[SectorRecord]]:
+    from . import vector_index
+    collection = get_sector_collection()
+    if vector_index.use_local_backend():
+        return vector_index.get_local_index(collection).search_many(query_vectors, num_candidates, limit, fields)
+    return [_vector_search(collection, "vector_index", vector, num_candidates, limit, fields) for vector in query_vectors]
+
+
+def vector_search_countries(query_vector: list, num_candidates: int = 10, limit: int = 1,
+                            fields: list = COUNTRY_FIELDS) -> list[CountryRecord]:
+    return _vector_search(get_country_collection(), "vector_index_country", query_vector, num_candidates, limit, fields)
+
+
+# Adds SECTOR_NAME_KEY to sector documents that were loaded without it.
+def backfill_normalized_names(batch_size: int = 500) -> int:
+    collection = get_sector_collection()
+    updated = 0
+    batch = []
+    for doc in collection.find({SECTOR_NAME_KEY: {"$exists": False}}, {"Sector_name": 1}):
+        batch.append(pymongo.UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {SECTOR_NAME_KEY: normalize_name(doc.get("Sector_name", ""))}},
+        ))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+
+def create_sector_indexes(collection) -> None:
+    collection.create_index(SECTOR_NAME_KEY, name="sector_name_norm")
+    # Feeds the per-sector $group of rank_subsectors in subsector order.
+    collection.create_index([(SECTOR_NAME_KEY, 1), ("Subsector_Name", 1)], name="sector_subsector")
+
+
+def create_country_indexes(collection) -> None:
+    collection.create_index("Continent", name="continent")
+    collection.create_index("Country", name="country")
+    for field in RANK_INDEXED_FIELDS:
+        collection.create_index([(field, -1), ("Country", 1)], name=f"rank_{field}")
+        collection.create_index([("Continent", 1), (field, -1), ("Country", 1)], name=f"continent_rank_{field}")
+
+
+def ensure_indexes() -> None:
+    create_sector_indexes(get_sector_collection())
+    create_country_indexes(get_country_collection())
+
+
+if __name__ == "__main__":
+    print(f"Backfilled {backfill_normalized_names()} sector documents")
+    ensure_indexes()
+    print("Indexes are up to date")
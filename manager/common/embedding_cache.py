@@ -0,0 +1,156 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import metrics
+
+
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))
+# Path of the sqlite file backing the persistent tier. Leave empty to keep the
+# cache in memory only.
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "")
+
+
+# all-MiniLM-L6-v2 lower-cases its input, so folding case and whitespace here
+# does not change the vector that would be computed.
+def normalize_query(query: str) -> str:
+    return " ".join(str(query).split()).lower()
+
+
+class _SqliteStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " query TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, query))"
+        )
+        self._conn.commit()
+
+    def get(self, model_id: str, query: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND query = ?", (model_id, query)
+            ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, model_id: str, query: str, vector: np.ndarray) -> None:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (model, query, vector) VALUES (?, ?, ?)",
+                (model_id, query, blob),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """Bounded LRU of query embeddings with an optional sqlite tier underneath."""
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, path: str = EMBEDDING_CACHE_PATH):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._store = _SqliteStore(path) if path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, model_id: str, query: str) -> Optional[np.ndarray]:
+        key = (model_id, normalize_query(query))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+        if self._store is not None:
+            vector = self._store.get(*key)
+            if vector is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, vector)
+                return vector
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, model_id: str, query: str, vector) -> None:
+        key = (model_id, normalize_query(query))
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector)
+        if self._store is not None:
+            self._store.put(*key, vector)
+
+    def _remember(self, key: tuple, vector: np.ndarray) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # Returns the cached vector for query, computing and storing it with
+    # encode(normalized_query) on a miss.
+    def get_or_compute(self, model_id: str, query: str, encode) -> np.ndarray:
+        vector = self.get(model_id, query)
+        if vector is None:
+            vector = np.asarray(encode(normalize_query(query)), dtype=np.float32)
+            self.put(model_id, query, vector)
+        return vector
+
+    # Batch variant of get_or_compute: every miss is encoded in one
+    # encode(list_of_queries) call. Returns vectors in input order.
+    def get_or_compute_many(self, model_id: str, queries: list, encode) -> list:
+        vectors = [self.get(model_id, query) for query in queries]
+        missing = sorted({normalize_query(q) for q, v in zip(queries, vectors) if v is None})
+        if missing:
+            encoded = np.asarray(encode(missing), dtype=np.float32)
+            computed = dict(zip(missing, encoded))
+            for query, vector in computed.items():
+                self.put(model_id, query, vector)
+            vectors = [v if v is not None else computed[normalize_query(q)] for q, v in zip(queries, vectors)]
+        return vectors
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    # SQLite connections must not be shared across fork; a forked server
+    # worker keeps the in-memory entries and reopens the file.
+    def _reopen_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        if self._store is not None:
+            self._store = _SqliteStore(self._store.path)
+
+
+embedding_cache = EmbeddingCache()
+os.register_at_fork(after_in_child=embedding_cache._reopen_after_fork)
+metrics.registry.register_stats("embedding_cache", "Query embedding cache.", embedding_cache.stats, counters=("hits", "disk_hits", "misses"))
@@ -0,0 +1,333 @@
+"""Loads a monthly emissions file into MongoDB.
+
+    python -m manager.common.ingest sector data/sector_2025_03.csv
+    python -m manager.common.ingest country data/country_2025_03.parquet --resume
+
+The file is read in chunks. Embeddings for the chunk's distinct texts are
+computed in batches on a process pool while the previous chunk is written.
+Rows go into a staging collection with unordered bulk writes; after the last
+chunk the staging collection gets the live collection's indexes and is renamed
+over it in one step. Progress is checkpointed per chunk in the dataset meta
+collection, so an interrupted load continues with --resume.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import dataset, db, models
+
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", "5000"))
+INGEST_EMBED_BATCH = int(os.environ.get("INGEST_EMBED_BATCH", "256"))
+INGEST_WRITE_BATCH = int(os.environ.get("INGEST_WRITE_BATCH", "1000"))
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+INGEST_SEARCH_INDEX_TIMEOUT_SECONDS = float(os.environ.get("INGEST_SEARCH_INDEX_TIMEOUT_SECONDS", "900"))
+# Vectors of already encoded texts kept for the rest of the run.
+INGEST_VECTOR_MEMO_SIZE = int(os.environ.get("INGEST_VECTOR_MEMO_SIZE", "200000"))
+
+# Per collection kind: target collection, text embedded for vector search, and
+# the Atlas vector index db.py queries.
+KINDS = {
+    "sector": {"collection": db.SECTOR_COLLECTION, "text_fields": ["Sector_name", "Subsector_Name"], "vector_index": "vector_index"},
+    "country": {"collection": db.COUNTRY_COLLECTION, "text_fields": ["Country"], "vector_index": "vector_index_country"},
+}
+
+
+def _embedding_text(row: dict, text_fields: list) -> str:
+    return " - ".join(str(row[field]) for field in text_fields if row.get(field) is not None)
+
+
+def read_chunks(path: str, chunk_rows: int, file_format: str = None):
+    import pandas as pd
+
+    file_format = file_format or ("parquet" if path.endswith((".parquet", ".pq")) else "csv")
+    if file_format == "csv":
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+    elif file_format == "parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        raise RuntimeError(f"Unknown input format: {file_format}")
+
+
+# Runs in the embedding worker processes; each loads the encoder once.
+_worker_encoder = None
+
+
+def _init_worker(threads: int) -> None:
+    global _worker_encoder
+    if models.EMBEDDING_BACKEND == "onnx":
+        _worker_encoder = models.OnnxEncoder(intra_op_threads=threads)
+        return
+    if threads:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    _worker_encoder = models.create_encoder()
+
+
+def _encode_batch(texts: list):
+    start = time.perf_counter()
+    vectors = np.asarray(_worker_encoder.encode(texts), dtype=np.float32)
+    return vectors, time.perf_counter() - start
+
+
+class _LocalPool:
+    """Stand-in for the process pool when workers=0: encodes in this process."""
+
+    def __init__(self):
+        _init_worker(0)
+
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        pass
+
+
+def _create_pool(workers: int):
+    if workers <= 0:
+        return _LocalPool()
+    # Forked workers inherit the imported modules; the parent never loads the
+    # encoder, so no model or thread pool state is copied into them.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(threads,))
+
+
+def _checkpoint_id(kind: str) -> str:
+    return f"ingest:{kind}"
+
+
+def _input_signature(path: str, chunk_rows: int) -> dict:
+    stat = os.stat(path)
+    return {"input": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime, "chunk_rows": chunk_rows}
+
+
+def _load_checkpoint(kind: str, signature: dict):
+    checkpoint = dataset.get_meta_collection().find_one({"_id": _checkpoint_id(kind)})
+    if checkpoint is None or any(checkpoint.get(key) != value for key, value in signature.items()):
+        return None
+    return checkpoint
+
+
+def _save_checkpoint(kind: str, signature: dict, chunks_done: int, rows_done: int) -> None:
+    dataset.get_meta_collection().update_one(
+        {"_id": _checkpoint_id(kind)},
+        {"$set": {**signature, "chunks_done": chunks_done, "rows_done": rows_done, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+def _write(collection, docs: list, batch_size: int) -> int:
+    from pymongo import InsertOne
+    from pymongo.errors import BulkWriteError
+
+    written = 0
+    for start in range(0, len(docs), batch_size):
+        operations = [InsertOne(doc) for doc in docs[start:start + batch_size]]
+        try:
+            written += collection.bulk_write(operations, ordered=False).inserted_count
+        except BulkWriteError as e:
+            # Rows of a chunk that was partly written before an interruption
+            # are already there under the same _id.
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            written += e.details.get("nInserted", 0)
+    return written
+
+
+def _copy_indexes(kind: str, live, staging, dimensions: int, timeout: float) -> None:
+    if kind == "sector":
+        db.create_sector_indexes(staging)
+    else:
+        db.create_country_indexes(staging)
+    try:
+        definitions = [
+            {"name": index["name"], "type": index.get("type", "search"), "definition": index["latestDefinition"]}
+            for index in live.list_search_indexes()
+        ]
+        if not definitions:
+            definitions = [{
+                "name": KINDS[kind]["vector_index"],
+                "type": "vectorSearch",
+                "definition": {"fields": [{"type": "vector", "path": "embedding", "numDimensions": dimensions, "similarity": "cosine"}]},
+            }]
+        for definition in definitions:
+            staging.create_search_index(definition)
+    except Exception as e:
+        print(f"Search indexes not copied to {staging.name} ({e}); create them before querying with $vectorSearch.")
+        return
+    # The live collection keeps serving until the staging indexes can answer
+    # queries.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(index.get("queryable") for index in staging.list_search_indexes()):
+            return
+        time.sleep(5)
+    raise RuntimeError(f"Search indexes on {staging.name} not queryable after {timeout:.0f}s; staging collection kept.")
+
+
+def ingest(
+    kind: str,
+    path: str,
+    file_format: str = None,
+    chunk_rows: int = INGEST_CHUNK_ROWS,
+    embed_batch: int = INGEST_EMBED_BATCH,
+    write_batch: int = INGEST_WRITE_BATCH,
+    workers: int = INGEST_WORKERS,
+    resume: bool = False,
+    swap: bool = True,
+    text_fields: list = None,
+) -> dict:
+    settings = KINDS[kind]
+    text_fields = text_fields or settings["text_fields"]
+    database = db.get_database()
+    live = database[settings["collection"]]
+    staging = database[f"{settings['collection']}_staging"]
+    signature = _input_signature(path, chunk_rows)
+
+    checkpoint = _load_checkpoint(kind, signature) if resume else None
+    start_chunk = checkpoint["chunks_done"] if checkpoint else 0
+    if checkpoint is None:
+        staging.drop()
+    else:
+        print(f"Resuming {path} after chunk {start_chunk} ({checkpoint['rows_done']} rows)")
+
+    stats = {"rows": 0, "chunks": 0, "encoded": 0, "encode_seconds": 0.0, "write_seconds": 0.0, "dimensions": 0}
+    memo = {}
+    pool = _create_pool(workers)
+    started = time.perf_counter()
+
+    def finish_chunk(index, docs, known, texts, futures, rows_done):
+        for batch, future in zip(texts, futures):
+            vectors, seconds = future.result()
+            stats["encode_seconds"] += seconds
+            stats["encoded"] += len(batch)
+            known.update(zip(batch, vectors))
+        if len(memo) + len(known) > INGEST_VECTOR_MEMO_SIZE:
+            memo.clear()
+        memo.update(known)
+        for doc, text in docs:
+            vector = known[text]
+            doc["embedding"] = vector.tolist()
+            stats["dimensions"] = len(vector)
+        write_start = time.perf_counter()
+        _write(staging, [doc for doc, _ in docs], write_batch)
+        stats["write_seconds"] += time.perf_counter() - write_start
+        stats["rows"] += len(docs)
+        stats["chunks"] += 1
+        _save_checkpoint(kind, signature, index + 1, rows_done)
+        elapsed = time.perf_counter() - started
+        print(f"chunk {index + 1}: {rows_done} rows, {stats['rows'] / elapsed:.0f} rows/s, {stats['encoded'] / elapsed:.0f} embeddings/s")
+
+    try:
+        pending = None
+        row_offset = 0
+        for index, frame in enumerate(read_chunks(path, chunk_rows, file_format)):
+            first_row, row_offset = row_offset, row_offset + len(frame)
+            if index < start_chunk:
+                continue
+            frame = frame.astype(object).where(frame.notna(), None)
+            docs = []
+            for i, row in enumerate(frame.to_dict("records")):
+                # The row number is the _id, so replaying a chunk after an
+                # interruption writes the same documents again.
+                row["_id"] = first_row + i
+                if kind == "sector":
+                    row[db.SECTOR_NAME_KEY] = db.normalize_name(row.get("Sector_name", ""))
+                docs.append((row, _embedding_text(row, text_fields)))
+            # Vectors this chunk can reuse are captured now; memo may be
+            # cleared before the chunk is written.
+            known = {text: memo[text] for _, text in docs if text in memo}
+            missing = list(dict.fromkeys(text for _, text in docs if text not in known))
+            texts = [missing[i:i + embed_batch] for i in range(0, len(missing), embed_batch)]
+            futures = [pool.submit(_encode_batch, batch) for batch in texts]
+            # Write the previous chunk while this one is being encoded.
+            if pending is not None:
+                finish_chunk(*pending)
+            pending = (index, docs, known, texts, futures, row_offset)
+        if pending is not None:
+            finish_chunk(*pending)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    stats.update({
+        "seconds": elapsed,
+        "rows_per_second": stats["rows"] / elapsed if elapsed else 0.0,
+        "embeddings_per_second": stats["encoded"] / elapsed if elapsed else 0.0,
+        "encoder_embeddings_per_second": stats["encoded"] / stats["encode_seconds"] if stats["encode_seconds"] else 0.0,
+        "writes_per_second": stats["rows"] / stats["write_seconds"] if stats["write_seconds"] else 0.0,
+    })
+    if swap:
+        swap_in(kind, dimensions=stats["dimensions"])
+    return stats
+
+
+# Gives the staging collection the live indexes, renames it over the live
+# collection and publishes a new dataset version so caches, rollups and the
+# time series follow.
+def swap_in(kind: str, dimensions: int = 384, timeout: float = INGEST_SEARCH_INDEX_TIMEOUT_SECONDS) -> str:
+    from . import rollups, snapshot, timeseries, vector_index
+
+    database = db.get_database()
+    live = database[KINDS[kind]["collection"]]
+    staging = database[f"{KINDS[kind]['collection']}_staging"]
+    _copy_indexes(kind, live, staging, dimensions, timeout)
+    staging.rename(live.name, dropTarget=True)
+    dataset.get_meta_collection().delete_one({"_id": _checkpoint_id(kind)})
+    version = dataset.publish_version()
+    rollups.rebuild(version)
+    if timeseries.TIMESERIES_ENABLED:
+        timeseries.load_from_wide((kind,), version)
+    snapshot.mark_stale()
+    vector_index.invalidate()
+    return version
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=sorted(KINDS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None)
+    parser.add_argument("--chunk-rows", type=int, default=INGEST_CHUNK_ROWS)
+    parser.add_argument("--embed-batch", type=int, default=INGEST_EMBED_BATCH)
+    parser.add_argument("--write-batch", type=int, default=INGEST_WRITE_BATCH)
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="embedding processes; 0 encodes in this process")
+    parser.add_argument("--text-fields", default=None, help="comma-separated columns joined into the embedded text")
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint for this file")
+    parser.add_argument("--no-swap", action="store_true", help="leave the data in the staging collection")
+    args = parser.parse_args()
+
+    stats = ingest(
+        args.kind,
+        args.path,
+        file_format=args.format,
+        chunk_rows=args.chunk_rows,
+        embed_batch=args.embed_batch,
+        write_batch=args.write_batch,
+        workers=args.workers,
+        resume=args.resume,
+        swap=not args.no_swap,
+        text_fields=args.text_fields.split(",") if args.text_fields else None,
+    )
+    print(
+        f"{stats['rows']} rows in {stats['seconds']:.1f}s: {stats['rows_per_second']:.0f} rows/s, "
+        f"{stats['encoded']} embeddings at {stats['embeddings_per_second']:.0f}/s end to end "
+        f"({stats['encoder_embeddings_per_second']:.0f}/s per worker), {stats['writes_per_second']:.0f} writes/s"
+    )
@@ -0,0 +1,283 @@
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+# Process-wide counters and histograms in the Prometheus text format, served
+# on /metrics. Kept dependency-free: a handful of metric families do not need
+# a client library.
+METRICS_ENABLED = os.environ.get("METRICS", "true").lower() in ("1", "true", "yes", "on")
+# Adds an OpenTelemetry span to every timer below. The spans nest under the
+# invoke_agent / execute_tool spans ADK records for each agent turn; ADK sets
+# up the exporter from OTEL_EXPORTER_OTLP_ENDPOINT.
+METRICS_OTEL_SPANS = os.environ.get("METRICS_OTEL_SPANS", "false").lower() in ("1", "true", "yes", "on")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            for key, value in self._values.items():
+                yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _number(bound) + '"'
+                    yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+                yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+                yield f"{self.name}_count{_labels(self.labelnames, key)} {count}"
+
+
+class StatsCollector:
+    """Exposes the numeric fields of a component's stats() dict, read at
+    scrape time. Fields listed in counters are monotonic; the rest are gauges."""
+
+    def __init__(self, prefix: str, documentation: str, stats, counters: tuple = ()):
+        self.prefix = prefix
+        self.documentation = documentation
+        self.stats = stats
+        self.counters = set(counters)
+
+    def families(self):
+        try:
+            stats = self.stats()
+        except Exception:
+            return
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if key in self.counters:
+                yield f"{self.prefix}_{key}_total", "counter", value
+            else:
+                yield f"{self.prefix}_{key}", "gauge", value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, documentation: str, stats, counters: tuple = ()) -> None:
+        with self._lock:
+            self._collectors.append(StatsCollector(prefix, documentation, stats, counters))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in collectors:
+            for name, kind, value in collector.families():
+                lines.append(f"# HELP {name} {collector.documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+TOOL_SECONDS = registry.register(Histogram("agent_tool_duration_seconds", "Tool call latency, including cache hits.", ("tool", "status")))
+MONGO_SECONDS = registry.register(Histogram("mongo_command_duration_seconds", "MongoDB command latency per collection.", ("command", "collection", "status")))
+ENCODE_SECONDS = registry.register(Histogram("encode_duration_seconds", "Encoder call latency.", ("backend",)))
+ENCODE_TEXTS = registry.register(Counter("encode_texts_total", "Texts encoded.", ("backend",)))
+RENDER_SECONDS = registry.register(Histogram("chart_render_duration_seconds", "Chart render latency, including time queued for a worker.", ("style",)))
+UPLOAD_SECONDS = registry.register(Histogram("blob_upload_duration_seconds", "Blob store upload latency.", ("backend", "status")))
+
+_tracer = None
+
+
+def _get_tracer():
+    global _tracer
+    if _tracer is None:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer("co2-emission-agents")
+    return _tracer
+
+
+@contextmanager
+def span(name: str, **attributes):
+    if not METRICS_OTEL_SPANS:
+        yield None
+        return
+    with _get_tracer().start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+# Observes the duration of the block in histogram, with a span of the same
+# name when spans are on. A status label, if the histogram has one, is set to
+# "error" when the block raises.
+@contextmanager
+def timer(histogram: Histogram, span_name: str = None, **labels):
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        with span(span_name or histogram.name, **labels):
+            yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        if "status" in histogram.labelnames:
+            labels["status"] = status
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+# Records the latency of every call of a tool, sync or async, under the
+# tool's name.
+def timed_tool(fn):
+    name = fn.__name__
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with timer(TOOL_SECONDS, f"tool {name}", tool=name):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with timer(TOOL_SECONDS, f"tool {name}", tool=name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def timed_tools(tools: list) -> list:
+    if not METRICS_ENABLED:
+        return tools
+    return [timed_tool(tool) for tool in tools]
+
+
+def render() -> str:
+    return registry.render()
+
+
+def _command_listener():
+    from pymongo import monitoring
+
+    class CommandTimer(monitoring.CommandListener):
+        """Per-collection command latency from pymongo's command monitoring."""
+
+        def __init__(self):
+            self._collections = {}
+            self._lock = threading.Lock()
+
+        @staticmethod
+        def _key(event):
+            return (event.connection_id, event.request_id, event.operation_id)
+
+        def started(self, event):
+            target = event.command.get(event.command_name)
+            collection = target if isinstance(target, str) else ""
+            with self._lock:
+                self._collections[self._key(event)] = collection
+
+        def _finish(self, event, status):
+            with self._lock:
+                collection = self._collections.pop(self._key(event), "")
+            MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, collection=collection, status=status)
+
+        def succeeded(self, event):
+            self._finish(event, "ok")
+
+        def failed(self, event):
+            self._finish(event, "error")
+
+    return CommandTimer()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+# Listener to pass to MongoClient(event_listeners=...); one shared instance.
+def mongo_listeners() -> list:
+    global _listener
+    if not METRICS_ENABLED:
+        return []
+    if _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                _listener = _command_listener()
+    return [_listener]
@@ -0,0 +1,254 @@
+import abc
+import sys
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import metrics
+
+
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# "sentence-transformers" runs the PyTorch model; "onnx" runs an int8
+# quantized export of the same model through onnxruntime (see export_onnx).
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "sentence-transformers").lower()
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", f".models/{EMBEDDING_MODEL}-int8")
+# 0 lets onnxruntime pick the number of intra-op threads (one per core).
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", "0"))
+ONNX_INTER_OP_THREADS = int(os.environ.get("ONNX_INTER_OP_THREADS", "1"))
+# sentence-transformers truncates all-MiniLM-L6-v2 inputs at 256 tokens.
+ONNX_MAX_LENGTH = int(os.environ.get("ONNX_MAX_LENGTH", "256"))
+# "background" loads the encoder on a thread started by main.py, "eager" loads
+# it before the app is created, "lazy" waits for the first query that needs it.
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "background").lower()
+# Intra-op threads of the PyTorch model; 0 keeps torch's default of one per
+# core. serve.py divides the cores between its workers.
+TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", "0"))
+
+
+class Encoder(abc.ABC):
+    """Maps text to L2-normalized float32 embeddings.
+
+    encode(str) returns one vector and encode(list) a 2-D array, the same as
+    SentenceTransformer.encode.
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    def encode(self, texts):
+        ...
+
+
+class SentenceTransformerEncoder(Encoder):
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self._model = SentenceTransformer(model_name)
+        _set_torch_threads()
+
+    def encode(self, texts):
+        return self._model.encode(texts)
+
+
+class OnnxEncoder(Encoder):
+    """Runs an exported transformer with onnxruntime and applies the mean
+    pooling and normalization that sentence-transformers does for MiniLM."""
+
+    def __init__(
+        self,
+        model_dir: str = ONNX_MODEL_DIR,
+        intra_op_threads: int = ONNX_INTRA_OP_THREADS,
+        inter_op_threads: int = ONNX_INTER_OP_THREADS,
+        max_length: int = ONNX_MAX_LENGTH,
+    ):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length)
+        self._tokenizer.enable_padding()
+        self.name = f"{EMBEDDING_MODEL}:onnx-int8"
+
+    def encode(self, texts):
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        if not batch:
+            return np.empty((0, 0), dtype=np.float32)
+        encodings = self._tokenizer.encode_batch(batch)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self._session.run(None, feeds)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        pooled = pooled.astype(np.float32)
+        return pooled[0] if single else pooled
+
+
+# sentence_transformers has imported torch by the time this runs.
+def _set_torch_threads() -> None:
+    if TORCH_NUM_THREADS > 0 and "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(TORCH_NUM_THREADS)
+
+
+def create_encoder(backend: str = None) -> Encoder:
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "sentence-transformers":
+        return SentenceTransformerEncoder()
+    if backend == "onnx":
+        return OnnxEncoder()
+    raise RuntimeError(f"Unknown embedding backend: {backend}")
+
+
+# Embedding cache key of the configured backend. The int8 model's vectors are
+# close to, but not the same as, the PyTorch model's.
+ENCODER_ID = f"{EMBEDDING_MODEL}:onnx-int8" if EMBEDDING_BACKEND == "onnx" else EMBEDDING_MODEL
+
+_encoder = None
+_load_lock = threading.Lock()
+_ready = threading.Event()
+_error = None
+_load_seconds = None
+_warmup_thread = None
+
+
+# Both analysis agents share this one instance; the backend's libraries are
+# only imported when the encoder is first needed.
+def get_encoder():
+    global _encoder, _error, _load_seconds
+    if _encoder is None:
+        with _load_lock:
+            if _encoder is None:
+                start = time.perf_counter()
+                try:
+                    encoder = create_encoder()
+                    # The first encode call allocates its buffers; do it here
+                    # rather than in the first user request.
+                    encoder.encode("warm up")
+                except Exception as e:
+                    _error = e
+                    raise
+                _error = None
+                _load_seconds = time.perf_counter() - start
+                _encoder = encoder
+                _ready.set()
+    return _encoder
+
+
+def encode(texts):
+    encoder = get_encoder()
+    backend = type(encoder).__name__
+    with metrics.timer(metrics.ENCODE_SECONDS, "encode", backend=backend):
+        vectors = encoder.encode(texts)
+    metrics.ENCODE_TEXTS.inc(1 if isinstance(texts, str) else len(texts), backend=backend)
+    return vectors
+
+
+def _warm_up() -> None:
+    try:
+        get_encoder()
+    except Exception as e:
+        print(f"Failed to load embedding model {EMBEDDING_MODEL}: {e}")
+
+
+def start_warmup() -> threading.Thread:
+    global _warmup_thread
+    with _load_lock:
+        if _warmup_thread is None and not _ready.is_set():
+            _warmup_thread = threading.Thread(target=_warm_up, name="model-warmup", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+# A forked server worker keeps the PyTorch model, shared copy-on-write with
+# the parent. onnxruntime's thread pool does not survive fork, so an ONNX
+# session is dropped and the worker loads its own.
+def _after_fork_in_child() -> None:
+    global _encoder, _load_lock, _warmup_thread
+    _load_lock = threading.Lock()
+    _warmup_thread = None
+    if isinstance(_encoder, OnnxEncoder):
+        _encoder = None
+        _ready.clear()
+    elif _encoder is not None:
+        _set_torch_threads()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def wait_until_ready(timeout: float = None) -> bool:
+    return _ready.wait(timeout)
+
+
+def status() -> dict:
+    return {
+        "model": ENCODER_ID,
+        "ready": _ready.is_set(),
+        "load_seconds": _load_seconds,
+        "error": str(_error) if _error is not None else None,
+    }
+
+
+# Exports EMBEDDING_MODEL to ONNX and quantizes its weights to int8. Needs torch,
+# transformers and onnxruntime; the serving image only needs onnxruntime and
+# tokenizers.
+def export_onnx(output_dir: str = ONNX_MODEL_DIR, model_name: str = EMBEDDING_MODEL, quantize: bool = True) -> str:
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    hub_name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    tokenizer = AutoTokenizer.from_pretrained(hub_name)
+    model = AutoModel.from_pretrained(hub_name).eval()
+    os.makedirs(output_dir, exist_ok=True)
+    sample = tokenizer(["emissions from international aviation"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    fp32_path = os.path.join(output_dir, "model_fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+            opset_version=17,
+        )
+    model_path = os.path.join(output_dir, "model.onnx")
+    if quantize:
+        quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    else:
+        os.replace(fp32_path, model_path)
+    tokenizer.save_pretrained(output_dir)
+    return model_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the embedding model for EMBEDDING_BACKEND=onnx.")
+    parser.add_argument("--output", default=ONNX_MODEL_DIR)
+    parser.add_argument("--fp32", action="store_true", help="skip int8 quantization")
+    args = parser.parse_args()
+    print(f"Wrote {export_onnx(args.output, quantize=not args.fp32)}")
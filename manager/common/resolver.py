@@ -0,0 +1,472 @@
+import json
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import dataset, db, metrics, models
+from .embedding_cache import embedding_cache
+from .snapshot import get_snapshot
+from .vector_index import normalize_rows
+
+# Resolves a sector, subsector or country name as a user or the model wrote it
+# to the dataset's spelling, in process and without a database round trip.
+#
+# Each kind keeps its distinct names in a character-trigram BM25 index and as
+# encoder vectors. A query that is not an exact name or an alias is ranked by
+# both, and the two rankings are merged with reciprocal-rank fusion: the
+# trigrams catch typos ("Indsutry"), the vectors catch paraphrases ("shipping
+# at sea"), and abbreviations neither can see ("USA") come from the alias
+# table. Exact names and aliases are a dictionary lookup; anything else is a
+# few array operations over the names plus, the first time a query is seen,
+# one encode.
+RESOLVER_ENABLED = os.environ.get("RESOLVER", "true").lower() in ("1", "true", "yes", "on")
+# Off ranks by trigrams only and never encodes.
+RESOLVER_SEMANTIC = os.environ.get("RESOLVER_SEMANTIC", "true").lower() in ("1", "true", "yes", "on")
+# JSON file of extra aliases, {"country": {"usa": "United States"}, ...},
+# merged over ALIASES below.
+RESOLVER_ALIASES_PATH = os.environ.get("RESOLVER_ALIASES_PATH", "")
+# k in 1 / (k + rank). Larger values give lower ranks more weight.
+RESOLVER_RRF_K = float(os.environ.get("RESOLVER_RRF_K", "60"))
+# Names taken from each ranking before fusion.
+RESOLVER_DEPTH = int(os.environ.get("RESOLVER_DEPTH", "20"))
+# Names below this cosine similarity to the query are left out of the vector
+# ranking, so an unrelated name cannot outrank a near spelling.
+RESOLVER_MIN_SIMILARITY = float(os.environ.get("RESOLVER_MIN_SIMILARITY", "0.35"))
+# A ranked name is only taken as the answer when it is close enough to the
+# query by one of these; otherwise it is returned as a suggestion and the
+# query resolves to nothing. Trigram Dice overlap accepts partial names
+# ("Fossil Fuel"), spelling similarity (1 - edits / length) accepts typos in
+# short names ("Preu"), and cosine similarity accepts paraphrases.
+RESOLVER_MIN_OVERLAP = float(os.environ.get("RESOLVER_MIN_OVERLAP", "0.35"))
+RESOLVER_MIN_SPELLING = float(os.environ.get("RESOLVER_MIN_SPELLING", "0.75"))
+RESOLVER_MIN_CONFIDENT_SIMILARITY = float(os.environ.get("RESOLVER_MIN_CONFIDENT_SIMILARITY", "0.7"))
+
+KINDS = ("sector", "subsector", "country")
+
+# Alias -> the dataset's name. A target may list several spellings; the first
+# one the dataset has is used, and aliases whose targets it has none of are
+# dropped. Exact names always win over aliases.
+ALIASES = {
+    "sector": {
+        "oil & gas": "Fossil Fuel Operations",
+        "oil and gas": "Fossil Fuel Operations",
+        "fossil fuels": "Fossil Fuel Operations",
+        "electricity": "Power",
+        "power generation": "Power",
+        "road transport": "Ground Transport",
+        "road": "Ground Transport",
+        "buildings": "Residential",
+        "households": "Residential",
+        "farming": "Agriculture",
+        "shipping": "International Shipping",
+        "flights": ["International Aviation", "Aviation"],
+    },
+    "country": {
+        "usa": ["United States", "United States of America", "US"],
+        "us": ["United States", "United States of America", "US"],
+        "america": ["United States", "United States of America", "US"],
+        "united states of america": ["United States", "US"],
+        "uk": ["United Kingdom", "UK"],
+        "britain": ["United Kingdom", "UK"],
+        "great britain": ["United Kingdom", "UK"],
+        "uae": "United Arab Emirates",
+        "russia": ["Russian Federation", "Russia"],
+        "south korea": ["Korea, Republic of", "Republic of Korea", "Korea"],
+        "korea": ["South Korea", "Korea, Republic of", "Republic of Korea"],
+        "czechia": ["Czech Republic", "Czechia"],
+        "czech republic": ["Czechia", "Czech Republic"],
+        "holland": "Netherlands",
+        "the netherlands": "Netherlands",
+        "turkey": ["Türkiye", "Turkey"],
+        "turkiye": ["Turkey", "Türkiye"],
+        "ivory coast": ["Côte d'Ivoire", "Cote d'Ivoire"],
+        "drc": ["Democratic Republic of the Congo", "DR Congo"],
+        "eu": ["EU27 & UK", "EU27", "European Union"],
+        "world": ["WORLD", "World"],
+    },
+}
+
+_STOP_WORDS = {"of", "and", "the"}
+
+
+# Lower case, accents and punctuation dropped, "&" read as "and", and dotted
+# abbreviations joined ("U.S.A." -> "usa").
+def fold(name: str) -> str:
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    text = re.sub(r"[.'’]", "", text.lower().replace("&", " and "))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+# Trigrams of each word padded the way pg_trgm pads them, so short words and
+# word starts still produce grams.
+def trigrams(text: str) -> list:
+    grams = []
+    for word in text.split():
+        padded = f"  {word} "
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+# Initials of a name of two or more words ("United Arab Emirates" -> "uae").
+def _acronym(folded: str) -> Optional[str]:
+    words = [word for word in folded.split() if word not in _STOP_WORDS]
+    if len(words) < 2 or not all(word.isalpha() for word in words):
+        return None
+    return "".join(word[0] for word in words)
+
+
+# Dice coefficient of two trigram multisets.
+def overlap(query: Counter, name: Counter) -> float:
+    total = sum(query.values()) + sum(name.values())
+    return 2 * sum((query & name).values()) / total if total else 0.0
+
+
+# 1 - the optimal string alignment distance (edits, with adjacent swaps as
+# one edit) over the longer length.
+def spelling(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        before, previous = previous, current
+    return 1 - previous[-1] / max(len(a), len(b))
+
+
+def load_aliases(path: str = RESOLVER_ALIASES_PATH) -> dict:
+    aliases = {kind: dict(ALIASES.get(kind, {})) for kind in KINDS}
+    if path:
+        with open(path) as f:
+            for kind, entries in json.load(f).items():
+                aliases.setdefault(kind, {}).update(entries)
+    return aliases
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        return part[np.argsort(-scores[part], kind="stable")]
+    return np.argsort(-scores, kind="stable")
+
+
+class TrigramIndex:
+    """BM25 over the character trigrams of a fixed list of texts."""
+
+    def __init__(self, texts: list, k1: float = 1.2, b: float = 0.75):
+        counts = [Counter(trigrams(text)) for text in texts]
+        lengths = np.array([sum(count.values()) for count in counts], dtype=np.float32)
+        average = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        postings = {}
+        for i, count in enumerate(counts):
+            for gram, frequency in count.items():
+                postings.setdefault(gram, []).append((i, frequency))
+        self.size = len(texts)
+        # gram -> (text indices, BM25 weight of the gram in each text)
+        self.postings = {}
+        for gram, entries in postings.items():
+            ids = np.array([i for i, _ in entries], dtype=np.int64)
+            frequency = np.array([f for _, f in entries], dtype=np.float32)
+            idf = math.log(1 + (self.size - len(entries) + 0.5) / (len(entries) + 0.5))
+            weights = idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * lengths[ids] / average))
+            self.postings[gram] = (ids, weights.astype(np.float32))
+
+    def scores(self, text: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for gram, count in Counter(trigrams(text)).items():
+            posting = self.postings.get(gram)
+            if posting is not None:
+                scores[posting[0]] += count * posting[1]
+        return scores
+
+
+@dataclass(frozen=True)
+class Candidate:
+    name: str
+    # "exact", "alias", "fused" (ranked and close enough to be the answer) or
+    # "suggestion" (ranked, but too far from the query to be taken).
+    match: str
+    # Raw reciprocal-rank fusion score; None for an exact name or alias.
+    score: Optional[float] = None
+    # Trigram Dice overlap and spelling similarity with the query; spelling
+    # is None when the lengths alone rule it out.
+    overlap: Optional[float] = None
+    spelling: Optional[float] = None
+    # Cosine similarity with the query; None without vectors.
+    similarity: Optional[float] = None
+
+
+class NameIndex:
+    """The names of one kind with their exact, alias, trigram and vector lookups."""
+
+    def __init__(self, kind: str, names: list, aliases: dict = None, vectors=None):
+        self.kind = kind
+        self.names = list(names)
+        folded = [fold(name) for name in self.names]
+        self.folded = folded
+        self.grams = [Counter(trigrams(key)) for key in folded]
+        self.exact = {}
+        for i, key in enumerate(folded):
+            self.exact.setdefault(key, i)
+        self.lexical = TrigramIndex(folded)
+        self.vectors = normalize_rows(vectors) if vectors is not None and len(self.names) else None
+        self.aliases = {}
+        acronyms = Counter(filter(None, (_acronym(key) for key in folded)))
+        for i, key in enumerate(folded):
+            acronym = _acronym(key)
+            if acronym and acronyms[acronym] == 1 and acronym not in self.exact:
+                self.aliases[acronym] = i
+        for alias, targets in (aliases or {}).items():
+            key = fold(alias)
+            if key in self.exact:
+                continue
+            for target in [targets] if isinstance(targets, str) else targets:
+                i = self.exact.get(fold(target))
+                if i is not None:
+                    self.aliases[key] = i
+                    break
+
+    # Candidates best first. An exact name or alias is returned on its own.
+    def resolve(self, name: str, limit: int = 5, query_vector=None) -> list:
+        key = fold(name)
+        if not key or not self.names:
+            return []
+        if key in self.exact:
+            return [Candidate(self.names[self.exact[key]], "exact")]
+        if key in self.aliases:
+            return [Candidate(self.names[self.aliases[key]], "alias")]
+        return self.rank(key, limit, query_vector)
+
+    # Reciprocal-rank fusion of the trigram and vector rankings of a folded
+    # query. Names close enough to be the answer come first.
+    def rank(self, key: str, limit: int = 5, query_vector=None) -> list:
+        lexical = self.lexical.scores(key)
+        fused = {}
+        for rank, i in enumerate(_top(lexical, RESOLVER_DEPTH)):
+            if lexical[i] <= 0:
+                break
+            fused[i] = 1 / (RESOLVER_RRF_K + rank + 1)
+        similarity = None
+        if self.vectors is not None:
+            if query_vector is None:
+                query_vector = embedding_cache.get_or_compute(models.ENCODER_ID, key, models.encode)
+            similarity = self.vectors @ normalize_rows(query_vector)[0]
+            for rank, i in enumerate(_top(similarity, RESOLVER_DEPTH)):
+                if similarity[i] < RESOLVER_MIN_SIMILARITY:
+                    break
+                fused[i] = fused.get(i, 0.0) + 1 / (RESOLVER_RRF_K + rank + 1)
+        # Ties, e.g. first in one ranking each, go to the closer spelling.
+        ranked = sorted(fused.items(), key=lambda item: (-item[1], -lexical[item[0]], self.names[item[0]]))
+        grams = Counter(trigrams(key))
+        close, far = [], []
+        for i, score in ranked:
+            cosine = float(similarity[i]) if similarity is not None else None
+            dice = overlap(grams, self.grams[i])
+            # The distance is at least the difference in length.
+            edits = None
+            if 1 - abs(len(key) - len(self.folded[i])) / max(len(key), len(self.folded[i])) >= RESOLVER_MIN_SPELLING:
+                edits = spelling(key, self.folded[i])
+            if (dice >= RESOLVER_MIN_OVERLAP or (edits is not None and edits >= RESOLVER_MIN_SPELLING)
+                    or (cosine is not None and cosine >= RESOLVER_MIN_CONFIDENT_SIMILARITY)):
+                close.append(Candidate(self.names[i], "fused", float(score), dice, edits, cosine))
+                if len(close) >= limit:
+                    break
+            else:
+                far.append(Candidate(self.names[i], "suggestion", float(score), dice, edits, cosine))
+        return (close + far)[:limit]
+
+
+class Resolver:
+    """A NameIndex per kind, built for one dataset version."""
+
+    def __init__(self, names: dict, aliases: dict = None, semantic: bool = RESOLVER_SEMANTIC):
+        aliases = load_aliases() if aliases is None else aliases
+        vectors = {}
+        if semantic:
+            # Every name of every kind in one encode call.
+            texts = [name for kind in KINDS for name in names.get(kind, [])]
+            encoded = np.asarray(models.encode(texts), dtype=np.float32) if texts else np.empty((0, 0), dtype=np.float32)
+            start = 0
+            for kind in KINDS:
+                count = len(names.get(kind, []))
+                vectors[kind] = encoded[start:start + count]
+                start += count
+        self.semantic = semantic
+        self.indexes = {
+            kind: NameIndex(kind, names.get(kind, []), aliases.get(kind), vectors.get(kind))
+            for kind in KINDS
+        }
+
+    @classmethod
+    def load(cls) -> "Resolver":
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            names = {
+                "sector": snapshot.sectors.categories['Sector_name'],
+                "subsector": snapshot.sectors.categories['Subsector_Name'],
+                "country": snapshot.countries.categories['Country'],
+            }
+        else:
+            names = {"sector": db.distinct_sectors(), "subsector": db.distinct_subsectors(), "country": db.distinct_countries()}
+        return cls({kind: [name for name in values if isinstance(name, str)] for kind, values in names.items()})
+
+    def resolve(self, kind: str, name: str, limit: int = 5, query_vector=None) -> list:
+        return self.indexes[kind].resolve(name, limit, query_vector)
+
+    # True when name is neither an exact name nor an alias of kind, so
+    # resolving it may encode.
+    def needs_ranking(self, kind: str, name: str) -> bool:
+        index = self.indexes[kind]
+        key = fold(name)
+        return bool(key) and key not in index.exact and key not in index.aliases
+
+
+class ResolverStats:
+    """Lookups by how they matched, and their latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"exact": 0, "alias": 0, "fused": 0, "suggestion": 0, "unresolved": 0}
+        self.seconds = {"exact": 0.0, "alias": 0.0, "fused": 0.0, "suggestion": 0.0, "unresolved": 0.0}
+        self.builds = 0
+        self.build_seconds = 0.0
+
+    def record(self, match: str, seconds: float) -> None:
+        with self._lock:
+            self.counts[match] += 1
+            self.seconds[match] += seconds
+
+    def record_build(self, seconds: float) -> None:
+        with self._lock:
+            self.builds += 1
+            self.build_seconds = seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self.counts, builds=self.builds, last_build_seconds=self.build_seconds)
+            for match, count in self.counts.items():
+                result[f"{match}_mean_us"] = self.seconds[match] / count * 1e6 if count else 0.0
+            return result
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+
+resolver_stats = ResolverStats()
+metrics.registry.register_stats(
+    "resolver", "Entity name resolution.", resolver_stats.stats,
+    counters=("exact", "alias", "fused", "suggestion", "unresolved", "builds"),
+)
+
+_resolver = None
+_built_for = None
+_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return RESOLVER_ENABLED
+
+
+# The resolver for the current dataset version, built on first use and again
+# after each new load.
+def get_resolver() -> Resolver:
+    global _resolver, _built_for
+    version = dataset.current_version()
+    if _built_for != version:
+        with _lock:
+            if _built_for != version:
+                start = time.perf_counter()
+                _resolver = Resolver.load()
+                _built_for = version
+                resolver_stats.record_build(time.perf_counter() - start)
+    return _resolver
+
+
+def invalidate() -> None:
+    global _built_for
+    _built_for = None
+
+
+def _reset_after_fork() -> None:
+    global _lock
+    _lock = threading.Lock()
+    resolver_stats._reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# Ranked candidates for a name of kind ("sector", "subsector" or "country").
+# Only the ones whose match is not "suggestion" may be taken as the name.
+def resolve(kind: str, name: str, limit: int = 5, query_vector=None) -> list:
+    start = time.perf_counter()
+    candidates = get_resolver().resolve(kind, name, limit, query_vector)
+    resolver_stats.record(candidates[0].match if candidates else "unresolved", time.perf_counter() - start)
+    return candidates
+
+
+# The dataset's spelling of the best candidate, or None when no name is
+# close enough.
+def resolve_name(kind: str, name: str) -> Optional[str]:
+    candidates = resolve(kind, name, limit=1)
+    if candidates and candidates[0].match != "suggestion":
+        return candidates[0].name
+    return None
+
+
+# Names to offer when name does not resolve: the nearest ranked ones.
+def suggestions(kind: str, name: str, limit: int = 3) -> list:
+    candidates = get_resolver().resolve(kind, name, limit)
+    if not candidates or candidates[0].match != "suggestion":
+        return []
+    return [candidate.name for candidate in candidates]
+
+
+# resolve_name for several names; the ones that need ranking are encoded
+# together in one batch.
+def resolve_names(kind: str, names: list) -> list:
+    resolver = get_resolver()
+    pending = [name for name in names if resolver.semantic and resolver.needs_ranking(kind, name)]
+    if pending:
+        embedding_cache.get_or_compute_many(models.ENCODER_ID, [fold(name) for name in pending], models.encode)
+    return [resolve_name(kind, name) for name in names]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Resolve names against the loaded dataset.")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("names", nargs="+")
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+    get_resolver()
+    for name in args.names:
+        resolve(args.kind, name, args.limit)
+        start = time.perf_counter()
+        candidates = resolve(args.kind, name, args.limit)
+        elapsed = (time.perf_counter() - start) * 1e6
+        print(f"{name!r} ({elapsed:.0f} us):")
+        for candidate in candidates:
+            scores = "  ".join(
+                f"{label} {value:.3f}" for label, value in (
+                    ("rrf", candidate.score), ("overlap", candidate.overlap),
+                    ("spelling", candidate.spelling), ("cosine", candidate.similarity),
+                ) if value is not None
+            )
+            print(f"  {candidate.match:<10}  {candidate.name}  {scores}")
+        if not candidates:
+            print("  no candidates")
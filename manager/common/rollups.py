@@ -0,0 +1,238 @@
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import dataset, db
+
+# Per-subsector, per-sector and per-continent totals, computed once when data
+# is loaded and kept in a companion collection. The report and graph tools read
+# them from an in-memory copy instead of grouping the raw rows on every call.
+ROLLUPS_ENABLED = os.environ.get("ROLLUPS", "true").lower() in ("1", "true", "yes", "on")
+ROLLUP_COLLECTION = os.environ.get("ROLLUP_COLLECTION", f"{db.SECTOR_COLLECTION}_rollups")
+ROLLUP_CHANGE_STREAMS = os.environ.get("ROLLUP_CHANGE_STREAMS", "false").lower() in ("1", "true", "yes", "on")
+
+MEAN_FIELDS = ["Monthly_%_change"]
+SUM_FIELDS = ["Mar_2025_Total", "Prev_Month", "Mar_2024_Total", "2025_YTD", "2024_YTD", "2023_YTD", "2022_YTD", "2021_YTD"]
+
+# (level, source collection kind, grouping fields)
+LEVELS = {
+    "subsector": ("sector", ["Sector_name", "Subsector_Name"]),
+    "sector": ("sector", ["Sector_name"]),
+    "continent": ("country", ["Continent"]),
+}
+_META_ID = "meta"
+
+
+def get_rollup_collection():
+    return db.get_database()[ROLLUP_COLLECTION]
+
+
+def _source(kind: str):
+    return db.get_sector_collection() if kind == "sector" else db.get_country_collection()
+
+
+def _rollup_id(level: str, key: dict) -> str:
+    return "|".join([level] + [db.normalize_name(key[field]) for field in LEVELS[level][1]])
+
+
+def _group_pipeline(key_fields: list) -> list:
+    group = {"_id": {field: f"${field}" for field in key_fields}, "count": {"$sum": 1}}
+    for field in SUM_FIELDS:
+        group[field] = {"$sum": f"${field}"}
+    for field in MEAN_FIELDS:
+        # Kept as sum and count so that single rows can be added or removed.
+        group[f"{field}_sum"] = {"$sum": f"${field}"}
+        group[f"{field}_count"] = {"$sum": {"$cond": [{"$isNumber": f"${field}"}, 1, 0]}}
+    return [{"$group": group}]
+
+
+def _rollup_document(level: str, grouped: dict) -> dict:
+    key = grouped.pop("_id")
+    doc = {"_id": _rollup_id(level, key), "level": level, **key, **grouped}
+    for field in LEVELS[level][1]:
+        doc[f"{field}_norm"] = db.normalize_name(key[field])
+    return doc
+
+
+# Recomputes every rollup with server-side $group and swaps the result in with
+# a rename, so readers never see a half-built collection. Loaders call this
+# after a full load, tagged with the version they publish.
+def rebuild(version: str = None) -> int:
+    database = db.get_database()
+    staging = database[f"{ROLLUP_COLLECTION}_staging"]
+    staging.drop()
+    count = 0
+    for level, (kind, key_fields) in LEVELS.items():
+        docs = [_rollup_document(level, grouped) for grouped in _source(kind).aggregate(_group_pipeline(key_fields), allowDiskUse=True)]
+        if docs:
+            staging.insert_many(docs, ordered=False)
+            count += len(docs)
+    staging.insert_one({"_id": _META_ID, "level": "meta", "version": version or dataset.current_version(), "built_at": datetime.now(timezone.utc)})
+    staging.create_index([("level", 1), ("Sector_name_norm", 1)], name="level_sector")
+    staging.rename(ROLLUP_COLLECTION, dropTarget=True)
+    invalidate()
+    return count
+
+
+def _row_delta(doc: dict, sign: int) -> dict:
+    delta = {"count": sign}
+    for field in SUM_FIELDS:
+        value = doc.get(field)
+        if isinstance(value, (int, float)):
+            delta[field] = sign * value
+    for field in MEAN_FIELDS:
+        value = doc.get(field)
+        if isinstance(value, (int, float)):
+            delta[f"{field}_sum"] = sign * value
+            delta[f"{field}_count"] = sign
+    return delta
+
+
+# Applies changed source rows to the rollups with $inc instead of a rebuild.
+# before/after are the old and new versions of the changed documents (an
+# insert has no before, a delete no after). kind is "sector" or "country".
+def apply_changes(kind: str, before: list = (), after: list = ()) -> str:
+    from pymongo import DeleteMany, UpdateOne
+
+    collection = get_rollup_collection()
+    operations = []
+    for docs, sign in ((before, -1), (after, 1)):
+        for doc in docs:
+            for level, (level_kind, key_fields) in LEVELS.items():
+                if level_kind != kind or any(doc.get(field) is None for field in key_fields):
+                    continue
+                key = {field: doc[field] for field in key_fields}
+                norms = {f"{field}_norm": db.normalize_name(doc[field]) for field in key_fields}
+                operations.append(UpdateOne(
+                    {"_id": _rollup_id(level, key)},
+                    {"$inc": _row_delta(doc, sign), "$setOnInsert": {"level": level, **key, **norms}},
+                    upsert=True,
+                ))
+    if operations:
+        operations.append(DeleteMany({"level": {"$ne": "meta"}, "count": {"$lte": 0}}))
+        collection.bulk_write(operations, ordered=True)
+    # A new explicit version makes every process drop cached answers and
+    # reload the rollups, including for in-place edits that do not change
+    # the collection fingerprint.
+    version = dataset.publish_version()
+    collection.update_one({"_id": _META_ID}, {"$set": {"level": "meta", "version": version}}, upsert=True)
+    invalidate()
+    return version
+
+
+class Rollups:
+    """In-memory copy of the rollup collection, indexed by normalized name."""
+
+    def __init__(self, docs: list):
+        self.version = None
+        self.subsectors = {}
+        self.sectors = {}
+        self.continents = {}
+        for doc in docs:
+            level = doc.get("level")
+            if level == "meta":
+                self.version = doc.get("version")
+                continue
+            row = {key: value for key, value in doc.items() if key not in ("_id", "level") and not key.endswith("_norm")}
+            for field in MEAN_FIELDS:
+                count = row.pop(f"{field}_count", 0)
+                total = row.pop(f"{field}_sum", 0.0)
+                row[field] = total / count if count else None
+            if level == "subsector":
+                self.subsectors.setdefault(doc["Sector_name_norm"], []).append(row)
+            elif level == "sector":
+                self.sectors[doc["Sector_name_norm"]] = row
+            elif level == "continent":
+                self.continents[doc["Continent_norm"]] = row
+        for rows in self.subsectors.values():
+            rows.sort(key=lambda row: row["Subsector_Name"])
+
+    @classmethod
+    def load(cls) -> "Rollups":
+        return cls(list(get_rollup_collection().find({})))
+
+    # Per-subsector rows of a sector in subsector order, or None when the
+    # name is not a sector in the rollups.
+    def sector_subsectors(self, sector_name: str) -> Optional[list]:
+        return self.subsectors.get(db.normalize_name(sector_name))
+
+    def sector_total(self, sector_name: str) -> Optional[dict]:
+        return self.sectors.get(db.normalize_name(sector_name))
+
+    def continent_total(self, continent: str) -> Optional[dict]:
+        return self.continents.get(db.normalize_name(continent))
+
+
+_rollups = None
+_loaded_for = None
+_lock = threading.Lock()
+_warned = False
+_watcher = None
+
+
+# Returns the rollups for the current dataset version, or None when they are
+# disabled, not built, or built for a different version than the data that is
+# loaded now (callers then aggregate the raw rows as before).
+def get_rollups() -> Optional[Rollups]:
+    global _rollups, _loaded_for, _warned
+    if not ROLLUPS_ENABLED:
+        return None
+    if ROLLUP_CHANGE_STREAMS and _watcher is None:
+        start_change_stream_watcher()
+    version = dataset.current_version()
+    if _loaded_for != version:
+        with _lock:
+            if _loaded_for != version:
+                rollups = Rollups.load()
+                _rollups = rollups if rollups.version == version else None
+                _loaded_for = version
+                if _rollups is None and not _warned:
+                    _warned = True
+                    print(f"Rollups in {ROLLUP_COLLECTION} are missing or out of date; run `python -m manager.common.rollups`.")
+    return _rollups
+
+
+def invalidate() -> None:
+    global _loaded_for
+    _loaded_for = None
+    dataset.invalidate()
+
+
+def _watch(kind: str) -> None:
+    collection = _source(kind)
+    while True:
+        try:
+            # Pre-images need changeStreamPreAndPostImages on the collection;
+            # without one an update or delete falls back to a rebuild.
+            with collection.watch(full_document="updateLookup", full_document_before_change="whenAvailable") as stream:
+                for change in stream:
+                    before = change.get("fullDocumentBeforeChange")
+                    after = change.get("fullDocument")
+                    if change["operationType"] in ("update", "replace", "delete") and before is None:
+                        rebuild()
+                    else:
+                        apply_changes(kind, [before] if before else [], [after] if after else [])
+        except Exception as e:
+            print(f"Rollup change stream on {collection.name} stopped: {e}")
+            time.sleep(30)
+
+
+def start_change_stream_watcher() -> None:
+    global _watcher
+    with _lock:
+        if _watcher is not None:
+            return
+        _watcher = []
+        for kind in ("sector", "country"):
+            thread = threading.Thread(target=_watch, args=(kind,), name=f"rollup-watch-{kind}", daemon=True)
+            thread.start()
+            _watcher.append(thread)
+
+
+if __name__ == "__main__":
+    print(f"Wrote {rebuild()} rollups to {ROLLUP_COLLECTION}")
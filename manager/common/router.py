@@ -0,0 +1,426 @@
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import aio, dataset, db, models
+from .embedding_cache import embedding_cache
+from .snapshot import get_snapshot
+
+# Routes plain requests ("report for France", "list the sectors") without an
+# LLM turn. The manager delegates straight to the sub-agent, and the sub-agent
+# calls the tool straight away; only its final answer goes through the model.
+# Anything the router is not confident about goes to the LLM as before.
+#
+#   ROUTER=on      route confident requests, fall back to the LLM otherwise
+#   ROUTER=shadow  only compute the route and compare it with the LLM's choice
+#   ROUTER=off     disabled, and no request is encoded (the default)
+#
+# Shadow mode pays an encode per manager turn without saving an LLM turn, so
+# it is only worth running while measuring. Turn dispatch on once the shadow
+# accuracy in /router/stats and benchmarks.bench_router with the deployed
+# encoder support ROUTER_THRESHOLD and ROUTER_MARGIN.
+ROUTER_MODE = os.environ.get("ROUTER", "off").lower()
+# Minimum cosine similarity between the request and an intent's exemplars.
+ROUTER_THRESHOLD = float(os.environ.get("ROUTER_THRESHOLD", "0.6"))
+# Minimum lead of the best intent over the best intent of another target.
+ROUTER_MARGIN = float(os.environ.get("ROUTER_MARGIN", "0.05"))
+
+MANAGER = "manager"
+SECTOR_AGENT = "CO2_Emission_analysis_sector_agent"
+COUNTRY_AGENT = "CO2_Emission_analysis_country_agent"
+NEWS_TOOL = "news_analyst"
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    # Sub-agent to delegate to, or None for a tool of the manager.
+    agent: Optional[str]
+    # Tool to call directly, or None to let the sub-agent choose.
+    tool: Optional[str]
+    # Entity the tool needs: "sector", "country", "sectors" (two or more) or
+    # "text" (the request itself).
+    needs: Optional[str]
+    exemplars: tuple
+
+
+# Exemplars are written with the words "sector" and "country" where a name
+# would go; recognised names in a request are replaced the same way before it
+# is encoded, so the match is on what is asked rather than on which entity.
+INTENTS = (
+    Intent("sector_list", SECTOR_AGENT, "get_sector_list", None, (
+        "list sectors", "list all the sectors", "which sectors are in the dataset",
+        "what sectors do you have", "show me the sector list", "give me the list of sectors",
+    )),
+    Intent("sector_report", SECTOR_AGENT, "get_sector_report", "sector", (
+        "report for sector", "sector report", "give me a report on sector",
+        "show the sector emissions report", "emissions of the sector", "how much does sector emit",
+        "subsector breakdown for sector",
+    )),
+    Intent("sector_trend", SECTOR_AGENT, "get_sector_trend", "sector", (
+        "sector emissions trend", "how have sector emissions changed over time",
+        "monthly emissions for sector", "month over month change for sector",
+        "year over year change in sector emissions",
+    )),
+    Intent("sector_graph", SECTOR_AGENT, None, "sector", (
+        "plot sector emissions", "graph of sector", "draw a chart for sector",
+        "show me a graph report for sector",
+    )),
+    Intent("sector_compare", SECTOR_AGENT, "compare_sectors_many", "sectors", (
+        "compare sector and sector", "sector vs sector", "compare sector with sector",
+        "difference between sector and sector emissions",
+    )),
+    Intent("similar_sectors", SECTOR_AGENT, "find_similar_sectors", "text", (
+        "find similar sectors", "which sectors are similar to", "sectors like",
+        "search for sectors related to",
+    )),
+    Intent("country_list", COUNTRY_AGENT, "find_country_list", None, (
+        "list countries", "list all the countries", "which countries are in the dataset",
+        "what countries do you have", "show me the country list", "give me the list of countries",
+    )),
+    Intent("country_report", COUNTRY_AGENT, "get_country_report", "country", (
+        "report for country", "country report", "give me a report on country",
+        "emissions of country", "how much does country emit", "show country emissions data",
+    )),
+    Intent("country_trend", COUNTRY_AGENT, "get_country_trend", "country", (
+        "country emissions trend", "how have country emissions changed over time",
+        "monthly emissions for country", "month over month change for country",
+        "year over year change in country emissions",
+    )),
+    Intent("country_plot", COUNTRY_AGENT, "plot_emissions_trend", "country", (
+        "plot country emissions", "graph of country emissions", "draw a chart for country",
+        "plot the emissions trend for country",
+    )),
+    Intent("country_rank", COUNTRY_AGENT, None, None, (
+        "top 10 emitting countries", "which countries emit the most", "rank countries by emissions",
+        "countries with the lowest emissions", "biggest emitters in 2025",
+    )),
+    Intent("continent_summary", COUNTRY_AGENT, "continent_summary", None, (
+        "continent totals", "emissions by continent", "summary per continent",
+        "which continent emits the most", "compare continents",
+    )),
+    Intent("subsector_rank", SECTOR_AGENT, None, None, (
+        "top subsectors by emissions", "which subsectors emit the most", "rank subsectors",
+        "largest subsectors in sector",
+    )),
+    Intent("news", None, NEWS_TOOL, "text", (
+        "latest news on", "what is in the news about", "news articles about",
+        "find recent news about climate", "search the news for",
+    )),
+)
+
+
+@dataclass
+class Route:
+    intent: str
+    agent: Optional[str]
+    tool: Optional[str]
+    args: dict
+    score: float
+    margin: float
+    entities: list = field(default_factory=list)
+
+    # The manager's target: a sub-agent or the news tool.
+    @property
+    def target(self) -> str:
+        return self.agent or self.tool
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class EntityDictionary:
+    """Sector and country names, matched as whole words in a request."""
+
+    def __init__(self, sectors: list, countries: list):
+        self.names = {}
+        for kind, names in (("sector", sectors), ("country", countries)):
+            for name in names:
+                self.names.setdefault(db.normalize_name(name), (kind, name))
+        self.max_words = max((len(name.split()) for name in self.names), default=1)
+
+    @classmethod
+    def load(cls) -> "EntityDictionary":
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            return cls(snapshot.sectors.categories['Sector_name'], snapshot.countries.categories['Country'])
+        return cls(db.distinct_sectors(), db.distinct_countries())
+
+    # Longest non-overlapping matches as (kind, name), and the request with
+    # each match replaced by its kind.
+    def find(self, text: str):
+        words = [word.strip(".-'") for word in re.findall(r"[\w'&.-]+", text.lower())]
+        found = []
+        masked = []
+        i = 0
+        while i < len(words):
+            for size in range(min(self.max_words, len(words) - i), 0, -1):
+                match = self.names.get(" ".join(words[i:i + size]))
+                if match is not None:
+                    found.append(match)
+                    masked.append(match[0])
+                    i += size
+                    break
+            else:
+                masked.append(words[i])
+                i += 1
+        return found, " ".join(masked)
+
+
+class RouterStats:
+    """Routing decisions, latency, and agreement with the LLM in shadow mode."""
+
+    def __init__(self, latencies: int = 1000):
+        self._lock = threading.Lock()
+        self.decisions = {}
+        self.intents = {}
+        self.fallbacks = {}
+        self.agree = 0
+        self.disagree = 0
+        self.confusion = {}
+        self._latencies = deque(maxlen=latencies)
+
+    def record(self, decision: str, route: Optional[Route], reason: str, seconds: float) -> None:
+        with self._lock:
+            self.decisions[decision] = self.decisions.get(decision, 0) + 1
+            if route is not None:
+                self.intents[route.intent] = self.intents.get(route.intent, 0) + 1
+            if reason:
+                self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+            self._latencies.append(seconds)
+
+    # Compares a route with the target the LLM chose for the same request.
+    def record_outcome(self, predicted: str, actual: str) -> None:
+        with self._lock:
+            if predicted == actual:
+                self.agree += 1
+            else:
+                self.disagree += 1
+            key = f"{predicted}->{actual}"
+            self.confusion[key] = self.confusion.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+            compared = self.agree + self.disagree
+            total = sum(self.decisions.values())
+            return {
+                "mode": ROUTER_MODE,
+                "threshold": ROUTER_THRESHOLD,
+                "margin": ROUTER_MARGIN,
+                "requests": total,
+                "decisions": dict(self.decisions),
+                "fast_path_rate": (total - self.decisions.get("llm", 0)) / total if total else 0.0,
+                "intents": dict(self.intents),
+                "fallbacks": dict(self.fallbacks),
+                "latency_ms": {
+                    "p50": float(np.percentile(latencies, 50)) if latencies.size else 0.0,
+                    "p95": float(np.percentile(latencies, 95)) if latencies.size else 0.0,
+                    "max": float(latencies.max()) if latencies.size else 0.0,
+                },
+                "shadow": {
+                    "compared": compared,
+                    "accuracy": self.agree / compared if compared else None,
+                    "confusion": dict(self.confusion),
+                },
+            }
+
+
+class Router:
+    """Scores a request against the intent exemplars with the shared encoder."""
+
+    def __init__(self, intents: tuple = INTENTS, threshold: float = None, margin: float = None):
+        self.intents = intents
+        self.threshold = ROUTER_THRESHOLD if threshold is None else threshold
+        self.margin = ROUTER_MARGIN if margin is None else margin
+        self._exemplars = None
+        self._owners = None
+        self._entities = None
+        self._entities_for = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        if self._exemplars is None:
+            with self._lock:
+                if self._exemplars is None:
+                    texts = [text for intent in self.intents for text in intent.exemplars]
+                    self._owners = np.array([i for i, intent in enumerate(self.intents) for _ in intent.exemplars])
+                    self._exemplars = _unit(models.encode(texts))
+        version = dataset.current_version()
+        if self._entities_for != version:
+            with self._lock:
+                if self._entities_for != version:
+                    self._entities = EntityDictionary.load()
+                    self._entities_for = version
+
+    # The unit vector of the request with each sector and country name
+    # replaced by its kind, the names found as (kind, name), and the masked
+    # request.
+    def embed(self, text: str):
+        self._load()
+        entities, masked = self._entities.find(text)
+        return _unit(embedding_cache.get_or_compute(models.ENCODER_ID, masked, models.encode))[0], entities, masked
+
+    # Best score of every intent for an embedded request.
+    def score_vector(self, query: np.ndarray) -> np.ndarray:
+        similarities = self._exemplars @ query
+        scores = np.full(len(self.intents), -1.0)
+        np.maximum.at(scores, self._owners, similarities)
+        return scores
+
+    # Best score of every intent for the request, and the entities found in it.
+    def score(self, text: str):
+        query, entities, _ = self.embed(text)
+        return self.score_vector(query), entities
+
+    # The route for a request, or (None, reason) when it should go to the LLM.
+    def route(self, text: str):
+        scores, entities = self.score(text)
+        order = np.argsort(scores)[::-1]
+        best = self.intents[order[0]]
+        target = best.agent or best.tool
+        runner_up = next((scores[i] for i in order[1:] if (self.intents[i].agent or self.intents[i].tool) != target), -1.0)
+        score, margin = float(scores[order[0]]), float(scores[order[0]] - runner_up)
+        if score < self.threshold:
+            return None, "low_score"
+        if margin < self.margin:
+            return None, "ambiguous"
+        kinds = {kind for kind, _ in entities}
+        agent_kind = {SECTOR_AGENT: "sector", COUNTRY_AGENT: "country"}.get(best.agent)
+        if agent_kind is not None and kinds - {agent_kind}:
+            # A country named in a sector request, or the other way round.
+            return None, "entity_conflict"
+        names = [name for kind, name in entities if kind == agent_kind]
+        tool, args = best.tool, {}
+        if best.needs in ("sector", "country"):
+            if len(names) == 1:
+                args = {"sector_name" if best.needs == "sector" else "country": names[0]}
+            else:
+                tool = None
+        elif best.needs == "sectors":
+            if len(names) >= 2:
+                args = {"sectors": names}
+            else:
+                tool = None
+        elif best.needs == "text":
+            args = {"request": text} if best.tool == NEWS_TOOL else {"query": text}
+        if best.agent is None and tool is None:
+            return None, "missing_entity"
+        return Route(best.name, best.agent, tool, args, score, margin, entities), ""
+
+
+router = Router()
+router_stats = RouterStats()
+
+# Routes decided by the manager, waiting for the sub-agent's first model call
+# in the same invocation.
+_pending = OrderedDict()
+_pending_lock = threading.Lock()
+
+
+def _remember(invocation_id: str, route: Route) -> None:
+    with _pending_lock:
+        _pending[invocation_id] = route
+        while len(_pending) > 1000:
+            _pending.popitem(last=False)
+
+
+def _take(invocation_id: str) -> Optional[Route]:
+    with _pending_lock:
+        return _pending.pop(invocation_id, None)
+
+
+# The text of the user's message when the request is the first model call for
+# it, i.e. no tool has run yet in this turn.
+def _user_text(llm_request) -> Optional[str]:
+    if not llm_request.contents:
+        return None
+    content = llm_request.contents[-1]
+    if content.role != "user" or not content.parts:
+        return None
+    if any(part.function_response is not None for part in content.parts):
+        return None
+    text = " ".join(part.text for part in content.parts if part.text).strip()
+    return text or None
+
+
+def _function_call(name: str, args: dict):
+    from google.adk.models import LlmResponse
+    from google.genai import types
+
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name=name, args=args))]))
+
+
+# before_model_callback of the manager. Returns a transfer (or a news_analyst
+# call) in place of the LLM's routing turn when the route is confident.
+# Routing may encode and probe the dataset version, so it runs on the encode
+# pool rather than on the event loop.
+async def route_manager_request(callback_context, llm_request):
+    if ROUTER_MODE not in ("on", "shadow"):
+        return None
+    text = _user_text(llm_request)
+    if text is None:
+        return None
+    start = time.perf_counter()
+    try:
+        route, reason = await aio.run_blocking("encode", router.route, text)
+    except Exception as e:
+        # The router is an optimization; the LLM can always route.
+        route, reason = None, f"error:{type(e).__name__}"
+    seconds = time.perf_counter() - start
+    if route is None:
+        router_stats.record("llm", None, reason, seconds)
+        return None
+    if ROUTER_MODE == "shadow":
+        router_stats.record("shadow", route, "", seconds)
+        _remember(callback_context.invocation_id, route)
+        return None
+    router_stats.record("tool" if route.tool else "agent", route, "", seconds)
+    if route.agent is None:
+        return _function_call(route.tool, route.args)
+    if route.tool is not None:
+        _remember(callback_context.invocation_id, route)
+    return _function_call("transfer_to_agent", {"agent_name": route.agent})
+
+
+# after_model_callback of the manager in shadow mode: compares the route with
+# the LLM's own delegation for the same request.
+def record_manager_choice(callback_context, llm_response):
+    if ROUTER_MODE != "shadow" or llm_response.content is None or llm_response.partial:
+        return None
+    route = _take(callback_context.invocation_id)
+    if route is None:
+        return None
+    # A reply without a function call means the manager answered itself.
+    actual = MANAGER
+    for part in llm_response.content.parts or []:
+        call = part.function_call
+        if call is not None:
+            actual = call.args.get("agent_name") if call.name == "transfer_to_agent" else call.name
+            break
+    router_stats.record_outcome(route.target, actual)
+    return None
+
+
+# before_model_callback of the sub-agents: calls the routed tool instead of
+# asking the LLM which tool to use.
+def route_sub_agent_request(callback_context, llm_request):
+    if ROUTER_MODE != "on":
+        return None
+    with _pending_lock:
+        route = _pending.get(callback_context.invocation_id)
+        if route is None or route.agent != callback_context.agent_name:
+            return None
+        del _pending[callback_context.invocation_id]
+    return _function_call(route.tool, route.args)
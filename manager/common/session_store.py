@@ -0,0 +1,592 @@
+import abc
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events.event import Event
+from google.adk.sessions import _session_util
+from google.adk.sessions.base_session_service import BaseSessionService, GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.session import Session
+from google.adk.sessions.state import State
+
+from . import aio, db, metrics
+
+
+# Where the server keeps conversations. "local" (the default) leaves ADK's
+# session service in place (a SQLite file per agent under .adk/), "mongo"
+# stores them in MONGO_DB_NAME through the shared client and "sqlite" in
+# SESSION_SQLITE_PATH. With "mongo" or "sqlite" any worker or replica can
+# serve any session; both are opt-in, since "mongo" writes into the emissions
+# database.
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "local").lower()
+SESSION_SQLITE_PATH = os.environ.get("SESSION_SQLITE_PATH", ".sessions.db")
+SESSIONS_COLLECTION = os.environ.get("SESSIONS_COLLECTION", "agent_sessions")
+SESSION_EVENTS_COLLECTION = os.environ.get("SESSION_EVENTS_COLLECTION", "agent_session_events")
+SESSION_STATE_COLLECTION = os.environ.get("SESSION_STATE_COLLECTION", "agent_session_state")
+# Sessions not updated for this long are deleted with their events. 0 keeps
+# them forever.
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", str(30 * 24 * 3600)))
+# Events are buffered per session and written as one chunk when the turn
+# ends, when this many are waiting, or SESSION_FLUSH_MS after the first one.
+SESSION_BATCH_SIZE = int(os.environ.get("SESSION_BATCH_SIZE", "32"))
+SESSION_FLUSH_MS = int(os.environ.get("SESSION_FLUSH_MS", "500"))
+# Chunks at least this large are stored zlib-compressed.
+SESSION_COMPRESS_MIN_BYTES = int(os.environ.get("SESSION_COMPRESS_MIN_BYTES", "512"))
+# How often the sqlite store deletes expired sessions; Mongo uses TTL indexes.
+SESSION_PURGE_SECONDS = int(os.environ.get("SESSION_PURGE_SECONDS", "300"))
+
+# Registered with ADK's service registry; main.py passes e.g. "co2-sessions://mongo".
+URI_SCHEME = "co2-sessions"
+BACKENDS = ("mongo", "sqlite", "local")
+
+
+# Events as JSON without None and default-valued fields, which drops the
+# empty action maps every event carries: about a tenth of model_dump_json().
+def encode_events(events: list) -> tuple:
+    payload = json.dumps(
+        [event.model_dump(mode="json", exclude_none=True, exclude_defaults=True) for event in events],
+        separators=(",", ":"),
+    ).encode()
+    if len(payload) >= SESSION_COMPRESS_MIN_BYTES:
+        return zlib.compress(payload), True, len(payload)
+    return payload, False, len(payload)
+
+
+def decode_events(data: bytes, compressed: bool) -> list:
+    payload = zlib.decompress(data) if compressed else data
+    return [Event.model_validate(item) for item in json.loads(payload)]
+
+
+def _dumps(state: dict) -> str:
+    return json.dumps(_session_util.make_json_safe_state(state), separators=(",", ":"))
+
+
+def _expires_at(now: float) -> Optional[float]:
+    return now + SESSION_TTL_SECONDS if SESSION_TTL_SECONDS > 0 else None
+
+
+class SessionStore(abc.ABC):
+    """Storage of sessions, event chunks and app/user state. Methods block
+    and are called on the IO thread pool."""
+
+    @abc.abstractmethod
+    def create(self, app_name: str, user_id: str, session_id: str, state: dict, now: float) -> None:
+        ...
+
+    # The session row ({"state", "updated"}) and its chunks, oldest first, as
+    # (compressed, data) pairs. Chunks ending before after are skipped.
+    @abc.abstractmethod
+    def load(self, app_name: str, user_id: str, session_id: str, after: Optional[float] = None):
+        ...
+
+    @abc.abstractmethod
+    def write(self, app_name: str, user_id: str, session_id: str, state: dict, updated: float, chunk: Optional[dict]) -> None:
+        ...
+
+    @abc.abstractmethod
+    def list(self, app_name: str, user_id: Optional[str]) -> list:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, app_name: str, user_id: str, session_id: str) -> None:
+        ...
+
+    # App state is stored under the user id "".
+    @abc.abstractmethod
+    def get_state(self, app_name: str, user_id: str) -> dict:
+        ...
+
+    @abc.abstractmethod
+    def merge_state(self, app_name: str, user_id: str, delta: dict) -> None:
+        ...
+
+
+class MongoSessionStore(SessionStore):
+    """Sessions in MONGO_DB_NAME through the pooled client. Expiry is left to
+    TTL indexes on expires_at."""
+
+    def __init__(self):
+        self._indexed = False
+        self._lock = threading.Lock()
+
+    def _collections(self):
+        database = db.get_database()
+        sessions = database[SESSIONS_COLLECTION]
+        events = database[SESSION_EVENTS_COLLECTION]
+        states = database[SESSION_STATE_COLLECTION]
+        if not self._indexed:
+            with self._lock:
+                if not self._indexed:
+                    self.ensure_indexes(sessions, events, states)
+                    self._indexed = True
+        return sessions, events, states
+
+    @staticmethod
+    def ensure_indexes(sessions, events, states) -> None:
+        sessions.create_index([("app_name", 1), ("user_id", 1), ("session_id", 1)], name="app_user_session", unique=True)
+        sessions.create_index([("app_name", 1), ("user_id", 1), ("updated", 1)], name="app_user_updated")
+        events.create_index([("app_name", 1), ("user_id", 1), ("session_id", 1), ("ts_last", 1)], name="app_user_session_ts")
+        states.create_index([("app_name", 1), ("user_id", 1)], name="app_user", unique=True)
+        if SESSION_TTL_SECONDS > 0:
+            sessions.create_index("expires_at", name="ttl", expireAfterSeconds=0)
+            events.create_index("expires_at", name="ttl", expireAfterSeconds=0)
+
+    @staticmethod
+    def _key(app_name: str, user_id: str, session_id: str) -> dict:
+        return {"app_name": app_name, "user_id": user_id, "session_id": session_id}
+
+    # TTL indexes need a BSON date; pymongo reads dates back as naive UTC.
+    @staticmethod
+    def _date(now: float):
+        expires = _expires_at(now)
+        return None if expires is None else datetime.fromtimestamp(expires, timezone.utc).replace(tzinfo=None)
+
+    def _live(self) -> dict:
+        if SESSION_TTL_SECONDS <= 0:
+            return {}
+        return {"$or": [{"expires_at": {"$gt": datetime.now(timezone.utc).replace(tzinfo=None)}}, {"expires_at": None}]}
+
+    def create(self, app_name, user_id, session_id, state, now):
+        from pymongo.errors import DuplicateKeyError
+
+        sessions, events, _ = self._collections()
+        key = self._key(app_name, user_id, session_id)
+        # An expired session that the TTL monitor has not removed yet is
+        # replaced, not reported as a duplicate.
+        sessions.delete_one(dict(key, expires_at={"$lte": datetime.now(timezone.utc).replace(tzinfo=None)}))
+        try:
+            sessions.insert_one(dict(key, state=_dumps(state), created=now, updated=now, expires_at=self._date(now)))
+        except DuplicateKeyError:
+            raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+        events.delete_many(key)
+
+    def load(self, app_name, user_id, session_id, after=None):
+        sessions, events, _ = self._collections()
+        key = self._key(app_name, user_id, session_id)
+        row = sessions.find_one(dict(key, **self._live()), {"_id": 0, "state": 1, "updated": 1})
+        if row is None:
+            return None
+        query = dict(key)
+        if after is not None:
+            query["ts_last"] = {"$gte": after}
+        chunks = events.find(query, {"_id": 0, "z": 1, "data": 1}).sort([("ts", 1)])
+        return {"state": json.loads(row["state"]), "updated": row["updated"]}, [(chunk["z"], bytes(chunk["data"])) for chunk in chunks]
+
+    def write(self, app_name, user_id, session_id, state, updated, chunk):
+        from bson import Binary
+
+        sessions, events, _ = self._collections()
+        key = self._key(app_name, user_id, session_id)
+        expires_at = self._date(updated)
+        sessions.update_one(key, {"$set": {"state": _dumps(state), "updated": updated, "expires_at": expires_at}})
+        if chunk is not None:
+            events.insert_one(dict(key, **dict(chunk, data=Binary(chunk["data"])), expires_at=expires_at))
+        if expires_at is not None:
+            # The session's chunks live as long as the session does.
+            events.update_many(key, {"$set": {"expires_at": expires_at}})
+
+    def list(self, app_name, user_id):
+        sessions, _, _ = self._collections()
+        query = {"app_name": app_name, **self._live()}
+        if user_id is not None:
+            query["user_id"] = user_id
+        cursor = sessions.find(query, {"_id": 0, "user_id": 1, "session_id": 1, "state": 1, "updated": 1}).sort([("updated", 1)])
+        return [{"user_id": row["user_id"], "id": row["session_id"], "state": json.loads(row["state"]), "updated": row["updated"]} for row in cursor]
+
+    def delete(self, app_name, user_id, session_id):
+        sessions, events, _ = self._collections()
+        key = self._key(app_name, user_id, session_id)
+        sessions.delete_one(key)
+        events.delete_many(key)
+
+    def get_state(self, app_name, user_id):
+        _, _, states = self._collections()
+        row = states.find_one({"app_name": app_name, "user_id": user_id}, {"_id": 0, "state": 1})
+        return json.loads(row["state"]) if row else {}
+
+    def merge_state(self, app_name, user_id, delta):
+        _, _, states = self._collections()
+        state = self.get_state(app_name, user_id)
+        state.update(delta)
+        states.update_one({"app_name": app_name, "user_id": user_id}, {"$set": {"state": _dumps(state)}}, upsert=True)
+
+
+class SqliteSessionStore(SessionStore):
+    """Sessions in a local SQLite file in WAL mode, which lets the workers of
+    one host share it. Expired rows are deleted every SESSION_PURGE_SECONDS."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        app_name TEXT NOT NULL, user_id TEXT NOT NULL, session_id TEXT NOT NULL,
+        state TEXT NOT NULL, created REAL NOT NULL, updated REAL NOT NULL, expires_at REAL,
+        PRIMARY KEY (app_name, user_id, session_id));
+    CREATE INDEX IF NOT EXISTS sessions_app_user_updated ON sessions (app_name, user_id, updated);
+    CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+    CREATE TABLE IF NOT EXISTS session_events (
+        app_name TEXT NOT NULL, user_id TEXT NOT NULL, session_id TEXT NOT NULL,
+        ts REAL NOT NULL, ts_last REAL NOT NULL, count INTEGER NOT NULL, z INTEGER NOT NULL, data BLOB NOT NULL);
+    CREATE INDEX IF NOT EXISTS session_events_app_user_session_ts ON session_events (app_name, user_id, session_id, ts_last);
+    CREATE TABLE IF NOT EXISTS session_state (
+        app_name TEXT NOT NULL, user_id TEXT NOT NULL, state TEXT NOT NULL,
+        PRIMARY KEY (app_name, user_id));
+    """
+
+    def __init__(self, path: str = SESSION_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._purged_at = 0.0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        connection.executescript(self.SCHEMA)
+        connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # One connection per IO thread.
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def _purge(self, connection, now: float) -> None:
+        if now - self._purged_at < SESSION_PURGE_SECONDS:
+            return
+        self._purged_at = now
+        expired = "SELECT app_name, user_id, session_id FROM sessions WHERE expires_at <= ?"
+        with connection:
+            connection.execute(f"DELETE FROM session_events WHERE (app_name, user_id, session_id) IN ({expired})", (now,))
+            connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+    def create(self, app_name, user_id, session_id, state, now):
+        connection = self._connection()
+        self._purge(connection, now)
+        key = (app_name, user_id, session_id)
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT expires_at FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", key
+            ).fetchone()
+            if row is not None and (row[0] is None or row[0] > now):
+                raise AlreadyExistsError(f"Session with id {session_id} already exists.")
+            connection.execute("DELETE FROM session_events WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key + (_dumps(state), now, now, _expires_at(now)),
+            )
+
+    def load(self, app_name, user_id, session_id, after=None):
+        connection = self._connection()
+        key = (app_name, user_id, session_id)
+        row = connection.execute(
+            "SELECT state, updated FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?"
+            " AND (expires_at IS NULL OR expires_at > ?)",
+            key + (time.time(),),
+        ).fetchone()
+        if row is None:
+            return None
+        chunks = connection.execute(
+            "SELECT z, data FROM session_events WHERE app_name = ? AND user_id = ? AND session_id = ? AND ts_last >= ?"
+            " ORDER BY ts",
+            key + (after if after is not None else float("-inf"),),
+        ).fetchall()
+        return {"state": json.loads(row[0]), "updated": row[1]}, [(bool(z), data) for z, data in chunks]
+
+    def write(self, app_name, user_id, session_id, state, updated, chunk):
+        connection = self._connection()
+        self._purge(connection, time.time())
+        key = (app_name, user_id, session_id)
+        with connection:
+            connection.execute(
+                "UPDATE sessions SET state = ?, updated = ?, expires_at = ? WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                (_dumps(state), updated, _expires_at(updated)) + key,
+            )
+            if chunk is not None:
+                connection.execute(
+                    "INSERT INTO session_events VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    key + (chunk["ts"], chunk["ts_last"], chunk["count"], int(chunk["z"]), chunk["data"]),
+                )
+
+    def list(self, app_name, user_id):
+        query = "SELECT user_id, session_id, state, updated FROM sessions WHERE app_name = ? AND (expires_at IS NULL OR expires_at > ?)"
+        params = (app_name, time.time())
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params += (user_id,)
+        rows = self._connection().execute(query + " ORDER BY updated", params).fetchall()
+        return [{"user_id": row[0], "id": row[1], "state": json.loads(row[2]), "updated": row[3]} for row in rows]
+
+    def delete(self, app_name, user_id, session_id):
+        key = (app_name, user_id, session_id)
+        with self._connection() as connection:
+            connection.execute("DELETE FROM session_events WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+            connection.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+
+    def get_state(self, app_name, user_id):
+        row = self._connection().execute(
+            "SELECT state FROM session_state WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def merge_state(self, app_name, user_id, delta):
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            state = self.get_state(app_name, user_id)
+            state.update(delta)
+            connection.execute("INSERT OR REPLACE INTO session_state VALUES (?, ?, ?)", (app_name, user_id, _dumps(state)))
+
+
+def create_store(backend: str = None) -> SessionStore:
+    backend = backend or SESSION_BACKEND
+    if backend == "mongo":
+        return MongoSessionStore()
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    raise RuntimeError(f"Unknown session backend: {backend}")
+
+
+class _Pending:
+    def __init__(self, session: Session):
+        self.session = session
+        self.events = []
+        self.app_delta = {}
+        self.user_delta = {}
+        self.timer = None
+
+
+class StoreSessionService(BaseSessionService):
+    """ADK session service over a SessionStore. Appended events are buffered
+    per session and written as one compressed chunk, together with the
+    session state, when the turn ends."""
+
+    def __init__(self, store: SessionStore, batch_size: int = SESSION_BATCH_SIZE, flush_ms: int = SESSION_FLUSH_MS):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self._pending = {}
+        # One lock per session being flushed, so chunks of a session are
+        # written in order and a read waits for a write in progress.
+        self._locks = weakref.WeakValueDictionary()
+        self._tasks = set()
+        self._stats_lock = threading.Lock()
+        self.appended = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.events_written = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.loads = 0
+
+    def _lock(self, key) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    async def create_session(self, *, app_name: str, user_id: str, state: Optional[dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> Session:
+        session_id = (session_id or "").strip() or str(uuid.uuid4())
+        deltas = _session_util.extract_state_delta(state or {})
+        now = time.time()
+        await aio.run_blocking("io", self.store.create, app_name, user_id, session_id, deltas["session"], now)
+        if deltas["app"]:
+            await aio.run_blocking("io", self.store.merge_state, app_name, "", deltas["app"])
+        if deltas["user"]:
+            await aio.run_blocking("io", self.store.merge_state, app_name, user_id, deltas["user"])
+        session = Session(app_name=app_name, user_id=user_id, id=session_id, state=deltas["session"], last_update_time=now)
+        return await self._merge_state(session)
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                          config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        session_id = session_id.strip() if session_id else session_id
+        key = (app_name, user_id, session_id)
+        await self._flush(key)
+        after = config.after_timestamp if config else None
+        loaded = await aio.run_blocking("io", self.store.load, app_name, user_id, session_id, after)
+        if loaded is None:
+            return None
+        row, chunks = loaded
+        events = [event for compressed, data in chunks for event in decode_events(data, compressed)]
+        with self._stats_lock:
+            self.loads += 1
+        if after is not None:
+            events = [event for event in events if event.timestamp >= after]
+        if config and config.num_recent_events is not None:
+            events = events[-config.num_recent_events:] if config.num_recent_events else []
+        session = Session(app_name=app_name, user_id=user_id, id=session_id, state=row["state"],
+                          events=events, last_update_time=row["updated"])
+        return await self._merge_state(session)
+
+    async def _merge_state(self, session: Session) -> Session:
+        app_state = await aio.run_blocking("io", self.store.get_state, session.app_name, "")
+        user_state = await aio.run_blocking("io", self.store.get_state, session.app_name, session.user_id)
+        for key, value in app_state.items():
+            session.state[State.APP_PREFIX + key] = value
+        for key, value in user_state.items():
+            session.state[State.USER_PREFIX + key] = value
+        return session
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        rows = await aio.run_blocking("io", self.store.list, app_name, user_id)
+        sessions = []
+        for row in rows:
+            session = Session(app_name=app_name, user_id=row["user_id"], id=row["id"], state=row["state"],
+                              last_update_time=row["updated"])
+            sessions.append(await self._merge_state(session))
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        session_id = session_id.strip() if session_id else session_id
+        key = (app_name, user_id, session_id)
+        async with self._lock(key):
+            pending = self._pending.pop(key, None)
+            if pending is not None and pending.timer is not None:
+                pending.timer.cancel()
+            await aio.run_blocking("io", self.store.delete, app_name, user_id, session_id)
+
+    async def get_user_state(self, *, app_name: str, user_id: str) -> dict[str, Any]:
+        return await aio.run_blocking("io", self.store.get_state, app_name, user_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+        key = (session.app_name, session.user_id, session.id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _Pending(session)
+        pending.session = session
+        pending.events.append(event)
+        if event.actions and event.actions.state_delta:
+            deltas = _session_util.extract_state_delta(event.actions.state_delta)
+            pending.app_delta.update(deltas["app"])
+            pending.user_delta.update(deltas["user"])
+        with self._stats_lock:
+            self.appended += 1
+        # The answer is written before it is returned, so the next turn finds
+        # it whichever worker serves it.
+        turn_over = event.author != "user" and event.is_final_response()
+        if turn_over or event.error_code or len(pending.events) >= self.batch_size:
+            await self._flush(key)
+        elif pending.timer is None:
+            pending.timer = asyncio.get_running_loop().call_later(self.flush_ms / 1000, self._flush_later, key)
+        return event
+
+    def _flush_later(self, key) -> None:
+        task = asyncio.ensure_future(self._flush(key, raise_errors=False))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key, raise_errors: bool = True) -> None:
+        async with self._lock(key):
+            pending = self._pending.pop(key, None)
+            if pending is None:
+                return
+            if pending.timer is not None:
+                pending.timer.cancel()
+                pending.timer = None
+            try:
+                await self._write(key, pending)
+            except Exception as e:
+                print(f"Failed to write session {key[2]}: {e}")
+                with self._stats_lock:
+                    self.flush_errors += 1
+                # Keep the events for the next flush, ahead of newer ones.
+                newer = self._pending.get(key)
+                if newer is not None:
+                    pending.events += newer.events
+                    pending.app_delta.update(newer.app_delta)
+                    pending.user_delta.update(newer.user_delta)
+                    pending.session = newer.session
+                self._pending[key] = pending
+                if raise_errors:
+                    raise
+
+    async def _write(self, key, pending: _Pending) -> None:
+        app_name, user_id, session_id = key
+        events = pending.events
+        data, compressed, raw = encode_events(events)
+        chunk = {"ts": events[0].timestamp, "ts_last": events[-1].timestamp, "count": len(events), "z": compressed, "data": data}
+        if pending.app_delta:
+            await aio.run_blocking("io", self.store.merge_state, app_name, "", pending.app_delta)
+        if pending.user_delta:
+            await aio.run_blocking("io", self.store.merge_state, app_name, user_id, pending.user_delta)
+        state = _session_util.extract_state_delta(pending.session.state)["session"]
+        await aio.run_blocking("io", self.store.write, app_name, user_id, session_id, state, events[-1].timestamp, chunk)
+        with self._stats_lock:
+            self.flushes += 1
+            self.events_written += len(events)
+            self.raw_bytes += raw
+            self.stored_bytes += len(data)
+
+    async def flush(self) -> None:
+        for key in list(self._pending):
+            await self._flush(key)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "backend": type(self.store).__name__,
+                "appended": self.appended,
+                "flushes": self.flushes,
+                "flush_errors": self.flush_errors,
+                "events_written": self.events_written,
+                "events_per_flush": self.events_written / self.flushes if self.flushes else 0.0,
+                "pending_events": sum(len(pending.events) for pending in list(self._pending.values())),
+                "raw_bytes": self.raw_bytes,
+                "stored_bytes": self.stored_bytes,
+                "compression_ratio": self.raw_bytes / self.stored_bytes if self.stored_bytes else 0.0,
+                "loads": self.loads,
+            }
+
+
+_service = None
+metrics.registry.register_stats(
+    "session_store", "Persistent session store counters.",
+    lambda: _service.stats() if _service is not None else {},
+    counters=("appended", "flushes", "flush_errors", "events_written", "raw_bytes", "stored_bytes", "loads"),
+)
+
+
+def _factory(uri: str, **kwargs) -> StoreSessionService:
+    global _service
+    _service = StoreSessionService(create_store(urlparse(uri).netloc))
+    return _service
+
+
+def get_service() -> Optional[StoreSessionService]:
+    return _service
+
+
+# The session_service_uri for get_fast_api_app, or None to keep ADK's default.
+def service_uri(backend: str = None) -> Optional[str]:
+    backend = backend or SESSION_BACKEND
+    if backend not in BACKENDS:
+        raise RuntimeError(f"Unknown session backend: {backend}")
+    if backend == "local":
+        return None
+    from google.adk.cli.service_registry import get_service_registry
+
+    get_service_registry().register_session_service(URI_SCHEME, _factory)
+    return f"{URI_SCHEME}://{backend}"
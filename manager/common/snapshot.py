@@ -0,0 +1,255 @@
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import aio, dataset, db
+
+
+# When enabled the analysis tools answer from an in-process copy of both
+# emission collections instead of querying MongoDB on every call.
+SNAPSHOT_MODE = os.environ.get("SNAPSHOT_MODE", "false").lower() in ("1", "true", "yes", "on")
+SNAPSHOT_TTL_SECONDS = float(os.environ.get("SNAPSHOT_TTL_SECONDS", "900"))
+# Watch both collections with change streams (replica sets / Atlas only) and
+# refresh as soon as a write lands instead of waiting for the TTL.
+SNAPSHOT_CHANGE_STREAMS = os.environ.get("SNAPSHOT_CHANGE_STREAMS", "false").lower() in ("1", "true", "yes", "on")
+
+NUMERIC_FIELDS = [
+    "Mar_2025_Total",
+    "Prev_Month",
+    "Mar_2024_Total",
+    "Monthly_%_change",
+    "2025_YTD",
+    "2024_YTD",
+    "2023_YTD",
+    "2022_YTD",
+    "2021_YTD",
+]
+SECTOR_CATEGORIES = ["Sector_name", "Subsector_Name"]
+COUNTRY_CATEGORIES = ["Continent", "Country"]
+
+
+class ColumnarTable:
+    """Read-only table of dictionary-encoded string columns and float64 columns."""
+
+    def __init__(self, codes: dict, categories: dict, numeric: dict):
+        self.codes = codes
+        self.categories = categories
+        self.numeric = numeric
+        self.n_rows = len(next(iter(codes.values()))) if codes else 0
+        self._lookup = {
+            column: {db.normalize_name(value): code for code, value in enumerate(values)}
+            for column, values in categories.items()
+        }
+
+    @classmethod
+    def from_documents(cls, docs: list, categorical_fields: list, numeric_fields: list) -> "ColumnarTable":
+        codes = {}
+        categories = {}
+        for field in categorical_fields:
+            values = np.array([str(doc.get(field, "")) for doc in docs], dtype=object)
+            uniques, inverse = np.unique(values, return_inverse=True) if len(values) else (np.array([], dtype=object), np.array([], dtype=np.int64))
+            codes[field] = inverse.astype(np.int32)
+            categories[field] = [str(value) for value in uniques]
+        numeric = {}
+        for field in numeric_fields:
+            numeric[field] = np.array([_to_float(doc.get(field)) for doc in docs], dtype=np.float64)
+        return cls(codes, categories, numeric)
+
+    def code_of(self, column: str, value: str) -> int:
+        return self._lookup[column].get(db.normalize_name(value), -1)
+
+    def mask_eq(self, column: str, value: str) -> np.ndarray:
+        code = self.code_of(column, value)
+        if code < 0:
+            return np.zeros(self.n_rows, dtype=bool)
+        return self.codes[column] == code
+
+    def rows(self, mask: np.ndarray, fields: list) -> list:
+        index = np.flatnonzero(mask)
+        columns = []
+        for field in fields:
+            if field in self.codes:
+                values = self.categories[field]
+                columns.append([values[code] for code in self.codes[field][index]])
+            else:
+                columns.append(self.numeric[field][index].tolist())
+        return [dict(zip(fields, values)) for values in zip(*columns)]
+
+    # Groups the masked rows by a categorical column with bincount, summing
+    # sum_fields and averaging mean_fields. Groups come back in name order, the
+    # same order pandas' groupby produces, and missing values are skipped the
+    # way pandas skips them: an all-NaN sum is 0 and an all-NaN mean is NaN.
+    def group(self, by: str, mask: Optional[np.ndarray], sum_fields: list, mean_fields: list = ()) -> list:
+        codes = self.codes[by]
+        if mask is not None:
+            codes = codes[mask]
+        size = len(self.categories[by])
+        present = np.flatnonzero(np.bincount(codes, minlength=size))
+        result = {field: [] for field in (by, *sum_fields, *mean_fields)}
+        result[by] = [self.categories[by][code] for code in present]
+        for field in sum_fields:
+            values = self.numeric[field] if mask is None else self.numeric[field][mask]
+            result[field] = _aggregate(codes, values, size, "sum")[present].tolist()
+        for field in mean_fields:
+            values = self.numeric[field] if mask is None else self.numeric[field][mask]
+            result[field] = _aggregate(codes, values, size, "mean")[present].tolist()
+        fields = list(result)
+        return [dict(zip(fields, values)) for values in zip(*result.values())]
+
+    # Aggregates field per `by` category separately for each mask. Returns a
+    # (len(masks), n_categories) presence matrix and the matching values,
+    # summed or averaged with missing values skipped as in group. Categories
+    # absent under a mask hold NaN.
+    def pivot(self, by: str, masks: list, field: str, how: str = "sum") -> tuple:
+        size = len(self.categories[by])
+        present = np.zeros((len(masks), size), dtype=bool)
+        values = np.zeros((len(masks), size), dtype=np.float64)
+        for i, mask in enumerate(masks):
+            codes = self.codes[by][mask]
+            present[i] = np.bincount(codes, minlength=size) > 0
+            values[i] = _aggregate(codes, self.numeric[field][mask], size, how)
+        values[~present] = np.nan
+        return present, values
+
+
+# Per-code sum or mean of values that skips NaN: a code whose values are all
+# missing sums to 0 and averages to NaN.
+def _aggregate(codes: np.ndarray, values: np.ndarray, size: int, how: str) -> np.ndarray:
+    valid = ~np.isnan(values)
+    sums = np.bincount(codes, weights=np.where(valid, values, 0.0), minlength=size)
+    if how != "mean":
+        return sums
+    counts = np.bincount(codes[valid], minlength=size)
+    return np.divide(sums, counts, out=np.full(size, np.nan), where=counts > 0)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class EmissionsSnapshot:
+    def __init__(self, sectors: ColumnarTable, countries: ColumnarTable):
+        self.sectors = sectors
+        self.countries = countries
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls) -> "EmissionsSnapshot":
+        sector_docs = list(db.get_sector_collection().find({}, db.projection(SECTOR_CATEGORIES + NUMERIC_FIELDS)))
+        country_docs = list(db.get_country_collection().find({}, db.projection(COUNTRY_CATEGORIES + NUMERIC_FIELDS)))
+        return cls(
+            ColumnarTable.from_documents(sector_docs, SECTOR_CATEGORIES, NUMERIC_FIELDS),
+            ColumnarTable.from_documents(country_docs, COUNTRY_CATEGORIES, NUMERIC_FIELDS),
+        )
+
+    def age(self) -> float:
+        return time.monotonic() - self.loaded_at
+
+
+_snapshot = None
+_stale = False
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+_refreshing = threading.Event()
+_watcher = None
+
+
+def enable(enabled: bool = True) -> None:
+    global SNAPSHOT_MODE
+    SNAPSHOT_MODE = enabled
+
+
+def is_enabled() -> bool:
+    return SNAPSHOT_MODE
+
+
+def refresh() -> EmissionsSnapshot:
+    global _snapshot, _stale
+    snapshot = EmissionsSnapshot.load()
+    with _lock:
+        _snapshot = snapshot
+        _stale = False
+    return snapshot
+
+
+def _refresh_in_background() -> None:
+    if _refreshing.is_set():
+        return
+    _refreshing.set()
+
+    def run():
+        try:
+            refresh()
+        except Exception as e:
+            print(f"Error refreshing emissions snapshot: {e}")
+        finally:
+            _refreshing.clear()
+
+    threading.Thread(target=run, name="snapshot-refresh", daemon=True).start()
+
+
+def mark_stale() -> None:
+    global _stale
+    _stale = True
+    dataset.invalidate()
+
+
+# Returns the current snapshot, or None when snapshot mode is off. The first
+# call loads synchronously; after that an expired snapshot keeps serving while
+# a background thread reloads it.
+def get_snapshot() -> Optional[EmissionsSnapshot]:
+    if not SNAPSHOT_MODE:
+        return None
+    snapshot = _snapshot
+    if snapshot is None:
+        with _load_lock:
+            snapshot = _snapshot
+            if snapshot is None:
+                snapshot = refresh()
+                if SNAPSHOT_CHANGE_STREAMS:
+                    start_change_stream_watcher()
+        return snapshot
+    if _stale or snapshot.age() > SNAPSHOT_TTL_SECONDS:
+        _refresh_in_background()
+    return snapshot
+
+
+# get_snapshot for coroutines. Once a snapshot is loaded get_snapshot never
+# blocks; the first load reads both collections, so it runs on the IO pool
+# instead of stalling every session on the event loop.
+async def get_snapshot_async() -> Optional[EmissionsSnapshot]:
+    if not SNAPSHOT_MODE:
+        return None
+    if _snapshot is not None:
+        return get_snapshot()
+    return await aio.run_blocking("io", get_snapshot)
+
+
+def _watch(collection) -> None:
+    while True:
+        try:
+            with collection.watch() as stream:
+                for _ in stream:
+                    mark_stale()
+        except Exception as e:
+            print(f"Change stream on {collection.name} stopped: {e}")
+            time.sleep(30)
+
+
+def start_change_stream_watcher() -> None:
+    global _watcher
+    if _watcher is not None:
+        return
+    _watcher = []
+    for collection in (db.get_sector_collection(), db.get_country_collection()):
+        thread = threading.Thread(target=_watch, args=(collection,), name=f"snapshot-watch-{collection.name}", daemon=True)
+        thread.start()
+        _watcher.append(thread)
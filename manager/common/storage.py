@@ -0,0 +1,226 @@
+import abc
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# "gcs" publishes to GCS_BUCKET_NAME; "local" writes to LOCAL_BLOB_DIR, which
+# main.py serves under LOCAL_BLOB_URL_PATH.
+BLOB_BACKEND = os.environ.get("BLOB_BACKEND", "gcs").lower()
+GCS_BUCKET = os.environ.get("GCS_BUCKET_NAME")
+BLOB_PREFIX = os.environ.get("BLOB_PREFIX", "co2_emissions_trends")
+# The bucket is expected to grant public read through uniform bucket-level
+# access, so object URLs are built directly instead of calling make_public()
+# on every upload.
+GCS_PUBLIC_BASE_URL = os.environ.get("GCS_PUBLIC_BASE_URL", "https://storage.googleapis.com")
+LOCAL_BLOB_DIR = os.environ.get("LOCAL_BLOB_DIR", ".blobs")
+LOCAL_BLOB_URL_PATH = os.environ.get("LOCAL_BLOB_URL_PATH", "/blobs")
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))
+# Wait for the upload before returning the URL, so a failed upload is reported
+# as an error instead of reaching the user as a broken image link. Set it to
+# false to return the URL (known from the content hash) straight away and let
+# the upload finish while the model is still writing its answer.
+BLOB_WAIT_FOR_UPLOAD = os.environ.get("BLOB_WAIT_FOR_UPLOAD", "true").lower() in ("1", "true", "yes", "on")
+
+
+class BlobStore(abc.ABC):
+    """Minimal object store interface used for chart images."""
+
+    @abc.abstractmethod
+    def url_for(self, key: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        ...
+
+
+class GCSBlobStore(BlobStore):
+    def __init__(self, bucket_name: str, prefix: str = BLOB_PREFIX, base_url: str = GCS_PUBLIC_BASE_URL):
+        if not bucket_name:
+            raise RuntimeError("GCS_BUCKET_NAME is not set.")
+        from google.cloud import storage
+        try:
+            self._bucket = storage.Client().bucket(bucket_name)
+        except Exception as e:
+            raise RuntimeError(f"Google Cloud Storage client not initialized: {e}")
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.base_url = base_url.rstrip("/")
+
+    def _path(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def url_for(self, key: str) -> str:
+        return f"{self.base_url}/{self.bucket_name}/{self._path(key)}"
+
+    def exists(self, key: str) -> bool:
+        return self._bucket.blob(self._path(key)).exists()
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        from google.api_core.exceptions import PreconditionFailed
+        blob = self._bucket.blob(self._path(key))
+        blob.cache_control = "public, max-age=31536000, immutable"
+        try:
+            # Content-addressed keys never change, so an existing object is
+            # left alone instead of being rewritten.
+            blob.upload_from_string(data, content_type=content_type, if_generation_match=0)
+        except PreconditionFailed:
+            pass
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, directory: str = LOCAL_BLOB_DIR, url_path: str = LOCAL_BLOB_URL_PATH):
+        self.directory = directory
+        self.url_path = url_path.rstrip("/")
+        os.makedirs(directory, exist_ok=True)
+
+    def url_for(self, key: str) -> str:
+        return f"{self.url_path}/{key}"
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.directory, key))
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        path = os.path.join(self.directory, key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+_EXTENSIONS = {"image/png": ".png", "image/svg+xml": ".svg", "application/json": ".json"}
+
+
+class Publisher:
+    """Uploads blobs on a thread pool, keyed by content hash.
+
+    publish() waits for the upload unless wait is false, in which case it
+    returns the final URL straight away. A blob that is being uploaded is not
+    sent again, and one the store already has is skipped after an exists()
+    check. Callers that keep the URL (the chart cache) pass on_uploaded, which
+    is only called once the upload has succeeded.
+    """
+
+    def __init__(self, store: BlobStore, concurrency: int = UPLOAD_CONCURRENCY):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="blob-upload")
+        self._lock = threading.Lock()
+        # In-flight uploads only; an entry is dropped as soon as it completes.
+        self._uploads = {}
+        self.uploaded = 0
+        self.deduplicated = 0
+        self.failed = 0
+
+    def _upload(self, key: str, data: bytes, content_type: str) -> None:
+        try:
+            if self.store.exists(key):
+                with self._lock:
+                    self.deduplicated += 1
+                return
+            with metrics.timer(metrics.UPLOAD_SECONDS, "blob.upload", backend=type(self.store).__name__):
+                self.store.put(key, data, content_type)
+            with self._lock:
+                self.uploaded += 1
+        except Exception:
+            logger.warning("Failed to upload blob %s", key, exc_info=True)
+            with self._lock:
+                self.failed += 1
+            raise
+
+    def _finished(self, key: str, future: Future) -> None:
+        with self._lock:
+            if self._uploads.get(key) is future:
+                del self._uploads[key]
+
+    def publish(self, data: bytes, content_type: str = "image/png", wait: bool = None, on_uploaded=None) -> str:
+        if wait is None:
+            wait = BLOB_WAIT_FOR_UPLOAD
+        key = hashlib.sha256(data).hexdigest() + _EXTENSIONS.get(content_type, "")
+        url = self.store.url_for(key)
+        with self._lock:
+            future = self._uploads.get(key)
+            submitted = future is None
+            if submitted:
+                future = self._executor.submit(self._upload, key, data, content_type)
+                self._uploads[key] = future
+            else:
+                self.deduplicated += 1
+        if submitted:
+            # Outside the lock: a finished future runs the callback right away.
+            future.add_done_callback(lambda done: self._finished(key, done))
+        if not wait:
+            if on_uploaded is not None:
+                future.add_done_callback(lambda done: on_uploaded(url) if done.exception() is None else None)
+            return url
+        try:
+            future.result()
+        except Exception as e:
+            raise RuntimeError(f"Failed to upload image: {e}")
+        if on_uploaded is not None:
+            on_uploaded(url)
+        return url
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "uploaded": self.uploaded,
+                "deduplicated": self.deduplicated,
+                "failed": self.failed,
+                "pending": len(self._uploads),
+            }
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+metrics.registry.register_stats(
+    "blob_publisher", "Chart blob publisher counters.",
+    lambda: _publisher.stats() if _publisher is not None else {},
+    counters=("uploaded", "deduplicated", "failed"),
+)
+
+
+def create_store(backend: str = None) -> BlobStore:
+    backend = backend or BLOB_BACKEND
+    if backend == "local":
+        return LocalBlobStore()
+    if backend == "gcs":
+        return GCSBlobStore(GCS_BUCKET)
+    raise RuntimeError(f"Unknown blob backend: {backend}")
+
+
+# The store is created on first use, not at import, so importing the agents
+# does not construct a GCS client.
+def get_publisher() -> Publisher:
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                _publisher = Publisher(create_store())
+    return _publisher
+
+
+def publish(data: bytes, content_type: str = "image/png", on_uploaded=None) -> str:
+    return get_publisher().publish(data, content_type, on_uploaded=on_uploaded)
+
+
+# The publisher's upload threads do not survive fork.
+def _reset_after_fork() -> None:
+    global _publisher, _publisher_lock
+    _publisher = None
+    _publisher_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
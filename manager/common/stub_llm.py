@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+from typing import AsyncGenerator, Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+# A deterministic local stand-in for Gemini, for load tests. Every agent's
+# model is replaced by a StubLlm that replays scripted calls. The script
+# comes from the session traces the load test replays: for each user message,
+# the function calls the agents made, in order, and the final reply.
+#
+#   {"session": "s1", "turns": [{"text": "report for Power",
+#     "calls": [["transfer_to_agent", {"agent_name": "CO2_Emission_analysis_sector_agent"}],
+#               ["get_sector_report", {"sector_name": "Power"}]],
+#     "reply": "Power emitted ..."}]}
+#
+# Calls up to and including a transfer_to_agent are made by the agent that
+# was active; later calls by the agent transferred to. When another agent is
+# still active from the previous turn, it first transfers to the agent that
+# answers. A message without a script gets a plain text reply, with no tool
+# calls.
+LLM_STUB = os.environ.get("LLM_STUB", "false").lower() in ("1", "true", "yes", "on")
+# JSONL session traces to take the scripts from.
+LLM_STUB_TRACES = os.environ.get("LLM_STUB_TRACES", "")
+# Simulated model latency per call, to size concurrency as if the model were
+# remote. 0 answers immediately.
+LLM_STUB_LATENCY_MS = float(os.environ.get("LLM_STUB_LATENCY_MS", "0"))
+
+ROOT_AGENT = "manager"
+_CONTEXT_PREFIX = "For context:"
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+# Splits a turn's calls into the calls each agent makes, in order, and
+# returns them with the agent that gives the final reply.
+def split_calls(calls: list, root: str = ROOT_AGENT) -> tuple:
+    per_agent = {}
+    agent = root
+    for name, args in calls:
+        per_agent.setdefault(agent, []).append((name, args or {}))
+        if name == "transfer_to_agent":
+            agent = (args or {}).get("agent_name", agent)
+    return per_agent, agent
+
+
+class Scripts:
+    """Per-message scripts read from session traces."""
+
+    def __init__(self):
+        self._turns = {}
+        self._lock = threading.Lock()
+
+    def load(self, path: str) -> int:
+        loaded = 0
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                for turn in json.loads(line).get("turns", []):
+                    self.add(turn["text"], turn.get("calls", []), turn.get("reply"))
+                    loaded += 1
+        return loaded
+
+    def add(self, text: str, calls: list, reply: Optional[str] = None) -> None:
+        with self._lock:
+            self._turns[_normalize(text)] = split_calls(calls) + (reply,)
+
+    def get(self, text: str):
+        with self._lock:
+            return self._turns.get(_normalize(text))
+
+
+scripts = Scripts()
+if LLM_STUB and LLM_STUB_TRACES:
+    scripts.load(LLM_STUB_TRACES)
+
+
+def _is_user_text(content: types.Content) -> Optional[str]:
+    if content.role != "user" or not content.parts:
+        return None
+    text = "".join(part.text or "" for part in content.parts)
+    if not text or text.startswith(_CONTEXT_PREFIX):
+        return None
+    return text
+
+
+class StubLlm(BaseLlm):
+    """Answers for one agent from the scripts, without network calls."""
+
+    agent_name: str
+    # Whether the agent can hand over to another agent; false for agents
+    # wrapped as tools.
+    can_transfer: bool = False
+
+    def _next(self, llm_request: LlmRequest) -> types.Content:
+        # The latest user message with a script, and how many function
+        # responses this agent has received since: the next call to make.
+        contents = llm_request.contents or []
+        for i in range(len(contents) - 1, -1, -1):
+            text = _is_user_text(contents[i])
+            if text is None:
+                continue
+            script = scripts.get(text)
+            if script is None:
+                break
+            per_agent, answering, reply = script
+            calls = per_agent.get(self.agent_name, [])
+            if not calls and self.can_transfer and answering != self.agent_name:
+                calls = [("transfer_to_agent", {"agent_name": answering})]
+            done = sum(1 for content in contents[i + 1:] for part in content.parts or [] if part.function_response)
+            if done < len(calls):
+                name, args = calls[done]
+                return types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name=name, args=args))])
+            return types.Content(role="model", parts=[types.Part(text=reply or f"[{self.agent_name}] {done} tool results.")])
+        return types.Content(role="model", parts=[types.Part(text=f"[{self.agent_name}] stub reply.")])
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        if LLM_STUB_LATENCY_MS > 0:
+            await asyncio.sleep(LLM_STUB_LATENCY_MS / 1000)
+        yield LlmResponse(content=self._next(llm_request), turn_complete=True)
+
+
+# Replaces the model of agent and every agent under it, including agents
+# wrapped as tools, with a StubLlm. The stub keeps the model name, so tools
+# that check for a Gemini model (google_search) still attach.
+def install(agent, can_transfer: bool = True) -> None:
+    from google.adk.tools.agent_tool import AgentTool
+
+    model = agent.model if isinstance(agent.model, str) else agent.model.model
+    agent.model = StubLlm(model=model, agent_name=agent.name, can_transfer=can_transfer)
+    for sub_agent in agent.sub_agents:
+        install(sub_agent, can_transfer)
+    for tool in getattr(agent, "tools", []):
+        if isinstance(tool, AgentTool):
+            install(tool.agent, can_transfer=False)
@@ -0,0 +1,303 @@
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import dataset, db, tool_output
+
+# Emissions in long format: one document per (entity, measure, month) instead
+# of one wide document with a column per month. Adding a month adds documents,
+# not fields, and trends can cover any range that has been loaded.
+#
+#   {kind: "subsector"|"country", entity, name, parent, parent_name,
+#    measure: "monthly"|"ytd", period: <first day of the month>, value, version}
+#
+# Subsector points roll up to sectors and country points to continents at
+# query time. A regular collection is used rather than a MongoDB time-series
+# collection: every monthly file repeats the previous month, and revised
+# values have to replace the stored ones through upserts on a unique key.
+TIMESERIES_ENABLED = os.environ.get("TIMESERIES", "true").lower() in ("1", "true", "yes", "on")
+TIMESERIES_COLLECTION = os.environ.get("TIMESERIES_COLLECTION", "Emission_timeseries")
+# Months shown by the trend tools when no start month is given.
+TIMESERIES_DEFAULT_MONTHS = int(os.environ.get("TIMESERIES_DEFAULT_MONTHS", "24"))
+
+MEASURES = ("monthly", "ytd")
+# Query kinds: which stored kind they read and whether the name is matched
+# against the entity itself or its parent.
+QUERY_KINDS = {
+    "sector": ("subsector", "parent"),
+    "subsector": ("subsector", "entity"),
+    "country": ("country", "entity"),
+    "continent": ("country", "parent"),
+}
+
+_MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+_MONTH_TOTAL = re.compile(r"^([A-Z][a-z]{2})_(\d{4})_Total$")
+_YTD = re.compile(r"^(\d{4})_YTD$")
+
+
+def get_timeseries_collection():
+    return db.get_database()[TIMESERIES_COLLECTION]
+
+
+def ensure_indexes() -> None:
+    collection = get_timeseries_collection()
+    collection.create_index(
+        [("kind", 1), ("entity", 1), ("measure", 1), ("period", 1), ("parent", 1)],
+        name="entity_measure_period",
+        unique=True,
+    )
+    collection.create_index([("kind", 1), ("parent", 1), ("measure", 1), ("period", 1)], name="parent_measure_period")
+
+
+def add_months(period: datetime, months: int) -> datetime:
+    index = period.year * 12 + period.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+# "2025-03" or "2025-3" -> datetime(2025, 3, 1). Empty text is None.
+def parse_month(text: str) -> Optional[datetime]:
+    if not text:
+        return None
+    match = re.match(r"^\s*(\d{4})-(\d{1,2})", str(text))
+    if match is None or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"Expected a month as YYYY-MM, got {text!r}")
+    return datetime(int(match.group(1)), int(match.group(2)), 1)
+
+
+def month_label(period: datetime) -> str:
+    return f"{period.year:04d}-{period.month:02d}"
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and value == value
+
+
+# Long-format points of one wide document. Month columns are recognised by
+# name ("Mar_2025_Total"); Prev_Month is the month before the latest of them
+# and "<year>_YTD" is the year-to-date total through that month.
+def points_from_document(doc: dict) -> list:
+    monthly = []
+    for field, value in doc.items():
+        match = _MONTH_TOTAL.match(field)
+        if match and match.group(1) in _MONTHS and _is_number(value):
+            monthly.append((datetime(int(match.group(2)), _MONTHS.index(match.group(1)) + 1, 1), value))
+    if not monthly:
+        return []
+    latest = max(period for period, _ in monthly)
+    points = [("monthly", period, value) for period, value in monthly]
+    if _is_number(doc.get("Prev_Month")):
+        points.append(("monthly", add_months(latest, -1), doc["Prev_Month"]))
+    for field, value in doc.items():
+        match = _YTD.match(field)
+        if match and _is_number(value):
+            points.append(("ytd", datetime(int(match.group(1)), latest.month, 1), value))
+    return points
+
+
+def _entity(kind: str, doc: dict):
+    if kind == "sector":
+        return "subsector", doc.get("Subsector_Name"), doc.get("Sector_name")
+    return "country", doc.get("Country"), doc.get("Continent")
+
+
+# Converts the wide sector and country collections into points and upserts
+# them. Rows of the same entity are summed first, the same way the reports
+# total subsectors.
+def load_from_wide(kinds: tuple = ("sector", "country"), version: str = None) -> int:
+    from pymongo import UpdateOne
+
+    version = version or dataset.current_version()
+    collection = get_timeseries_collection()
+    ensure_indexes()
+    written = 0
+    for kind in kinds:
+        source = db.get_sector_collection() if kind == "sector" else db.get_country_collection()
+        totals = {}
+        for doc in source.find({}, {"_id": 0, "embedding": 0}):
+            stored_kind, name, parent_name = _entity(kind, doc)
+            if name is None:
+                continue
+            for measure, period, value in points_from_document(doc):
+                key = (stored_kind, db.normalize_name(name), db.normalize_name(parent_name or ""), measure, period)
+                entry = totals.setdefault(key, {"name": name, "parent_name": parent_name, "value": 0.0})
+                entry["value"] += value
+        updates = [
+            (
+                {"kind": kind_, "entity": entity, "parent": parent, "measure": measure, "period": period},
+                {"$set": {"name": entry["name"], "parent_name": entry["parent_name"], "value": entry["value"], "version": version}},
+            )
+            for (kind_, entity, parent, measure, period), entry in totals.items()
+        ]
+        if db.is_mock_client() and updates and collection.find_one({"kind": updates[0][0]["kind"]}) is None:
+            # mongomock scans the collection on every upsert; points of a kind
+            # not loaded yet go in with a single insert instead.
+            collection.insert_many([dict(query, **update["$set"]) for query, update in updates])
+        elif db.is_mock_client():
+            for query, update in updates:
+                collection.update_one(query, update, upsert=True)
+        else:
+            for start in range(0, len(updates), 1000):
+                batch = [UpdateOne(query, update, upsert=True) for query, update in updates[start:start + 1000]]
+                collection.bulk_write(batch, ordered=False)
+        written += len(updates)
+    invalidate()
+    return written
+
+
+def _match(kind: str, name: str, measure: str, start: Optional[datetime], end: Optional[datetime]) -> dict:
+    stored_kind, name_field = QUERY_KINDS[kind]
+    query = {"kind": stored_kind, name_field: db.normalize_name(name), "measure": measure}
+    period = {}
+    if start is not None:
+        period["$gte"] = start
+    if end is not None:
+        period["$lte"] = end
+    if period:
+        query["period"] = period
+    return query
+
+
+def latest_period(kind: str, name: str, measure: str = "monthly") -> Optional[datetime]:
+    doc = get_timeseries_collection().find_one(_match(kind, name, measure, None, None), {"period": 1}, sort=[("period", -1)])
+    return doc["period"] if doc else None
+
+
+# Values per month in [start, end], summed over the entity's rows.
+def series(kind: str, name: str, start: datetime = None, end: datetime = None, measure: str = "monthly") -> list:
+    pipeline = [
+        {"$match": _match(kind, name, measure, start, end)},
+        {"$group": {"_id": "$period", "value": {"$sum": "$value"}}},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "period": "$_id", "value": 1}},
+    ]
+    return list(get_timeseries_collection().aggregate(pipeline))
+
+
+def _percent_change(value, previous):
+    if previous is None or previous == 0:
+        return None
+    return (value - previous) / previous * 100
+
+
+# series() plus the value one month and twelve months earlier and the percent
+# change against each. The lookback uses $setWindowFields with month-unit
+# range windows, so gaps in the data give no comparison rather than a wrong
+# one. Rows before start are read only to feed the windows.
+def changes(kind: str, name: str, start: datetime = None, end: datetime = None, measure: str = "monthly") -> list:
+    if db.is_mock_client():
+        return _changes_in_process(kind, name, start, end, measure)
+    lookback_start = add_months(start, -12) if start is not None else None
+    pipeline = [
+        {"$match": _match(kind, name, measure, lookback_start, end)},
+        {"$group": {"_id": "$period", "value": {"$sum": "$value"}}},
+        {"$setWindowFields": {
+            "sortBy": {"_id": 1},
+            "output": {
+                "prev_month": {"$push": "$value", "window": {"range": [-1, -1], "unit": "month"}},
+                "prev_year": {"$push": "$value", "window": {"range": [-12, -12], "unit": "month"}},
+            },
+        }},
+    ]
+    if start is not None:
+        pipeline.append({"$match": {"_id": {"$gte": start}}})
+    pipeline += [
+        {"$project": {
+            "_id": 0,
+            "period": "$_id",
+            "value": 1,
+            "prev_month": {"$arrayElemAt": ["$prev_month", 0]},
+            "prev_year": {"$arrayElemAt": ["$prev_year", 0]},
+        }},
+        {"$sort": {"period": 1}},
+    ]
+    rows = list(get_timeseries_collection().aggregate(pipeline))
+    for row in rows:
+        row["mom_pct"] = _percent_change(row["value"], row.get("prev_month"))
+        row["yoy_pct"] = _percent_change(row["value"], row.get("prev_year"))
+    return rows
+
+
+# mongomock has no $setWindowFields; same result computed from series().
+def _changes_in_process(kind, name, start, end, measure) -> list:
+    lookback_start = add_months(start, -12) if start is not None else None
+    values = {row["period"]: row["value"] for row in series(kind, name, lookback_start, end, measure)}
+    rows = []
+    for period, value in values.items():
+        if start is not None and period < start:
+            continue
+        previous_month = values.get(add_months(period, -1))
+        previous_year = values.get(add_months(period, -12))
+        rows.append({
+            "period": period,
+            "value": value,
+            "prev_month": previous_month,
+            "prev_year": previous_year,
+            "mom_pct": _percent_change(value, previous_month),
+            "yoy_pct": _percent_change(value, previous_year),
+        })
+    return rows
+
+
+# Resolves the [start, end] range the trend tools show: both months as given,
+# or the last TIMESERIES_DEFAULT_MONTHS months up to the newest loaded one.
+def resolve_range(kind: str, name: str, start_month: str = "", end_month: str = "", measure: str = "monthly"):
+    start, end = parse_month(start_month), parse_month(end_month)
+    if end is None:
+        end = latest_period(kind, name, measure)
+        if end is None:
+            return None, None
+    if start is None:
+        start = add_months(end, -(TIMESERIES_DEFAULT_MONTHS - 1))
+    return start, end
+
+
+_available = None
+_available_checked_at = 0.0
+_lock = threading.Lock()
+
+
+# True when time-series mode is on and the collection holds data. Checked at
+# most once a minute.
+def is_available() -> bool:
+    global _available, _available_checked_at
+    if not TIMESERIES_ENABLED:
+        return False
+    if _available is None or time.monotonic() - _available_checked_at > 60:
+        with _lock:
+            _available = get_timeseries_collection().find_one({}, {"_id": 1}) is not None
+            _available_checked_at = time.monotonic()
+    return _available
+
+
+def invalidate() -> None:
+    global _available
+    _available = None
+
+
+def _format_percent(value) -> str:
+    return "n/a" if value is None else f"{value:+.2f}%"
+
+
+def format_trend(tool: str, title: str, rows: list) -> dict:
+    if not rows:
+        return {"error": f"No monthly data found for {title}."}
+    if tool_output.is_compact():
+        cells = [[month_label(row["period"]), row["value"], row["mom_pct"], row["yoy_pct"]] for row in rows]
+        return {"result": tool_output.table(tool, f"Monthly CO2 emissions for {title}:", ["Month", "Value", "MoM_%", "YoY_%"], cells, keep="tail", sum_columns=("Value",))}
+    lines = [f"Monthly CO2 emissions for {title} ({month_label(rows[0]['period'])} to {month_label(rows[-1]['period'])}):\n"]
+    for row in rows:
+        lines.append(
+            f"{month_label(row['period'])}: {row['value']}, "
+            f"MoM: {_format_percent(row['mom_pct'])}, YoY: {_format_percent(row['yoy_pct'])}"
+        )
+    return {"result": "\n".join(lines)}
+
+
+if __name__ == "__main__":
+    print(f"Upserted {load_from_wide()} points into {TIMESERIES_COLLECTION}")
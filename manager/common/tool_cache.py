@@ -0,0 +1,217 @@
+import asyncio
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import dataset, metrics
+from .db import normalize_name
+
+TOOL_CACHE_ENABLED = os.environ.get("TOOL_CACHE", "true").lower() in ("1", "true", "yes", "on")
+TOOL_CACHE_SIZE = int(os.environ.get("TOOL_CACHE_SIZE", "2048"))
+# Upper bound on entry age even when the dataset version has not changed.
+TOOL_CACHE_TTL_SECONDS = float(os.environ.get("TOOL_CACHE_TTL_SECONDS", "86400"))
+
+
+def _normalize_arg(value):
+    if isinstance(value, str):
+        return normalize_name(value)
+    if isinstance(value, (list, tuple)):
+        return [_normalize_arg(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _normalize_arg(item) for key, item in sorted(value.items())}
+    return value
+
+
+class ToolCache:
+    """LRU of tool results keyed by (tool, normalized arguments, dataset version).
+
+    Identical calls that arrive while the first one is still running wait for
+    its result instead of computing it again, whether each of them is a thread
+    or a coroutine. The one exception is a plain call made on the thread of
+    the event loop that is running the first call, which computes the value
+    itself rather than block that loop. Exceptions reach every waiter and are
+    never cached.
+    Cached results are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, max_size: int = TOOL_CACHE_SIZE, ttl_seconds: float = TOOL_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._per_tool = {}
+
+    def _count(self, tool: str, outcome: str) -> None:
+        counts = self._per_tool.setdefault(tool, {"hits": 0, "misses": 0, "coalesced": 0})
+        counts[outcome] += 1
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            self.expirations += 1
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # Returns (found, value, running). running is the (future, event loop) of
+    # an identical call in flight, the loop being None for a call made from a
+    # thread. When nothing is cached and no identical call is running, running
+    # is None and the caller must compute the value and call _finish.
+    def _begin(self, tool: str, key, loop=None):
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                self._count(tool, "hits")
+                return True, value, None
+            running = self._inflight.get(key)
+            if running is not None:
+                self.coalesced += 1
+                self._count(tool, "coalesced")
+                return False, None, running
+            self.misses += 1
+            self._count(tool, "misses")
+            self._inflight[key] = (Future(), loop)
+            return False, None, None
+
+    def _finish(self, key, value=None, error: BaseException = None):
+        with self._lock:
+            future, _ = self._inflight.pop(key)
+            if error is None:
+                self._store(key, value)
+        return future
+
+    def get_or_compute(self, tool: str, key, compute):
+        found, value, running = self._begin(tool, key)
+        if found:
+            return value
+        if running is not None:
+            future, loop = running
+            # Blocking the thread of the event loop that is running the call
+            # would stop it from ever finishing, so that caller computes the
+            # value itself.
+            if loop is not None and _on_loop_thread(loop):
+                return compute()
+            try:
+                return future.result()
+            except CancelledError:
+                return compute()
+        try:
+            value = compute()
+        except BaseException as e:
+            self._finish(key, error=e).set_exception(e)
+            raise
+        self._finish(key, value).set_result(value)
+        return value
+
+    async def get_or_compute_async(self, tool: str, key, compute):
+        found, value, running = self._begin(tool, key, asyncio.get_running_loop())
+        if found:
+            return value
+        if running is not None:
+            # Shielded, so a waiter that is cancelled does not cancel the
+            # call it is waiting for.
+            return await asyncio.shield(asyncio.wrap_future(running[0]))
+        try:
+            value = await compute()
+        except BaseException as e:
+            future = self._finish(key, error=e)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+        self._finish(key, value).set_result(value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "tools": {tool: dict(counts) for tool, counts in self._per_tool.items()},
+            }
+
+
+def _on_loop_thread(loop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+tool_cache = ToolCache()
+metrics.registry.register_stats(
+    "tool_cache", "Tool result cache.", tool_cache.stats,
+    counters=("hits", "misses", "coalesced", "evictions", "expirations"),
+)
+
+
+def _key(fn, signature, args, kwargs, version):
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = {name: _normalize_arg(value) for name, value in bound.arguments.items()}
+    return (fn.__name__, json.dumps(arguments, sort_keys=True, default=str), version)
+
+
+# Caches a tool's result per dataset version. Works on plain and coroutine
+# functions; the wrapper keeps the name, docstring and signature the agent
+# framework reads.
+def cached_tool(fn):
+    signature = inspect.signature(fn)
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            if not TOOL_CACHE_ENABLED:
+                return await fn(*args, **kwargs)
+            version = dataset.peek_version()
+            if version is None:
+                from . import aio
+                version = await aio.run_blocking("io", dataset.current_version)
+            key = _key(fn, signature, args, kwargs, version)
+            return await tool_cache.get_or_compute_async(fn.__name__, key, lambda: fn(*args, **kwargs))
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not TOOL_CACHE_ENABLED:
+            return fn(*args, **kwargs)
+        key = _key(fn, signature, args, kwargs, dataset.current_version())
+        return tool_cache.get_or_compute(fn.__name__, key, lambda: fn(*args, **kwargs))
+    return wrapper
@@ -0,0 +1,198 @@
+import json
+import math
+import numbers
+import re
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+# Every tool result is sent back to the model on the next turn, so its size
+# adds to the latency and cost of each turn. Compact mode formats results as
+# one pipe-separated table per result, with the column labels written once
+# and numbers rounded. Each tool has a token budget. A table over budget keeps
+# its top rows and adds a summary row for the rest. Compact mode is opt-in
+# (TOOL_OUTPUT=compact); the default keeps the original prose formatting.
+TOOL_OUTPUT_MODE = os.environ.get("TOOL_OUTPUT", "verbose").lower()
+# Default budget per tool result, in estimated tokens.
+TOOL_OUTPUT_TOKENS = int(os.environ.get("TOOL_OUTPUT_TOKENS", "800"))
+# Per-tool overrides, e.g. "get_sector_report=600,compare_sectors_many=1200".
+TOOL_OUTPUT_BUDGETS = os.environ.get("TOOL_OUTPUT_BUDGETS", "")
+# Decimal places kept for values below 1000; larger values are whole numbers.
+TOOL_OUTPUT_DIGITS = int(os.environ.get("TOOL_OUTPUT_DIGITS", "2"))
+# Rough characters per token for budgeting. No tokenizer for the serving
+# model is available locally.
+CHARS_PER_TOKEN = 4
+
+# Lists are only useful whole, and multi-sector comparisons have a column pair
+# per sector, so those tools start from a larger budget.
+_budgets = {"get_sector_list": 2000, "find_country_list": 2000, "compare_sectors_many": 1500}
+for entry in TOOL_OUTPUT_BUDGETS.split(","):
+    if "=" in entry:
+        name, tokens = entry.split("=", 1)
+        _budgets[name.strip()] = int(tokens)
+
+# Markers of left-out rows written by table() and name_list(). They are
+# counted in every response the model receives (record_tool_output), so
+# results served from the tool cache are counted as well.
+_OMITTED = re.compile(r"\((\d+) (?:other|earlier) rows\)|\.\.\. \((\d+) more\)")
+
+
+def is_compact() -> bool:
+    return TOOL_OUTPUT_MODE == "compact"
+
+
+def budget(tool: str) -> int:
+    return _budgets.get(tool, TOOL_OUTPUT_TOKENS)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_number(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool) or not isinstance(value, numbers.Real):
+        return str(value)
+    if value != value:
+        return ""
+    if abs(value) >= 1000:
+        return f"{value:.0f}"
+    text = f"{value:.{TOOL_OUTPUT_DIGITS}f}"
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _line(cells) -> str:
+    return "|".join(format_number(cell) for cell in cells)
+
+
+# Formats rows (lists of cells, in column order) as a title line, a header and
+# one line per row, within the tool's token budget. Over budget, the rows with
+# the largest absolute value in rank_by (a column name or a function of the
+# row) are kept, largest first, or the last rows when keep="tail" (time
+# series). The rest are folded into a summary row that counts them and totals
+# the columns listed in sum_columns.
+def table(tool: str, title: str, columns: list, rows: list, rank_by: str = None, keep: str = "top", sum_columns: tuple = ()) -> str:
+    lines = [title, "|".join(columns)]
+    body = [_line(row) for row in rows]
+    limit = budget(tool) * CHARS_PER_TOKEN
+    used = sum(len(line) + 1 for line in lines)
+    if used + sum(len(line) + 1 for line in body) <= limit:
+        return "\n".join(lines + body)
+
+    if keep == "tail":
+        order = list(range(len(rows) - 1, -1, -1))
+    elif rank_by is not None:
+        if not callable(rank_by):
+            column = columns.index(rank_by)
+            rank_by = lambda row: row[column]
+        order = sorted(range(len(rows)), key=lambda i: _rank_value(rank_by(rows[i])), reverse=True)
+    else:
+        order = list(range(len(rows)))
+    # Room for the summary row, which is at most as wide as a full row.
+    reserve = max((len(line) for line in body), default=0) + 16
+    kept = []
+    for i in order:
+        if used + len(body[i]) + 1 + reserve > limit and kept:
+            break
+        kept.append(i)
+        used += len(body[i]) + 1
+    if keep == "tail":
+        kept.reverse()
+    kept_set = set(kept)
+    omitted = [i for i in range(len(rows)) if i not in kept_set]
+    summary = []
+    for j, column in enumerate(columns):
+        if j == 0:
+            label = "earlier" if keep == "tail" else "other"
+            summary.append(f"({len(omitted)} {label} rows)")
+        elif column in sum_columns:
+            summary.append(sum(rows[i][j] for i in omitted if _is_number(rows[i][j])))
+        else:
+            summary.append("")
+    return "\n".join(lines + [body[i] for i in kept] + [_line(summary)])
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) and value == value
+
+
+def _rank_value(value) -> float:
+    return abs(value) if _is_number(value) else -1.0
+
+
+# Names joined on one line, cut at the budget with a count of the rest.
+def name_list(tool: str, title: str, names: list) -> str:
+    limit = budget(tool) * CHARS_PER_TOKEN - len(title) - 24
+    kept = []
+    used = 0
+    for name in names:
+        if used + len(name) + 2 > limit and kept:
+            break
+        kept.append(name)
+        used += len(name) + 2
+    text = f"{title} ({len(names)}): " + ", ".join(kept)
+    if len(kept) < len(names):
+        text += f", ... ({len(names) - len(kept)} more)"
+    return text
+
+
+class OutputStats:
+    """Size of every tool result returned to the model, per tool."""
+
+    def __init__(self, recent: int = 200):
+        self._lock = threading.Lock()
+        self._tools = {}
+        self._recent = deque(maxlen=recent)
+
+    def _entry(self, tool: str) -> dict:
+        return self._tools.setdefault(tool, {"calls": 0, "chars": 0, "tokens": 0, "max_tokens": 0, "truncated": 0, "rows_omitted": 0})
+
+    def record(self, tool: str, chars: int) -> None:
+        tokens = math.ceil(chars / CHARS_PER_TOKEN)
+        with self._lock:
+            entry = self._entry(tool)
+            entry["calls"] += 1
+            entry["chars"] += chars
+            entry["tokens"] += tokens
+            entry["max_tokens"] = max(entry["max_tokens"], tokens)
+            self._recent.append({"tool": tool, "chars": chars, "tokens": tokens})
+
+    def record_truncation(self, tool: str, rows_omitted: int) -> None:
+        with self._lock:
+            entry = self._entry(tool)
+            entry["truncated"] += 1
+            entry["rows_omitted"] += rows_omitted
+
+    def stats(self) -> dict:
+        with self._lock:
+            tools = {}
+            for tool, entry in self._tools.items():
+                tools[tool] = dict(entry, budget=budget(tool), mean_tokens=entry["tokens"] / entry["calls"] if entry["calls"] else 0.0)
+            return {
+                "mode": TOOL_OUTPUT_MODE,
+                "calls": sum(entry["calls"] for entry in self._tools.values()),
+                "tokens": sum(entry["tokens"] for entry in self._tools.values()),
+                "tools": tools,
+                "recent": list(self._recent),
+            }
+
+
+output_stats = OutputStats()
+
+
+# after_tool_callback for the agents: records the size of the response as the
+# model receives it, and the rows it leaves out, for every tool including
+# cached and non-dict results.
+def record_tool_output(tool, args, tool_context, tool_response):
+    text = json.dumps(tool_response, default=str, ensure_ascii=False)
+    output_stats.record(tool.name, len(text))
+    omitted = sum(int(rows or more) for rows, more in _OMITTED.findall(text))
+    if omitted:
+        output_stats.record_truncation(tool.name, omitted)
+    return None
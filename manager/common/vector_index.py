@@ -0,0 +1,181 @@
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+import os
+
+from . import db
+
+
+# "atlas" sends similarity lookups to the $vectorSearch indexes; "local" serves
+# them from an in-process copy of the embeddings built by this module.
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "atlas").lower()
+# exact: brute-force matrix product (fine for a few thousand rows)
+# ivf:   spherical k-means coarse quantiser, probing the closest lists
+# hnsw:  hnswlib graph index (pip install hnswlib)
+VECTOR_INDEX_MODE = os.environ.get("VECTOR_INDEX_MODE", "exact").lower()
+VECTOR_IVF_LISTS = int(os.environ.get("VECTOR_IVF_LISTS", "0"))
+VECTOR_IVF_PROBES = int(os.environ.get("VECTOR_IVF_PROBES", "8"))
+# Directory for the float32 embedding matrices. When set they are written as
+# .npy files and re-opened memory-mapped instead of being held on the heap.
+VECTOR_INDEX_DIR = os.environ.get("VECTOR_INDEX_DIR", "")
+VECTOR_INDEX_TTL_SECONDS = float(os.environ.get("VECTOR_INDEX_TTL_SECONDS", "900"))
+
+
+def normalize_rows(matrix) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> tuple:
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+class VectorIndex:
+    """Cosine top-k over a fixed set of vectors. Queries are answered in batches."""
+
+    def __init__(self, vectors, mode: str = "exact", ivf_lists: int = 0, ivf_probes: int = 8):
+        self.vectors = vectors if isinstance(vectors, np.memmap) else normalize_rows(vectors)
+        self.mode = mode
+        self.ivf_probes = ivf_probes
+        if mode == "ivf":
+            self._build_ivf(ivf_lists or max(1, int(np.sqrt(len(self.vectors)))))
+        elif mode == "hnsw":
+            self._build_hnsw()
+        elif mode != "exact":
+            raise ValueError(f"Unknown vector index mode: {mode}")
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def _build_ivf(self, n_lists: int, iterations: int = 10) -> None:
+        rng = np.random.default_rng(0)
+        n_lists = min(n_lists, len(self.vectors))
+        centroids = self.vectors[rng.choice(len(self.vectors), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(self.vectors @ centroids.T, axis=1)
+            for i in range(n_lists):
+                members = self.vectors[assignment == i]
+                if len(members):
+                    centroids[i] = members.sum(axis=0)
+            centroids = normalize_rows(centroids)
+        assignment = np.argmax(self.vectors @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [np.flatnonzero(assignment == i) for i in range(n_lists)]
+
+    def _build_hnsw(self) -> None:
+        import hnswlib
+        self._hnsw = hnswlib.Index(space="ip", dim=self.vectors.shape[1])
+        self._hnsw.init_index(max_elements=len(self.vectors), ef_construction=200, M=16)
+        self._hnsw.add_items(np.asarray(self.vectors), np.arange(len(self.vectors)))
+
+    # Returns (indices, scores), both shaped (n_queries, k), best match first.
+    def search(self, queries, k: int, num_candidates: Optional[int] = None) -> tuple:
+        queries = normalize_rows(queries)
+        if len(self.vectors) == 0:
+            return _top_k(np.empty((len(queries), 0), dtype=np.float32), k)
+        if self.mode == "hnsw":
+            k = min(k, len(self.vectors))
+            self._hnsw.set_ef(max(k, num_candidates or 0, 10))
+            labels, distances = self._hnsw.knn_query(queries, k=k)
+            return labels.astype(np.int64), (1.0 - distances).astype(np.float32)
+        if self.mode == "ivf":
+            return self._search_ivf(queries, k)
+        return _top_k(queries @ self.vectors.T, k)
+
+    def _search_ivf(self, queries: np.ndarray, k: int) -> tuple:
+        probes = min(self.ivf_probes, len(self._lists))
+        closest_lists, _ = _top_k(queries @ self._centroids.T, probes)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, lists in enumerate(closest_lists):
+            candidates = np.concatenate([self._lists[i] for i in lists])
+            found, found_scores = _top_k(queries[row:row + 1] @ self.vectors[candidates].T, k)
+            indices[row, :found.shape[1]] = candidates[found[0]]
+            scores[row, :found.shape[1]] = found_scores[0]
+        return indices, scores
+
+
+class LocalCollectionIndex:
+    """Vector index over one collection plus the documents it returns."""
+
+    def __init__(self, name: str, documents: list, index: VectorIndex):
+        self.name = name
+        self.documents = documents
+        self.index = index
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def from_collection(cls, collection, path: str = "embedding") -> "LocalCollectionIndex":
+        documents = []
+        vectors = []
+        for doc in collection.find({path: {"$exists": True}}, {"_id": 0}):
+            vectors.append(doc.pop(path))
+            documents.append(doc)
+        matrix = normalize_rows(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        if VECTOR_INDEX_DIR and len(matrix):
+            os.makedirs(VECTOR_INDEX_DIR, exist_ok=True)
+            file_path = os.path.join(VECTOR_INDEX_DIR, f"{collection.name}.npy")
+            # Written beside the old file and renamed over it: other server
+            # workers may still have the old one mapped.
+            temporary_path = f"{file_path}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as f:
+                np.save(f, matrix)
+            os.replace(temporary_path, file_path)
+            matrix = np.load(file_path, mmap_mode="r")
+        index = VectorIndex(matrix, VECTOR_INDEX_MODE, VECTOR_IVF_LISTS, VECTOR_IVF_PROBES)
+        return cls(collection.name, documents, index)
+
+    def _project(self, doc: dict, fields: list) -> dict:
+        return {field: doc[field] for field in fields if field in doc}
+
+    # Same result shape as a $vectorSearch + $project pipeline.
+    def search(self, query_vector, num_candidates: int, limit: int, fields: list) -> list:
+        return self.search_many([query_vector], num_candidates, limit, fields)[0]
+
+    def search_many(self, query_vectors, num_candidates: int, limit: int, fields: list) -> list:
+        if len(self.documents) == 0:
+            return [[] for _ in query_vectors]
+        indices, _ = self.index.search(query_vectors, limit, num_candidates)
+        return [
+            [self._project(self.documents[i], fields) for i in row if i >= 0]
+            for row in indices
+        ]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_local_index(collection) -> LocalCollectionIndex:
+    local_index = _indexes.get(collection.name)
+    if local_index is None or time.monotonic() - local_index.built_at > VECTOR_INDEX_TTL_SECONDS:
+        with _indexes_lock:
+            local_index = _indexes.get(collection.name)
+            if local_index is None or time.monotonic() - local_index.built_at > VECTOR_INDEX_TTL_SECONDS:
+                local_index = LocalCollectionIndex.from_collection(collection)
+                _indexes[collection.name] = local_index
+    return local_index
+
+
+def invalidate() -> None:
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def use_local_backend() -> bool:
+    return VECTOR_BACKEND == "local"
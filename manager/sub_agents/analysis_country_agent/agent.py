@@ -1,33 +1,67 @@
 from google.adk.agents import Agent
-from google.cloud import storage
-import uuid
-import pymongo
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
 load_dotenv()
 import os
-import io
 
+from ...common import charts, db, metrics, models, resolver, router, timeseries, tool_output
+from ...common.aio import ASYNC_TOOLS
+from ...common.embedding_cache import embedding_cache
+from ...common.rollups import get_rollups
+from ...common.snapshot import get_snapshot
+from ...common.tool_cache import cached_tool
 
-MONGO_URI = os.environ.get("MONGO_URI")
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
-GCS_BUCKET = os.environ.get("GCS_BUCKET_NAME")
 
-def get_mongo_client():
-    return pymongo.MongoClient(MONGO_URI)
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 
-# These are helper functions to generate embeddings and find the closest sector name using fuzzy matchingdocker
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Embeddings for similarity search. The encoder is shared by both analysis
+# agents and loaded on first use (see manager/common/models.py).
+EMBEDDING_MODEL = models.ENCODER_ID
 def generate_embeddings(query:str) -> list:
-    embeddings = model.encode(query).tolist()
+    embeddings = embedding_cache.get_or_compute(EMBEDDING_MODEL, query, models.encode).tolist()
     return embeddings
+
+
+# Exact-name lookup in the in-memory snapshot. Returns an empty list when
+# snapshot mode is off or the name needs fuzzy resolution.
+def _snapshot_country_rows(country:str, fields:list) -> list:
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return []
+    mask = snapshot.countries.mask_eq('Country', country)
+    return snapshot.countries.rows(mask, fields)[:1]
+
+# The row of the country closest to the given name: an exact match from the
+# snapshot, or the name resolved in process and then looked up exactly.
+# Without the resolver the closest row by vector search.
+def _country_rows(country:str, fields:list) -> list:
+    result = _snapshot_country_rows(country, fields)
+    if result:
+        return result
+    if resolver.is_enabled():
+        name = resolver.resolve_name("country", country)
+        if name is None:
+            return []
+        if get_snapshot() is not None:
+            return _snapshot_country_rows(name, fields)
+        return db.find_country_rows(name, fields)
+    query_embedding = generate_embeddings(country)
+    return db.vector_search_countries(query_embedding, num_candidates=1, limit=1, fields=fields)
     
 # This function will return the list of countries available in the dataset
+@cached_tool
 def find_country_list() -> str:
-    client = get_mongo_client()
-    result = client['CO2_Emission_data']['Emission_data_feb_country'].distinct('Country')
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        result = snapshot.countries.categories['Country']
+    else:
+        result = db.distinct_countries()
+    return _format_country_list(result)
+
+def _format_country_list(result:list) -> dict:
+    if tool_output.is_compact():
+        return {"result": tool_output.name_list("find_country_list", "Countries", list(result))}
     result_list = ["Here is the list of sectors available in the dataset:\n"]
     for country in result:
         result_list.append(country + "\n")
@@ -50,180 +84,229 @@ def introduction_to_data() -> str:
     - 2022_YTD: Year-to-date total for 2022
     - 2021_YTD: Year-to-date total for 2021"""}
     
-# # This function will return similar sectors based on the query provided by the user
+# This function will return similar countries based on the query provided by the user
+@cached_tool
 def find_similar_countries(query:str)-> str:
 
-    client = get_mongo_client()
     query_embedding = generate_embeddings(query)
-    result = client['CO2_Emission_data']['Emission_data_feb_country'].aggregate([
-            {
-                "$vectorSearch": {
-                "index": "vector_index_country",
-                "path": "embedding",
-                "queryVector": query_embedding,
-                "numCandidates": 10,
-                "limit": 1
-            }
-            },
-            {
-                '$project': {
-                    '_id': 0,
-                    'Continent': 1,
-                    'Country': 1,
-                    'Mar_2025_Total': 1,
-                    'Prev_Month':1,
-                    'Mar_2024_Total':1,
-                    "Monthly_%_change":1,
-                    "2025_YTD":1,
-                    "2024_YTD":1,
-                    "2023_YTD":1,
-                    "2022_YTD":1,
-                    "2021_YTD":1
-                    
-                }
-            }
-        ])
+    result = db.vector_search_countries(query_embedding, num_candidates=10, limit=1)
+    return _format_similar_countries(result)
+
+COUNTRY_REPORT_FIELDS = ['Mar_2025_Total', 'Monthly_%_change', '2025_YTD', '2024_YTD', '2023_YTD', '2022_YTD', '2021_YTD']
+
+def _country_table(tool:str, title:str, result:list) -> dict:
+    rows = [[doc['Continent'], doc['Country']] + [doc.get(field) for field in COUNTRY_REPORT_FIELDS] for doc in result]
+    return {"result": tool_output.table(tool, title, ['Continent', 'Country'] + COUNTRY_REPORT_FIELDS, rows)}
+
+def _format_similar_countries(result:list) -> dict:
+    if tool_output.is_compact():
+        return _country_table("find_similar_countries", "The data of the country:", result)
     result_str = ["The data of the country: \n"]
     for doc in result:
         result_str.append(f"Continent: {doc['Continent']}, Country: {doc['Country']}, Mar_2025_Total: {doc['Mar_2025_Total']}, Monthly_%_change: {doc['Monthly_%_change']}, 2025_YTD: {doc['2025_YTD']}, 2024_YTD: {doc['2024_YTD']}, 2023_YTD: {doc['2023_YTD']}, 2022_YTD: {doc['2022_YTD']}, 2021_YTD: {doc['2021_YTD']}\n")
     return {"result_str": result_str}
 
 
+@cached_tool
 def get_country_report(country: str) -> str:
-    client = get_mongo_client()
+    result = _country_rows(country, db.COUNTRY_FIELDS)
+    return _format_country_report(result, country, _country_suggestions(country) if not result else [])
 
-    query_embedding = generate_embeddings(country)
-    result = client['CO2_Emission_data']['Emission_data_feb_country'].aggregate([
-            {
-                "$vectorSearch": {
-                "index": "vector_index_country",
-                "path": "embedding",
-                "queryVector": query_embedding,
-                "numCandidates": 1,
-                "limit": 1
-            }
-            },
-            {
-                '$project': {
-                    '_id': 0,
-                    'Continent': 1,
-                    'Country': 1,
-                    'Mar_2025_Total': 1,
-                    'Prev_Month':1,
-                    'Mar_2024_Total': 1,
-                    "Monthly_%_change": 1,
-                    "2025_YTD": 1,
-                    "2024_YTD": 1,
-                    "2023_YTD": 1,
-                    "2022_YTD": 1,
-                    "2021_YTD": 1
-                }
-
-            }
-        ])
+# Countries to offer when a name does not resolve.
+def _country_suggestions(country:str) -> list:
+    return resolver.suggestions("country", country) if resolver.is_enabled() else []
+
+def _format_country_report(result:list, country:str, suggestions:list = ()) -> dict:
+    if not result:
+        if suggestions:
+            return {"error": f"No data found for country: {country}. Did you mean: {', '.join(suggestions)}?"}
+        return {"error": f"No data found for country: {country}"}
+    if tool_output.is_compact():
+        return _country_table("get_country_report", "Country report:", list(result)[:1])
     country_data = pd.DataFrame(list(result))
     country_report_str = ["Country Report:\n"]
     country_report_str.append(f"Continent: {country_data.iloc[0]['Continent']} , Country: {country_data.iloc[0]['Country']}, Mar_2025_Total: {country_data.iloc[0]['Mar_2025_Total']}, Monthly_%_change: {country_data.iloc[0]['Monthly_%_change']}, 2025_YTD: {country_data.iloc[0]['2025_YTD']}, 2024_YTD: {country_data.iloc[0]['2024_YTD']}, 2023_YTD: {country_data.iloc[0]['2023_YTD']}, 2022_YTD: {country_data.iloc[0]['2022_YTD']}, 2021_YTD: {country_data.iloc[0]['2021_YTD']}\n")
     return {"result": country_report_str}
-    
-try:
-    storage_client = storage.Client()
-except Exception as e:
-    print(f"Error initializing Google Cloud Storage client: {e}")
-    storage_client = None
-    
-# --- Helper function to upload image to GCS ---
-def _upload_to_gcs(image_data: bytes, filename: str) -> str:
-    """Uploads image data to Google Cloud Storage and returns the public URL."""
-    if storage_client is None:
-        raise RuntimeError("Google Cloud Storage client not initialized.")
-
-    try:
-        bucket = storage_client.bucket(GCS_BUCKET)
-        blob = bucket.blob(f"co2_emissions_trends/{filename}") # Path within your bucket
-
-        # Upload from BytesIO directly
-        blob.upload_from_file(io.BytesIO(image_data), content_type="image/png")
-        blob.make_public() # Make public for easy viewing.
-                           # For production, consider signed URLs for better security.
 
-        return blob.public_url
-    except Exception as e:
-        raise RuntimeError(f"Failed to upload image to GCS: {e}")
 
 # This function will plot the emissions trend for a given country
-def plot_emissions_trend(country: str) -> str:
-    client = get_mongo_client()
-    query_embedding = generate_embeddings(country)
-    result = client['CO2_Emission_data']['Emission_data_feb_country'].aggregate([
-            {
-                "$vectorSearch": {
-                "index": "vector_index_country",
-                "path": "embedding",
-                "queryVector": query_embedding,
-                "numCandidates": 1,
-                "limit": 1
-            }
-            },
-            {
-                '$project': {
-                    '_id': 0,
-                    'Country': 1,
-                    '2025_YTD': 1,
-                    '2024_YTD': 1,
-                    '2023_YTD': 1,
-                    '2022_YTD': 1,
-                    '2021_YTD': 1
-                }
-            }
-        ])
+def plot_emissions_trend(country: str, start_month: str = "", end_month: str = "") -> str:
+    if timeseries.is_available():
+        try:
+            spec = _monthly_chart_spec(country, start_month, end_month)
+        except ValueError as e:
+            return {"error": str(e)}
+        if spec is not None:
+            return _chart_markdown(country, spec)
+    trend_fields = ['Country', '2025_YTD', '2024_YTD', '2023_YTD', '2022_YTD', '2021_YTD']
+    result = _country_rows(country, trend_fields)
     country_data = pd.DataFrame(list(result))
     if country_data.empty:
         return {"error": "No data found for the specified country."}
     else: 
-        plt.figure(figsize=(20,6))
-        plt.plot(range(len(country_data.iloc[0, 1:])), country_data.iloc[0, 1:])
-        plt.xticks(
-            ticks = range(len(country_data.iloc[0, 1:])),
-            labels = country_data.columns[1:],
-            rotation = 45,
-            ha = 'right'
-        )
-        plt.title(f"CO2 Emissions Trend for {country_data.iloc[0]['Country']}")
-        plt.xlabel('Year')
-        plt.ylabel('CO2 Emissions')
-        plt.grid(True)
-        plt.tight_layout()
-
-        buf = io.BytesIO()
-        plt.savefig(buf,format='png')
-        buf.seek(0)
-        plt.close()
-        
-        # Upload the image from the buffer to GCS
-        # Generate a unique filename using UUID
-        unique_filename = f"{country.replace(' ', '_').lower()}_emissions_trend_{uuid.uuid4().hex}.png"
-        try:
-            image_url = _upload_to_gcs(buf.getvalue(), unique_filename)
-            markdown_response = f"Here is the emissions trend for {country}:\n\n![CO2 Emissions Trend for {country}]({image_url})"
-            return markdown_response # Return just the markdown string
-        except RuntimeError as e:
-            return f"Error generating or uploading image for {country}: {e}"
-
-
-        
-        # plt.savefig(f"{country_data.iloc[0]['Country']}_emissions_trend.png")
-        # plt.show()
-        # image_path = f"{country_data.iloc[0]['Country']}_emissions_trend.png"
-        # with open(image_path, "rb") as image_file:
-        #     image_data = image_file.read()
-        # image_data_url = base64.b64encode(image_data).decode("utf-8")
-        
+        return _chart_markdown(country, _country_chart_spec(country_data, country))
 
-    
+def _chart_markdown(country:str, spec:charts.ChartSpec) -> str:
+    try:
+        # The file name is derived from the chart's content hash, so an
+        # unchanged trend is served from the chart cache.
+        image_url = charts.chart_url(spec)
+        markdown_response = f"Here is the emissions trend for {country}:\n\n![CO2 Emissions Trend for {country}]({image_url})"
+        return markdown_response # Return just the markdown string
+    except RuntimeError as e:
+        return f"Error generating or uploading image for {country}: {e}"
+
+# Monthly points from the time series, or None when the country has none.
+def _monthly_chart_spec(country:str, start_month:str, end_month:str):
+    name = _timeseries_country_name(country)
+    if name is None:
+        return None
+    start, end = timeseries.resolve_range("country", name, start_month, end_month)
+    points = timeseries.series("country", name, start, end)
+    if not points:
+        return None
+    return charts.ChartSpec(
+        entity=name,
+        parameter='monthly',
+        labels=[timeseries.month_label(point['period']) for point in points],
+        values=[point['value'] for point in points],
+        title=f"Monthly CO2 Emissions for {name}",
+        style='monthly_line',
+    )
+
+def _country_chart_spec(country_data:pd.DataFrame, country:str) -> charts.ChartSpec:
+    return charts.ChartSpec(
+        entity=country,
+        parameter='YTD',
+        labels=country_data.columns[1:].tolist(),
+        values=country_data.iloc[0, 1:].tolist(),
+        title=f"CO2 Emissions Trend for {country_data.iloc[0]['Country']}",
+        style='trend_line',
+    )
+
+# The dataset's name for the country if the time series has data for it,
+# resolving near matches first.
+def _timeseries_country_name(country:str):
+    if timeseries.latest_period("country", country) is not None:
+        return country
+    if resolver.is_enabled():
+        name = resolver.resolve_name("country", country)
+        if name is not None and timeseries.latest_period("country", name) is not None:
+            return name
+        return None
+    query_embedding = generate_embeddings(country)
+    result = db.vector_search_countries(query_embedding, num_candidates=10, limit=1, fields=['Country'])
+    if result and timeseries.latest_period("country", result[0]['Country']) is not None:
+        return result[0]['Country']
+    return None
+
+# Monthly emissions of a country over a range of months (YYYY-MM), with the
+# change against the previous month and the same month a year earlier.
+@cached_tool
+def get_country_trend(country: str, start_month: str = "", end_month: str = "") -> dict:
+    name = _timeseries_country_name(country)
+    if name is None:
+        return {"error": f"No monthly data found for {country}."}
+    try:
+        start, end = timeseries.resolve_range("country", name, start_month, end_month)
+    except ValueError as e:
+        return {"error": str(e)}
+    return timeseries.format_trend("get_country_trend", name, timeseries.changes("country", name, start, end))
+
+
+MAX_RANK_LIMIT = 50
+
+# The dataset's spelling of a continent, matched case-insensitively.
+def _resolve_continent(continent:str):
+    snapshot = get_snapshot()
+    names = snapshot.countries.categories['Continent'] if snapshot is not None else db.distinct_continents()
+    for name in names:
+        if db.normalize_name(name) == db.normalize_name(continent):
+            return name
+    return None
+
+# Countries ranked by one column (e.g. 2025_YTD, Mar_2025_Total,
+# Monthly_%_change), highest first unless ascending, optionally within one
+# continent. One indexed $sort/$limit query instead of a report per country.
+@cached_tool
+def rank_countries(field: str = "2025_YTD", limit: int = 10, continent: str = "", ascending: bool = False) -> dict:
+    column = db.rank_field(field)
+    if column is None:
+        return {"error": f"Unknown field: {field}. Use one of: {', '.join(db.RANK_FIELDS)}"}
+    continent_name = None
+    if continent:
+        continent_name = _resolve_continent(continent)
+        if continent_name is None:
+            return {"error": f"Unknown continent: {continent}"}
+    limit = max(1, min(int(limit), MAX_RANK_LIMIT))
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        rows = _snapshot_rank_countries(snapshot, column, limit, continent_name, ascending)
+    else:
+        rows = db.rank_countries(column, limit, continent_name, ascending)
+    return _format_country_ranking(rows, column, continent_name)
+
+def _snapshot_rank_countries(snapshot, column:str, limit:int, continent, ascending:bool) -> list:
+    table = snapshot.countries
+    values = table.numeric[column]
+    mask = ~np.isnan(values)
+    if continent is not None:
+        mask &= table.mask_eq('Continent', continent)
+    index = np.flatnonzero(mask)
+    # Country codes are in name order, so they break ties the same way as the
+    # Mongo pipeline's secondary sort.
+    order = np.lexsort((table.codes['Country'][index], values[index] if ascending else -values[index]))
+    return [
+        {'Continent': table.categories['Continent'][table.codes['Continent'][i]], 'Country': table.categories['Country'][table.codes['Country'][i]], column: float(values[i])}
+        for i in index[order[:limit]]
+    ]
+
+def _format_country_ranking(rows:list, column:str, continent) -> dict:
+    if not rows:
+        return {"error": "No countries found."}
+    scope = f" in {continent}" if continent else ""
+    if tool_output.is_compact():
+        table_rows = [[rank, row['Country'], row['Continent'], row[column]] for rank, row in enumerate(rows, 1)]
+        return {"result": tool_output.table("rank_countries", f"Countries{scope} ranked by {column}:", ['Rank', 'Country', 'Continent', column], table_rows)}
+    ranking_str = [f"Countries{scope} ranked by {column}:\n"]
+    for rank, row in enumerate(rows, 1):
+        ranking_str.append(f"{rank}. Country: {row['Country']}, Continent: {row['Continent']}, {column}: {row[column]}")
+    return {"result": "\n".join(ranking_str)}
+
+# Totals of every column per continent, with the number of countries, largest
+# first by sort_by. Read from the rollups when they are built, otherwise one
+# $group query.
+@cached_tool
+def continent_summary(sort_by: str = "2025_YTD") -> dict:
+    column = db.rank_field(sort_by)
+    if column is None:
+        return {"error": f"Unknown field: {sort_by}. Use one of: {', '.join(db.RANK_FIELDS)}"}
+    rollups = get_rollups()
+    if rollups is not None:
+        rows = [dict(row, countries=row['count']) for row in rollups.continents.values()]
+        rows.sort(key=lambda row: (-(row[column] if row[column] is not None else float('-inf')), row['Continent']))
+    else:
+        rows = db.continent_summary(column)
+    return _format_continent_summary(rows)
+
+def _format_continent_summary(rows:list) -> dict:
+    if not rows:
+        return {"error": "No continents found."}
+    if tool_output.is_compact():
+        table_rows = [[row['Continent'], row['countries']] + [row.get(field) for field in db.RANK_FIELDS] for row in rows]
+        return {"result": tool_output.table("continent_summary", "Continent totals:", ['Continent', 'Countries'] + db.RANK_FIELDS, table_rows)}
+    summary_str = ["Continent Summary:\n"]
+    for row in rows:
+        values = ", ".join(f"{field}: {row.get(field)}" for field in db.RANK_FIELDS)
+        summary_str.append(f"Continent: {row['Continent']}, Countries: {row['countries']}, {values}")
+    return {"result": "\n".join(summary_str)}
+
+
+TOOLS = metrics.timed_tools([introduction_to_data,find_similar_countries, plot_emissions_trend,get_country_report,find_country_list,get_country_trend,rank_countries,continent_summary])
+if ASYNC_TOOLS:
+    # Same tools under the same names, implemented as coroutines.
+    from .async_tools import TOOLS
 
-        
-        
 analysis_country_agent  = Agent(
     name="CO2_Emission_analysis_country_agent",
     model="gemini-2.0-flash",
@@ -237,9 +320,10 @@ analysis_country_agent  = Agent(
     5. If the user asks for an introduction to the dataset, you can use the introduction_to_data function and show the introduction.
     6. If the user asks for a country report, you can use the get_country_report function and show the report.
     7. If the user asks for a list of countries, you can use the find_country_list function and show the list.
+    8. If the user asks how a country's emissions changed over time or month over month, use the get_country_trend function. Pass start_month and end_month as YYYY-MM when the user names a period; plot_emissions_trend takes the same optional range.
+    9. If the user asks for the top or bottom countries by emissions (optionally within a continent), use rank_countries once instead of getting a report per country. For totals per continent, use continent_summary.
     """,
-    tools=[introduction_to_data,find_similar_countries, plot_emissions_trend,get_country_report,find_country_list]
+    tools=TOOLS,
+    before_model_callback=router.route_sub_agent_request,
+    after_tool_callback=tool_output.record_tool_output,
 )
-
-
-        
@@ -0,0 +1,102 @@
+import pandas as pd
+
+from ...common import aio, async_db, charts, db, metrics, resolver, timeseries
+from ...common.snapshot import get_snapshot_async
+from ...common.tool_cache import cached_tool
+from . import agent as sync_tools
+
+
+# Coroutine versions of the country tools, selected with ASYNC_TOOLS=true.
+# Names and return values match agent.py. The snapshot is loaded on the IO
+# pool and then looked up inline, since that is in-memory; name resolution may
+# encode, so it runs on the encode pool, and the row lookup awaits the
+# database.
+
+introduction_to_data = sync_tools.introduction_to_data
+
+TREND_FIELDS = ['Country', '2025_YTD', '2024_YTD', '2023_YTD', '2022_YTD', '2021_YTD']
+
+
+async def _embed(query:str) -> list:
+    return await aio.run_blocking("encode", sync_tools.generate_embeddings, query)
+
+
+async def _country_rows(country:str, fields:list, num_candidates:int, limit:int) -> list:
+    snapshot = await get_snapshot_async()
+    result = sync_tools._snapshot_country_rows(country, fields) if snapshot is not None else []
+    if not result and resolver.is_enabled():
+        # Building the resolver or ranking a new name may encode.
+        name = await aio.run_blocking("encode", resolver.resolve_name, "country", country)
+        if name is None:
+            return []
+        if snapshot is not None:
+            return sync_tools._snapshot_country_rows(name, fields)
+        result = await async_db.find_country_rows(name, fields)
+    elif not result:
+        query_embedding = await _embed(country)
+        result = await async_db.vector_search_countries(query_embedding, num_candidates=num_candidates, limit=limit, fields=fields)
+    return result
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def find_country_list() -> dict:
+    snapshot = await get_snapshot_async()
+    if snapshot is not None:
+        result = snapshot.countries.categories['Country']
+    else:
+        result = await async_db.distinct_countries()
+    return sync_tools._format_country_list(result)
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def find_similar_countries(query:str) -> dict:
+    query_embedding = await _embed(query)
+    result = await async_db.vector_search_countries(query_embedding, num_candidates=10, limit=1)
+    return sync_tools._format_similar_countries(result)
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def get_country_report(country:str) -> dict:
+    result = await _country_rows(country, db.COUNTRY_FIELDS, num_candidates=1, limit=1)
+    suggestions = await aio.run_blocking("encode", sync_tools._country_suggestions, country) if not result else []
+    return sync_tools._format_country_report(result, country, suggestions)
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def get_country_trend(country:str, start_month:str = "", end_month:str = "") -> dict:
+    return await aio.run_blocking("io", sync_tools.get_country_trend.__wrapped__, country, start_month, end_month)
+
+
+@aio.limit_concurrency(2)
+async def plot_emissions_trend(country:str, start_month:str = "", end_month:str = "") -> str:
+    if await aio.run_blocking("io", timeseries.is_available):
+        # Monthly charts come from index lookups on the time series.
+        return await aio.run_blocking("io", sync_tools.plot_emissions_trend, country, start_month, end_month)
+    country_data = pd.DataFrame(await _country_rows(country, TREND_FIELDS, num_candidates=1, limit=1))
+    if country_data.empty:
+        return {"error": "No data found for the specified country."}
+    spec = sync_tools._country_chart_spec(country_data, country)
+    try:
+        image_url = await charts.chart_url_async(spec)
+        return f"Here is the emissions trend for {country}:\n\n![CO2 Emissions Trend for {country}]({image_url})"
+    except RuntimeError as e:
+        return f"Error generating or uploading image for {country}: {e}"
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def rank_countries(field:str = "2025_YTD", limit:int = 10, continent:str = "", ascending:bool = False) -> dict:
+    return await aio.run_blocking("io", sync_tools.rank_countries.__wrapped__, field, limit, continent, ascending)
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def continent_summary(sort_by:str = "2025_YTD") -> dict:
+    return await aio.run_blocking("io", sync_tools.continent_summary.__wrapped__, sort_by)
+
+
+TOOLS = metrics.timed_tools([introduction_to_data, find_similar_countries, plot_emissions_trend, get_country_report, find_country_list, get_country_trend, rank_countries, continent_summary])
@@ -1,29 +1,75 @@
 from google.adk.agents import Agent
-from google.cloud import storage
-import uuid
-import pymongo
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from sentence_transformers import SentenceTransformer
-import io
 from dotenv import load_dotenv
 load_dotenv()
 import os
 
+from ...common import charts, db, metrics, models, resolver, router, timeseries, tool_output
+from ...common.aio import ASYNC_TOOLS
+from ...common.embedding_cache import embedding_cache
+from ...common.rollups import get_rollups
+from ...common.snapshot import get_snapshot
+from ...common.tool_cache import cached_tool
 
-MONGO_URI = os.environ.get("MONGO_URI")
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
-GCS_BUCKET = os.environ.get("GCS_BUCKET_NAME")
 
-def get_mongo_client():
-    return pymongo.MongoClient(MONGO_URI)
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 
-# These are helper functions to generate embeddings and find the closest sector name using fuzzy matchingdocker
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Embeddings for similarity search. The encoder is shared by both analysis
+# agents and loaded on first use (see manager/common/models.py).
+EMBEDDING_MODEL = models.ENCODER_ID
 def generate_embeddings(query:str) -> list:
-    embeddings = model.encode(query).tolist()
+    embeddings = embedding_cache.get_or_compute(EMBEDDING_MODEL, query, models.encode).tolist()
     return embeddings
 
+def generate_embeddings_batch(queries:list) -> list:
+    vectors = embedding_cache.get_or_compute_many(EMBEDDING_MODEL, queries, models.encode)
+    return [vector.tolist() for vector in vectors]
+
+
+# Looks the sector up by its indexed normalized name and returns all of its
+# subsectors. A name that does not match exactly is resolved to the closest
+# sector in the dataset first.
+def _fetch_sector_rows(sector_name:str) -> pd.DataFrame:
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        mask = _snapshot_sector_mask(snapshot, sector_name)
+        return pd.DataFrame(snapshot.sectors.rows(mask, db.SECTOR_FIELDS))
+    rows = db.find_sector_rows(sector_name)
+    if not rows and resolver.is_enabled():
+        resolved_name = resolver.resolve_name("sector", sector_name)
+        rows = db.find_sector_rows(resolved_name) if resolved_name else []
+    elif not rows:
+        query_embedding = generate_embeddings(sector_name)
+        candidates = db.vector_search_sectors(query_embedding, num_candidates=100, limit=20)
+        if not candidates:
+            return pd.DataFrame()
+        resolved_name = db.normalize_name(candidates[0]['Sector_name'])
+        rows = db.find_sector_rows(resolved_name)
+        if not rows:
+            # Documents loaded before the normalized field existed.
+            rows = [doc for doc in candidates if db.normalize_name(doc['Sector_name']) == resolved_name]
+    return pd.DataFrame(rows)
+
+
+# Returns the dataset's spelling of the sector closest to the given name.
+def _resolve_sector_name(sector_name:str):
+    if resolver.is_enabled():
+        return resolver.resolve_name("sector", sector_name)
+    query_embedding = generate_embeddings(sector_name)
+    candidates = db.vector_search_sectors(query_embedding, num_candidates=100, limit=1, fields=['Sector_name'])
+    if not candidates:
+        return None
+    return candidates[0]['Sector_name']
+
+
+def _snapshot_sector_mask(snapshot, sector_name:str):
+    mask = snapshot.sectors.mask_eq('Sector_name', sector_name)
+    if not mask.any():
+        resolved_name = _resolve_sector_name(sector_name)
+        if resolved_name is not None:
+            mask = snapshot.sectors.mask_eq('Sector_name', resolved_name)
+    return mask
 
 
 # This function will return an introduction to the dataset
@@ -44,46 +90,37 @@ def introduction_to_data() -> str:
     - 2021_YTD: Year-to-date total for 2021"""}
     
 # This function will return a list of sectors available in the dataset
+@cached_tool
 def get_sector_list() -> str:
-    client = get_mongo_client()
-    sectors = client['CO2_Emission_data']['Emission_data_feb'].distinct('Sector_name')
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        sectors = snapshot.sectors.categories['Sector_name']
+    else:
+        sectors = db.distinct_sectors()
+    return _format_sector_list(sectors)
+
+def _format_sector_list(sectors:list) -> dict:
+    if tool_output.is_compact():
+        return {"result": tool_output.name_list("get_sector_list", "Sectors", list(sectors))}
     sector_list = ["Here is the list of sectors available in the dataset:\n"]
     for sector in sectors:
         sector_list.append(sector+ "\n")
     return {"result": "\n".join(sector_list)}
 # This function will return similar sectors based on the query provided by the user
+@cached_tool
 def find_similar_sectors(query:str)-> str:
 
-    client = get_mongo_client()
     query_embedding = generate_embeddings(query)
-    result = client['CO2_Emission_data']['Emission_data_feb'].aggregate([
-        {
-            "$vectorSearch": {
-            "index": "vector_index",
-            "path": "embedding",
-            "queryVector": query_embedding,
-            "numCandidates": 100,
-            "limit": 6
-        }
-        },
-        {
-            '$project': {
-                '_id': 0,
-                'Sector_name': 1,
-                'Subsector_Name': 1,
-                'Mar_2025_Total': 1,
-                'Prev_Month':1,
-                'Mar_2024_Total':1,
-                "Monthly_%_change":1,
-                "2025_YTD":1,
-                "2024_YTD":1,
-                "2023_YTD":1,
-                "2022_YTD":1,
-                "2021_YTD":1
-                
-            }
-        }
-    ])
+    result = db.vector_search_sectors(query_embedding, num_candidates=100, limit=6)
+    return _format_similar_sectors(result)
+
+REPORT_FIELDS = ['Mar_2025_Total', 'Prev_Month', 'Mar_2024_Total', 'Monthly_%_change', '2025_YTD', '2024_YTD', '2023_YTD', '2022_YTD', '2021_YTD']
+SIMILAR_FIELDS = ['Mar_2025_Total', 'Monthly_%_change', '2025_YTD', '2024_YTD', '2023_YTD', '2022_YTD', '2021_YTD']
+
+def _format_similar_sectors(result:list) -> dict:
+    if tool_output.is_compact():
+        rows = [[doc['Sector_name'], doc['Subsector_Name']] + [doc.get(field) for field in SIMILAR_FIELDS] for doc in result]
+        return {"result": tool_output.table("find_similar_sectors", "Similar sectors:", ['Sector', 'Subsector'] + SIMILAR_FIELDS, rows)}
     result_str = ["These are the sectors that are similar to your query: \n"]
     for doc in result:
         result_str.append(f"Sector: {doc['Sector_name']}, Subsector: {doc['Subsector_Name']}, Mar_2025_Total: {doc['Mar_2025_Total']}, Monthly_%_change: {doc['Monthly_%_change']}, 2025_YTD: {doc['2025_YTD']}, 2024_YTD: {doc['2024_YTD']}, 2023_YTD: {doc['2023_YTD']}, 2022_YTD: {doc['2022_YTD']}, 2021_YTD: {doc['2021_YTD']}")
@@ -92,59 +129,28 @@ def find_similar_sectors(query:str)-> str:
 
 
 # This function will generate a report for a specific sector    
+@cached_tool
 def get_sector_report(sector_name:str) -> str:
     
-    client = get_mongo_client()
-    
-    
-    query_embedding = generate_embeddings(sector_name)
-    sector_data = client['CO2_Emission_data']['Emission_data_feb'].aggregate([
-        {
-            "$vectorSearch":{
-                "index":"vector_index",
-                "path" : "embedding",
-                "queryVector":query_embedding,
-                "numCandidates":100,
-                "limit": 20
-                
-            }
-        },
-        {
-            "$project":{
-                "_id":0,
-                'Sector_name': 1,
-                'Subsector_Name': 1,
-                'Mar_2025_Total': 1,
-                'Prev_Month':1,
-                'Mar_2024_Total':1,
-                "Monthly_%_change":1,
-                "2025_YTD":1,
-                "2024_YTD":1,
-                "2023_YTD":1,
-                "2022_YTD":1,
-                "2021_YTD":1
-            }
-        }
-    ])
-    sector_data = pd.DataFrame(list(sector_data))
-    sector_data = sector_data[sector_data['Sector_name'].astype(str).str.lower() == sector_name.lower()]
-    if sector_data.empty:
-        return f"No data found for sector: {sector_name}"
-    else: 
-        sector_summary = sector_data.groupby('Subsector_Name').agg({
-            'Mar_2025_Total': 'sum',
-            'Prev_Month': 'sum',
-            'Mar_2024_Total': 'sum',
-            "Monthly_%_change": 'mean',
-            "2025_YTD": 'sum',
-            "2024_YTD": 'sum',
-            "2023_YTD": 'sum',
-            "2022_YTD": 'sum',
-            "2021_YTD": 'sum'
-        }).reset_index()
-        
+    sector_summary = _sector_summary(sector_name)
+    if not sector_summary:
+        return _sector_not_found(sector_name)
+    return _format_sector_report(sector_summary)
+
+# The message for a sector that does not resolve, with the nearest names.
+def _sector_not_found(sector_name:str) -> str:
+    suggestions = resolver.suggestions("sector", sector_name) if resolver.is_enabled() else []
+    if suggestions:
+        return f"No data found for sector: {sector_name}. Did you mean: {', '.join(suggestions)}?"
+    return f"No data found for sector: {sector_name}"
+
+def _format_sector_report(sector_summary:list) -> dict:
+    if tool_output.is_compact():
+        rows = [[row['Subsector_Name']] + [row.get(field) for field in REPORT_FIELDS] for row in sector_summary]
+        text = tool_output.table("get_sector_report", "Sector report:", ['Subsector'] + REPORT_FIELDS, rows, rank_by='Mar_2025_Total', sum_columns=SUMMED_FIELDS)
+        return {"result": text}
     sector_summary_str=["Sector Report:\n"]
-    for index, row in sector_summary.iterrows():
+    for row in sector_summary:
         sector_summary_str.append(
             
                 f"Subsector: {row['Subsector_Name']}, Mar_2025_Total: {str(row['Mar_2025_Total'])}, Prev_Month: {str(row['Prev_Month'])}, Mar_2024_Total: {str(row['Mar_2024_Total'])}, Monthly_%_change: {str(row['Monthly_%_change'])}, 2025_YTD: {str(row['2025_YTD'])}, 2024_YTD: {str(row['2024_YTD'])}, 2023_YTD: {str(row['2023_YTD'])}, 2022_YTD: {str(row['2022_YTD'])}, 2021_YTD: {str(row['2021_YTD'])}\n"
@@ -152,180 +158,314 @@ def get_sector_report(sector_name:str) -> str:
         )
     return {"result" : "\n".join(sector_summary_str)}
 
+
+SUMMED_FIELDS = ['Mar_2025_Total', 'Prev_Month', 'Mar_2024_Total', '2025_YTD', '2024_YTD', '2023_YTD', '2022_YTD', '2021_YTD']
+
+# Per-subsector totals of a sector, one dict per subsector in name order.
+def _sector_summary(sector_name:str) -> list:
+    rollups = get_rollups()
+    if rollups is not None:
+        return _rollup_subsectors(rollups, sector_name)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        mask = _snapshot_sector_mask(snapshot, sector_name)
+        if not mask.any():
+            return []
+        return snapshot.sectors.group('Subsector_Name', mask, SUMMED_FIELDS, ['Monthly_%_change'])
+    return _summarize_sector_rows(_fetch_sector_rows(sector_name))
+
+# Precomputed per-subsector totals; a name that is not an exact match is
+# resolved to the closest sector first.
+def _rollup_subsectors(rollups, sector_name:str) -> list:
+    rows = rollups.sector_subsectors(sector_name)
+    if rows is None:
+        resolved_name = _resolve_sector_name(sector_name)
+        rows = rollups.sector_subsectors(resolved_name) if resolved_name else None
+    return rows or []
+
+def _summarize_sector_rows(sector_data:pd.DataFrame) -> list:
+    if sector_data.empty:
+        return []
+    sector_summary = sector_data.groupby('Subsector_Name').agg({
+        'Mar_2025_Total': 'sum',
+        'Prev_Month': 'sum',
+        'Mar_2024_Total': 'sum',
+        "Monthly_%_change": 'mean',
+        "2025_YTD": 'sum',
+        "2024_YTD": 'sum',
+        "2023_YTD": 'sum',
+        "2022_YTD": 'sum',
+        "2021_YTD": 'sum'
+    }).reset_index()
+    return sector_summary.to_dict('records')
+
 # this function will compare two sectors based on several characteristics and return the data for both sectors
+@cached_tool
 def compare_sectors(sector1:str, sector2:str) -> str:
-    client = get_mongo_client()
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return _compare_sectors_snapshot(snapshot, sector1, sector2)
+    if resolver.is_enabled():
+        return _compare_sectors_resolved(sector1, sector2)
     query_embedding1 = generate_embeddings(sector1)
     query_embedding2 = generate_embeddings(sector2)
-    sector1_data = client['CO2_Emission_data']['Emission_data_feb'].aggregate([
-        {
-            "$vectorSearch":{
-                "index":"vector_index",
-                "path" : "embedding",
-                "queryVector":query_embedding1,
-                "numCandidates":100,
-                "limit": 20
-                
-            }
-        },
-        {
-            "$project":{
-                "_id":0,
-                'Subsector_Name': 1,
-                'Mar_2025_Total': 1,
-                'Prev_Month':1,
-                'Mar_2024_Total':1,
-                "Monthly_%_change":1,
-                "2025_YTD":1,
-                "2024_YTD":1,
-                "2023_YTD":1,
-                "2022_YTD":1,
-                "2021_YTD":1
-            }
-        }
-    ])
-    sector2_data = client['CO2_Emission_data']['Emission_data_feb'].aggregate([
-        {
-            "$vectorSearch":{
-                "index":"vector_index",
-                "path" : "embedding",
-                "queryVector":query_embedding2,
-                "numCandidates":100,
-                "limit": 100
-                
-            }
-        },
-        {
-            "$project":{
-                "_id":0,
-                'Subsector_Name': 1,
-                'Mar_2025_Total': 1,
-                'Prev_Month':1,
-                'Mar_2024_Total':1,
-                "Monthly_%_change":1,
-                "2025_YTD":1,
-                "2024_YTD":1,
-                "2023_YTD":1,
-                "2022_YTD":1,
-                "2021_YTD":1
-            }
-        }
-    ])
+    comparison_fields = [field for field in db.SECTOR_FIELDS if field != 'Sector_name']
+    sector1_data = db.vector_search_sectors(query_embedding1, num_candidates=100, limit=20, fields=comparison_fields)
+    sector2_data = db.vector_search_sectors(query_embedding2, num_candidates=100, limit=100, fields=comparison_fields)
+    return _format_sector_comparison(sector1_data, sector2_data)
+
+def _format_sector_comparison(sector1_data:list, sector2_data:list) -> dict:
     if sector1_data is None or sector2_data is None:
         return {'error': 'One or both sectors not found. Please check the sector names.'}
     else:
         sector1_data = pd.DataFrame(list(sector1_data))
         sector2_data = pd.DataFrame(list(sector2_data))
-        comparison_str = ["Comparison between sectors:\n"]
         comparison_df = pd.merge(sector1_data, sector2_data, on='Subsector_Name', suffixes=('_sector1', '_sector2'))
-        for index, row in comparison_df.iterrows():
-            comparison_str.append(f"Subsector: {row['Subsector_Name']}, Sector1 - Mar_2025_Total: {str(row['Mar_2025_Total_sector1'])}, Sector2 - Mar_2025_Total: {str(row['Mar_2025_Total_sector2'])}, Sector1 - Monthly_%_change: {str(row['Monthly_%_change_sector1'])}, Sector2 - Monthly_%_change: {str(row['Monthly_%_change_sector2'])}")
-        
+        rows = [
+            [row['Subsector_Name'], row['Mar_2025_Total_sector1'], row['Mar_2025_Total_sector2'], row['Monthly_%_change_sector1'], row['Monthly_%_change_sector2']]
+            for index, row in comparison_df.iterrows()
+        ]
+    return _format_comparison_rows(rows)
+
+# Both names resolved to dataset sectors, each sector's rows totalled per
+# subsector and joined on the subsectors they share.
+def _compare_sectors_resolved(sector1:str, sector2:str) -> dict:
+    comparison_fields = ['Subsector_Name', 'Mar_2025_Total', 'Monthly_%_change']
+    summaries = []
+    for sector in (sector1, sector2):
+        name = _resolve_sector_name(sector)
+        rows = db.find_sector_rows(name, fields=comparison_fields) if name else []
+        summaries.append(_summarize_comparison_rows(rows) if rows else None)
+    return _format_sector_comparison(*summaries)
+
+def _summarize_comparison_rows(rows:list) -> list:
+    return pd.DataFrame(rows).groupby('Subsector_Name').agg({'Mar_2025_Total': 'sum', 'Monthly_%_change': 'mean'}).reset_index().to_dict('records')
+
+# rows are [subsector, total1, total2, change1, change2].
+def _format_comparison_rows(rows:list) -> dict:
+    if tool_output.is_compact():
+        columns = ['Subsector', 'S1 Mar_2025_Total', 'S2 Mar_2025_Total', 'S1 Monthly_%_change', 'S2 Monthly_%_change']
+        text = tool_output.table("compare_sectors", "Comparison between sectors (S1, S2):", columns, rows,
+                                 rank_by=lambda row: np.nansum([abs(row[1]), abs(row[2])]), sum_columns=columns[1:3])
+        return {"result": text}
+    comparison_str = ["Comparison between sectors:\n"]
+    for subsector, total1, total2, change1, change2 in rows:
+        comparison_str.append(f"Subsector: {subsector}, Sector1 - Mar_2025_Total: {str(total1)}, Sector2 - Mar_2025_Total: {str(total2)}, Sector1 - Monthly_%_change: {str(change1)}, Sector2 - Monthly_%_change: {str(change2)}")
     return {"result" : "\n".join(comparison_str)}
 
 
+# Same comparison answered from the in-memory snapshot: both sectors are
+# pivoted by subsector with bincount and joined on the subsectors they share.
+def _compare_sectors_snapshot(snapshot, sector1:str, sector2:str) -> dict:
+    masks = [_snapshot_sector_mask(snapshot, sector1), _snapshot_sector_mask(snapshot, sector2)]
+    if not masks[0].any() or not masks[1].any():
+        return {'error': 'One or both sectors not found. Please check the sector names.'}
+    present, totals = snapshot.sectors.pivot('Subsector_Name', masks, 'Mar_2025_Total')
+    _, changes = snapshot.sectors.pivot('Subsector_Name', masks, 'Monthly_%_change', how='mean')
+    subsectors = snapshot.sectors.categories['Subsector_Name']
+    rows = [
+        [subsectors[code], totals[0, code], totals[1, code], changes[0, code], changes[1, code]]
+        for code in np.flatnonzero(present.all(axis=0))
+    ]
+    return _format_comparison_rows(rows)
+
+
+# Compares any number of sectors at once. Names that do not match exactly are
+# resolved to the closest dataset sector, with the ones that need encoding
+# embedded together in one batch; all sectors are then fetched with a single
+# $in query and pivoted by subsector.
+@cached_tool
+def compare_sectors_many(sectors:list[str]) -> dict:
+    if not sectors:
+        return {'error': 'Please provide at least one sector name.'}
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        known = {db.normalize_name(name): name for name in snapshot.sectors.categories['Sector_name']}
+    else:
+        known = {db.normalize_name(name): name for name in db.distinct_sectors()}
+    resolved = {}
+    unmatched = []
+    for sector in sectors:
+        if db.normalize_name(sector) in known:
+            resolved[sector] = known[db.normalize_name(sector)]
+        else:
+            unmatched.append(sector)
+    if unmatched and resolver.is_enabled():
+        for sector, name in zip(unmatched, resolver.resolve_names("sector", unmatched)):
+            if name is not None:
+                resolved[sector] = name
+    elif unmatched:
+        query_embeddings = generate_embeddings_batch(unmatched)
+        hits = db.vector_search_sectors_many(query_embeddings, num_candidates=100, limit=1, fields=['Sector_name'])
+        for sector, hit in zip(unmatched, hits):
+            if hit:
+                resolved[sector] = hit[0]['Sector_name']
+    sector_names = list(dict.fromkeys(resolved.values()))
+    missing = [sector for sector in sectors if sector not in resolved]
+    if not sector_names:
+        return {'error': f"None of the sectors were found: {', '.join(sectors)}"}
+
+    if snapshot is not None:
+        masks = [snapshot.sectors.mask_eq('Sector_name', name) for name in sector_names]
+        present, totals = snapshot.sectors.pivot('Subsector_Name', masks, 'Mar_2025_Total')
+        _, changes = snapshot.sectors.pivot('Subsector_Name', masks, 'Monthly_%_change', how='mean')
+        _, ytd = snapshot.sectors.pivot('Subsector_Name', masks, '2025_YTD')
+        keep = present.any(axis=0)
+        subsectors = np.asarray(snapshot.sectors.categories['Subsector_Name'], dtype=object)[keep]
+        present, totals, changes, ytd = present[:, keep], totals[:, keep], changes[:, keep], ytd[:, keep]
+    else:
+        rows = pd.DataFrame(db.find_rows_for_sectors(sector_names, fields=['Sector_name', 'Subsector_Name', 'Mar_2025_Total', 'Monthly_%_change', '2025_YTD']))
+        pivot = rows.pivot_table(
+            index='Subsector_Name',
+            columns='Sector_name',
+            values=['Mar_2025_Total', 'Monthly_%_change', '2025_YTD'],
+            aggfunc={'Mar_2025_Total': 'sum', 'Monthly_%_change': 'mean', '2025_YTD': 'sum'},
+        )
+        subsectors = pivot.index.to_numpy()
+        totals = pivot['Mar_2025_Total'].reindex(columns=sector_names).to_numpy().T
+        changes = pivot['Monthly_%_change'].reindex(columns=sector_names).to_numpy().T
+        ytd = pivot['2025_YTD'].reindex(columns=sector_names).to_numpy().T
+        present = ~np.isnan(totals)
+
+    sector_totals = np.nansum(totals, axis=1)
+    sector_ytd = np.nansum(ytd, axis=1)
+    sector_changes = np.nanmean(np.where(present, changes, np.nan), axis=1)
+    if tool_output.is_compact():
+        return _format_many_compact(sector_names, missing, sector_totals, sector_changes, sector_ytd, subsectors, present, totals, changes)
+    comparison_str = [f"Comparison between sectors: {', '.join(sector_names)}\n"]
+    if missing:
+        comparison_str.append(f"Sectors not found: {', '.join(missing)}")
+    comparison_str.append("Sector totals:")
+    for i, name in enumerate(sector_names):
+        comparison_str.append(f"Sector: {name}, Mar_2025_Total: {str(sector_totals[i])}, Monthly_%_change: {str(sector_changes[i])}, 2025_YTD: {str(sector_ytd[i])}")
+    comparison_str.append("\nSubsectors:")
+    for j, subsector in enumerate(subsectors):
+        values = [
+            f"{name} - Mar_2025_Total: {str(totals[i, j])}, {name} - Monthly_%_change: {str(changes[i, j])}"
+            for i, name in enumerate(sector_names) if present[i, j]
+        ]
+        comparison_str.append(f"Subsector: {subsector}, " + ", ".join(values))
+    return {"result" : "\n".join(comparison_str)}
 
-try:
-    storage_client = storage.Client()
-except Exception as e:
-    print(f"Error initializing Google Cloud Storage client: {e}")
-    storage_client = None
-    
-# --- Helper function to upload image to GCS ---
-def _upload_to_gcs(image_data: bytes, filename: str) -> str:
-    """Uploads image data to Google Cloud Storage and returns the public URL."""
-    if storage_client is None:
-        raise RuntimeError("Google Cloud Storage client not initialized.")
 
-    try:
-        bucket = storage_client.bucket(GCS_BUCKET)
-        blob = bucket.blob(f"co2_emissions_trends/{filename}") # Path within your bucket
+# One table of sector totals, then one row per subsector with a total and a
+# change column per sector; subsectors a sector lacks are left blank.
+def _format_many_compact(sector_names, missing, sector_totals, sector_changes, sector_ytd, subsectors, present, totals, changes) -> dict:
+    lines = []
+    if missing:
+        lines.append(f"Sectors not found: {', '.join(missing)}")
+    rows = [[name, sector_totals[i], sector_changes[i], sector_ytd[i]] for i, name in enumerate(sector_names)]
+    lines.append(tool_output.table("compare_sectors_many", "Sector totals:", ['Sector', 'Mar_2025_Total', 'Monthly_%_change', '2025_YTD'], rows))
+    columns = ['Subsector']
+    for name in sector_names:
+        columns += [f"{name} Mar_2025_Total", f"{name} Monthly_%_change"]
+    rows = []
+    for j, subsector in enumerate(subsectors):
+        row = [subsector]
+        for i in range(len(sector_names)):
+            row += [totals[i, j], changes[i, j]] if present[i, j] else [None, None]
+        rows.append(row)
+    lines.append(tool_output.table("compare_sectors_many", "Subsectors:", columns, rows,
+                                   rank_by=lambda row: np.nansum([abs(value) for value in row[1::2] if value is not None]),
+                                   sum_columns=columns[1::2]))
+    return {"result": "\n".join(lines)}
 
-        # Upload from BytesIO directly
-        blob.upload_from_file(io.BytesIO(image_data), content_type="image/png")
-        blob.make_public() # Make public for easy viewing.
-                           # For production, consider signed URLs for better security.
 
-        return blob.public_url
-    except Exception as e:
-        raise RuntimeError(f"Failed to upload image to GCS: {e}")
 # This function will generate a graph as a report for a specific sector
 def get_graph_report(sector_name:str, parameter:str )-> str:
-    client = get_mongo_client()
-    
-   
-    query_embedding = generate_embeddings(sector_name)
-    sector_data = client['CO2_Emission_data']['Emission_data_feb'].aggregate([
-        {
-            "$vectorSearch":{
-                "index":"vector_index",
-                "path" : "embedding",
-                "queryVector":query_embedding,
-                "numCandidates":100,
-                "limit": 20
-                
-            }
-        },
-        {
-            "$project":{
-                "_id":0,
-                'Sector_name': 1,
-                'Subsector_Name': 1,
-                'Mar_2025_Total': 1,
-                'Prev_Month':1,
-                'Mar_2024_Total':1,
-                "Monthly_%_change":1,
-                "2025_YTD":1,
-                "2024_YTD":1,
-                "2023_YTD":1,
-                "2022_YTD":1,
-                "2021_YTD":1
-            }
-        }
-    ])
-    sector_data = pd.DataFrame(list(sector_data))
-    sector_data = sector_data[sector_data['Sector_name'].astype(str).str.lower() == sector_name.lower()]
+    sector_data = _graph_rows(sector_name)
     if sector_data.empty:
         return f"No data found for sector: {sector_name}"
     else:
-        plt.figure(figsize=(20, 6))
-        plt.title(f"CO2 Emissions for {sector_name} Sector")
-        plt.plot(range(len(sector_data[parameter])), sector_data[parameter])
-        plt.xticks(ticks=range(len(sector_data['Subsector_Name'])),
-                    labels=sector_data['Subsector_Name'],
-                    rotation=45,
-                    ha='right')
-        plt.xlabel('Subsector')
-        plt.ylabel('CO2 Emissions')
-        
-        buf = io.BytesIO()
-        plt.savefig(buf,format='png')
-        buf.seek(0)
-        plt.close()
-        
-        unique_filename = f"{sector_name.replace(' ', '_').lower()}_emissions_trend_{uuid.uuid4().hex}.png"
         try:
-            image_url = _upload_to_gcs(buf.getvalue(), unique_filename)
+            # Identical charts share a content hash, so a repeat request gets
+            # the already uploaded image back without rendering again.
+            image_url = charts.chart_url(_sector_chart_spec(sector_data, sector_name, parameter))
             markdown_response = f"Here is the emissions trend for {sector_name}:\n\n![CO2 Emissions Trend for {sector_name}]({image_url})"
             return markdown_response # Return just the markdown string
         except RuntimeError as e:
             return f"Error generating or uploading image for {sector_name}: {e}"
-        
-
-
-
-
-
-
-
-
-    
-
-
-    
-
-
 
+# One point per subsector from the rollups when they are built, otherwise the
+# sector's raw rows.
+def _graph_rows(sector_name:str) -> pd.DataFrame:
+    rollups = get_rollups()
+    if rollups is not None:
+        return pd.DataFrame(_rollup_subsectors(rollups, sector_name))
+    return _fetch_sector_rows(sector_name)
+
+def _sector_chart_spec(sector_data:pd.DataFrame, sector_name:str, parameter:str) -> charts.ChartSpec:
+    return charts.ChartSpec(
+        entity=sector_name,
+        parameter=parameter,
+        labels=sector_data['Subsector_Name'].tolist(),
+        values=sector_data[parameter].tolist(),
+        title=f"CO2 Emissions for {sector_name} Sector",
+        style='subsector_line',
+    )
+
+
+# Monthly emissions of a sector (all subsectors summed) over a range of months
+# (YYYY-MM), with month-over-month and year-over-year change.
+@cached_tool
+def get_sector_trend(sector_name: str, start_month: str = "", end_month: str = "") -> dict:
+    name = sector_name
+    if timeseries.latest_period("sector", name) is None:
+        name = _resolve_sector_name(sector_name)
+        if name is None or timeseries.latest_period("sector", name) is None:
+            return {"error": f"No monthly data found for sector: {sector_name}"}
+    try:
+        start, end = timeseries.resolve_range("sector", name, start_month, end_month)
+    except ValueError as e:
+        return {"error": str(e)}
+    return timeseries.format_trend("get_sector_trend", name, timeseries.changes("sector", name, start, end))
+
+
+MAX_RANK_LIMIT = 50
+
+# Subsectors ranked by one column (e.g. 2025_YTD, Mar_2025_Total,
+# Monthly_%_change), highest first unless ascending, across all sectors or
+# within one. Read from the rollups when they are built, otherwise one
+# $group/$sort/$limit query.
+@cached_tool
+def rank_subsectors(field: str = "2025_YTD", limit: int = 10, sector_name: str = "", ascending: bool = False) -> dict:
+    column = db.rank_field(field)
+    if column is None:
+        return {"error": f"Unknown field: {field}. Use one of: {', '.join(db.RANK_FIELDS)}"}
+    limit = max(1, min(int(limit), MAX_RANK_LIMIT))
+    rollups = get_rollups()
+    if rollups is not None:
+        if sector_name:
+            rows = _rollup_subsectors(rollups, sector_name)
+        else:
+            rows = [row for sector_rows in rollups.subsectors.values() for row in sector_rows]
+        rows = [row for row in rows if row.get(column) is not None]
+        rows.sort(key=lambda row: ((row[column] if ascending else -row[column]), row['Subsector_Name']))
+        rows = rows[:limit]
+    else:
+        rows = db.rank_subsectors(column, limit, sector_name or None, ascending)
+        if not rows and sector_name:
+            resolved_name = _resolve_sector_name(sector_name)
+            if resolved_name is not None:
+                rows = db.rank_subsectors(column, limit, resolved_name, ascending)
+    return _format_subsector_ranking(rows, column)
+
+def _format_subsector_ranking(rows:list, column:str) -> dict:
+    if not rows:
+        return {"error": "No subsectors found."}
+    if tool_output.is_compact():
+        table_rows = [[rank, row['Subsector_Name'], row['Sector_name'], row[column]] for rank, row in enumerate(rows, 1)]
+        return {"result": tool_output.table("rank_subsectors", f"Subsectors ranked by {column}:", ['Rank', 'Subsector', 'Sector', column], table_rows)}
+    ranking_str = [f"Subsectors ranked by {column}:\n"]
+    for rank, row in enumerate(rows, 1):
+        ranking_str.append(f"{rank}. Subsector: {row['Subsector_Name']}, Sector: {row['Sector_name']}, {column}: {row[column]}")
+    return {"result": "\n".join(ranking_str)}
+
+
+TOOLS = metrics.timed_tools([introduction_to_data,find_similar_sectors,compare_sectors,compare_sectors_many,get_sector_report,get_graph_report,get_sector_list,get_sector_trend,rank_subsectors])
+if ASYNC_TOOLS:
+    # Same tools under the same names, implemented as coroutines.
+    from .async_tools import TOOLS
 
 analysis_sector_agent = Agent(
     name="CO2_Emission_analysis_sector_agent",
@@ -340,15 +480,11 @@ analysis_sector_agent = Agent(
     5. If the user asks for a graph report, you can use the get_graph_report function and show the graph.
     6. If the user asks for similar sectors, you can use the find_similar_sectors function and show the similar sectors.
     7. If the user asks for an introduction to the data, you can use the introduction_to_data function and show the introduction.
-    8. If the user asks for a list of sectors, you can use the get_sector_list function and show the list of sectors.""",
-    tools=[introduction_to_data,find_similar_sectors,compare_sectors,get_sector_report,get_graph_report,get_sector_list]
+    8. If the user asks for a list of sectors, you can use the get_sector_list function and show the list of sectors.
+    9. If the user asks to compare more than two sectors, use the compare_sectors_many function once with all of the sector names instead of calling compare_sectors pairwise.
+    10. If the user asks how a sector's emissions changed over time or month over month, use the get_sector_trend function. Pass start_month and end_month as YYYY-MM when the user names a period.
+    11. If the user asks for the top or bottom subsectors by emissions, overall or within a sector, use rank_subsectors once.""",
+    tools=TOOLS,
+    before_model_callback=router.route_sub_agent_request,
+    after_tool_callback=tool_output.record_tool_output,
 )
-
-
-
-
-
-
-
-
-
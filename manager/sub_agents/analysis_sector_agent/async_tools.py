@@ -0,0 +1,125 @@
+import asyncio
+
+import pandas as pd
+
+from ...common import aio, async_db, charts, db, metrics, resolver
+from ...common.rollups import get_rollups
+from ...common.snapshot import get_snapshot_async
+from ...common.tool_cache import cached_tool
+from . import agent as sync_tools
+
+
+# Coroutine versions of the sector tools, selected with ASYNC_TOOLS=true. They
+# keep the names and return values of the functions in agent.py; MongoDB is
+# awaited through the async driver, model.encode runs on a bounded thread pool,
+# charts render in the chart worker processes, and every tool has its own
+# concurrency limit. Snapshot mode and the rollups are in-memory, so with
+# either of them the sync implementation is reused on the IO pool; both are
+# loaded off the event loop as well.
+
+introduction_to_data = sync_tools.introduction_to_data
+
+
+async def _embed(query:str) -> list:
+    return await aio.run_blocking("encode", sync_tools.generate_embeddings, query)
+
+
+async def _fetch_sector_rows(sector_name:str) -> pd.DataFrame:
+    rows = await async_db.find_sector_rows(sector_name)
+    if not rows and resolver.is_enabled():
+        # Building the resolver or ranking a new name may encode.
+        resolved_name = await aio.run_blocking("encode", resolver.resolve_name, "sector", sector_name)
+        rows = await async_db.find_sector_rows(resolved_name) if resolved_name else []
+    elif not rows:
+        query_embedding = await _embed(sector_name)
+        candidates = await async_db.vector_search_sectors(query_embedding, num_candidates=100, limit=20)
+        if not candidates:
+            return pd.DataFrame()
+        resolved_name = db.normalize_name(candidates[0]['Sector_name'])
+        rows = await async_db.find_sector_rows(resolved_name)
+        if not rows:
+            rows = [doc for doc in candidates if db.normalize_name(doc['Sector_name']) == resolved_name]
+    return pd.DataFrame(rows)
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def get_sector_list() -> dict:
+    snapshot = await get_snapshot_async()
+    if snapshot is not None:
+        sectors = snapshot.sectors.categories['Sector_name']
+    else:
+        sectors = await async_db.distinct_sectors()
+    return sync_tools._format_sector_list(sectors)
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def find_similar_sectors(query:str) -> dict:
+    query_embedding = await _embed(query)
+    result = await async_db.vector_search_sectors(query_embedding, num_candidates=100, limit=6)
+    return sync_tools._format_similar_sectors(result)
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def get_sector_report(sector_name:str) -> dict:
+    if await get_snapshot_async() is not None or await aio.run_blocking("io", get_rollups) is not None:
+        return await aio.run_blocking("io", sync_tools.get_sector_report.__wrapped__, sector_name)
+    sector_summary = sync_tools._summarize_sector_rows(await _fetch_sector_rows(sector_name))
+    if not sector_summary:
+        return await aio.run_blocking("encode", sync_tools._sector_not_found, sector_name)
+    return sync_tools._format_sector_report(sector_summary)
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def compare_sectors(sector1:str, sector2:str) -> dict:
+    if await get_snapshot_async() is not None or resolver.is_enabled():
+        return await aio.run_blocking("io", sync_tools.compare_sectors.__wrapped__, sector1, sector2)
+    query_embedding1, query_embedding2 = await asyncio.gather(_embed(sector1), _embed(sector2))
+    comparison_fields = [field for field in db.SECTOR_FIELDS if field != 'Sector_name']
+    sector1_data, sector2_data = await asyncio.gather(
+        async_db.vector_search_sectors(query_embedding1, num_candidates=100, limit=20, fields=comparison_fields),
+        async_db.vector_search_sectors(query_embedding2, num_candidates=100, limit=100, fields=comparison_fields),
+    )
+    return sync_tools._format_sector_comparison(sector1_data, sector2_data)
+
+
+# One $in query plus an optional batched encode; the whole call runs on the IO
+# pool rather than being split into awaitable steps.
+@cached_tool
+@aio.limit_concurrency()
+async def compare_sectors_many(sectors:list[str]) -> dict:
+    return await aio.run_blocking("io", sync_tools.compare_sectors_many.__wrapped__, sectors)
+
+
+@aio.limit_concurrency(2)
+async def get_graph_report(sector_name:str, parameter:str) -> str:
+    if await get_snapshot_async() is not None or await aio.run_blocking("io", get_rollups) is not None:
+        sector_data = await aio.run_blocking("io", sync_tools._graph_rows, sector_name)
+    else:
+        sector_data = await _fetch_sector_rows(sector_name)
+    if sector_data.empty:
+        return f"No data found for sector: {sector_name}"
+    spec = sync_tools._sector_chart_spec(sector_data, sector_name, parameter)
+    try:
+        image_url = await charts.chart_url_async(spec)
+        return f"Here is the emissions trend for {sector_name}:\n\n![CO2 Emissions Trend for {sector_name}]({image_url})"
+    except RuntimeError as e:
+        return f"Error generating or uploading image for {sector_name}: {e}"
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def get_sector_trend(sector_name:str, start_month:str = "", end_month:str = "") -> dict:
+    return await aio.run_blocking("io", sync_tools.get_sector_trend.__wrapped__, sector_name, start_month, end_month)
+
+
+@cached_tool
+@aio.limit_concurrency()
+async def rank_subsectors(field:str = "2025_YTD", limit:int = 10, sector_name:str = "", ascending:bool = False) -> dict:
+    return await aio.run_blocking("io", sync_tools.rank_subsectors.__wrapped__, field, limit, sector_name, ascending)
+
+
+TOOLS = metrics.timed_tools([introduction_to_data, find_similar_sectors, compare_sectors, compare_sectors_many, get_sector_report, get_graph_report, get_sector_list, get_sector_trend, rank_subsectors])
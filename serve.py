@@ -0,0 +1,273 @@
+"""Pre-fork server for main.py's app.
+
+    python serve.py --workers 4 --port 8080
+    python serve.py --app benchmarks.loadtest_server:app --workers 4 --port 8765
+
+The parent imports the app once: the agents, the embedding model, and with
+the local vector backend the embedding matrices. It then freezes the garbage
+collector, binds the listening socket and forks the workers. Each worker runs
+uvicorn on the shared socket and reads the parent's pages copy-on-write, so
+adding a worker costs its private memory, not another copy of the model.
+
+Workers are recycled without dropping requests: a worker stops accepting,
+finishes what it is serving and exits, and the parent forks a fresh one from
+its already-loaded state. This happens after --max-requests requests (plus up
+to --max-requests-jitter, so workers do not all restart together), when a
+worker's private memory passes --max-memory-mb, and for every worker, one at
+a time, on SIGHUP. SIGTERM and SIGINT stop all workers gracefully.
+"""
+import argparse
+import gc
+import importlib
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", str(_cpu_count())))
+# 0 never recycles on that criterion.
+WORKER_MAX_REQUESTS = int(os.environ.get("WORKER_MAX_REQUESTS", "0"))
+WORKER_MAX_REQUESTS_JITTER = int(os.environ.get("WORKER_MAX_REQUESTS_JITTER", "0"))
+WORKER_MAX_MEMORY_MB = float(os.environ.get("WORKER_MAX_MEMORY_MB", "0"))
+# Seconds a stopping worker gets to finish its requests before it is killed.
+WORKER_GRACEFUL_TIMEOUT = float(os.environ.get("WORKER_GRACEFUL_TIMEOUT", "30"))
+# A worker that exits with an error sooner than this after starting is
+# replaced only after a pause, so a broken app does not fork in a tight loop.
+WORKER_MIN_UPTIME = 5.0
+
+
+# Private (unshared) memory of a process in MB: what it would free on exit.
+def private_memory_mb(pid: int) -> float:
+    total = 0
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    total += int(line.split()[1])
+    except OSError:
+        return 0.0
+    return total / 1024
+
+
+# Thread pools are sized for one worker per core before anything that reads
+# them is imported. The model is loaded in the parent, so warm-up is eager.
+def configure_environment(workers: int) -> None:
+    threads = str(max(1, _cpu_count() // workers))
+    os.environ.setdefault("TORCH_NUM_THREADS", threads)
+    os.environ.setdefault("ONNX_INTRA_OP_THREADS", threads)
+    os.environ.setdefault("OMP_NUM_THREADS", threads)
+    os.environ["MODEL_WARMUP"] = "eager"
+
+
+def load_app(target: str):
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+# Builds in the parent what the workers would otherwise each build on first
+# use, then moves every object to the permanent GC generation so collections
+# in the workers do not write to the shared pages.
+def preload() -> None:
+    from manager.common import db, models, resolver, vector_index
+
+    models.get_encoder()
+    if vector_index.use_local_backend():
+        vector_index.get_local_index(db.get_sector_collection())
+        vector_index.get_local_index(db.get_country_collection())
+    if resolver.is_enabled():
+        resolver.get_resolver()
+    gc.collect()
+    gc.freeze()
+
+
+def bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.create_server((host, port), backlog=backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """Forks the workers, replaces the ones that exit and recycles them."""
+
+    def __init__(self, app, sock: socket.socket, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers = {}
+        self.retiring = {}
+        self.respawn_at = []
+        self.stopping = False
+        self.reloading = False
+
+    def _run_worker(self) -> None:
+        import uvicorn
+
+        for signum in (signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        limit = None
+        if self.args.max_requests > 0:
+            limit = self.args.max_requests + random.randint(0, max(0, self.args.max_requests_jitter))
+        config = uvicorn.Config(
+            self.app,
+            limit_max_requests=limit,
+            timeout_graceful_shutdown=self.args.graceful_timeout,
+            log_level=self.args.log_level,
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self._run_worker()
+            except BaseException as e:
+                print(f"Worker {os.getpid()} failed: {e!r}", file=sys.stderr)
+                status = 1
+            finally:
+                os._exit(status)
+        self.workers[pid] = time.monotonic()
+        return pid
+
+    # Starts the replacement first, then asks the old worker to finish its
+    # requests and exit, so capacity does not drop.
+    def recycle(self, pid: int, reason: str) -> None:
+        if pid not in self.workers:
+            return
+        print(f"Recycling worker {pid}: {reason}")
+        del self.workers[pid]
+        self.retiring[pid] = time.monotonic()
+        self.spawn()
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.retiring.pop(pid, None)
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self.retiring.pop(pid, None) is not None or pid not in self.workers:
+                continue
+            started = self.workers.pop(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                continue
+            # A worker that reached --max-requests exits with status 0.
+            if code != 0 and time.monotonic() - started < WORKER_MIN_UPTIME:
+                print(f"Worker {pid} exited with status {code} after {time.monotonic() - started:.1f}s; restarting in 1s")
+                self.respawn_at.append(time.monotonic() + 1.0)
+            else:
+                if code != 0:
+                    print(f"Worker {pid} exited with status {code}; restarting")
+                self.spawn()
+
+    def _check_memory(self) -> None:
+        if self.args.max_memory_mb <= 0:
+            return
+        for pid in list(self.workers):
+            used = private_memory_mb(pid)
+            if used > self.args.max_memory_mb:
+                self.recycle(pid, f"{used:.0f} MB private memory")
+
+    def _kill_overdue(self) -> None:
+        now = time.monotonic()
+        for pid, since in list(self.retiring.items()):
+            if now - since > self.args.graceful_timeout + 5:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    self.retiring.pop(pid, None)
+
+    def _on_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _on_reload(self, signum, frame) -> None:
+        self.reloading = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        for _ in range(self.args.workers):
+            self.spawn()
+        print(f"Serving on {self.args.host}:{self.args.port} with {self.args.workers} workers (parent {os.getpid()})")
+        last_memory_check = 0.0
+        while not self.stopping:
+            self._reap()
+            now = time.monotonic()
+            for due in [t for t in self.respawn_at if t <= now]:
+                self.respawn_at.remove(due)
+                self.spawn()
+            if self.reloading:
+                self.reloading = False
+                for pid in list(self.workers):
+                    self.recycle(pid, "SIGHUP")
+            if now - last_memory_check >= 5:
+                last_memory_check = now
+                self._check_memory()
+            self._kill_overdue()
+            time.sleep(0.2)
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        pids = list(self.workers) + list(self.retiring)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.args.graceful_timeout
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                        remaining.discard(pid)
+                except ChildProcessError:
+                    remaining.discard(pid)
+            time.sleep(0.1)
+        for pid in remaining:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="main:app", help="module:attribute of the ASGI app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8080")))
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--max-requests", type=int, default=WORKER_MAX_REQUESTS)
+    parser.add_argument("--max-requests-jitter", type=int, default=WORKER_MAX_REQUESTS_JITTER)
+    parser.add_argument("--max-memory-mb", type=float, default=WORKER_MAX_MEMORY_MB, help="recycle a worker above this private memory")
+    parser.add_argument("--graceful-timeout", type=float, default=WORKER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    configure_environment(args.workers)
+    app = load_app(args.app)
+    preload()
+    sock = bind(args.host, args.port)
+    Supervisor(app, sock, args).run()
+
+
+if __name__ == "__main__":
+    main()
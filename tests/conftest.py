@@ -0,0 +1,7 @@
+import os
+
+# Tests never reach a real deployment: settings from .env are overridden
+# before any manager module reads them.
+os.environ["MONGO_URI"] = "mongomock://localhost"
+os.environ["VECTOR_BACKEND"] = "local"
+os.environ["BLOB_BACKEND"] = "local"
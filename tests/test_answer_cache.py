@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from google.genai import types
+
+from manager.common import answer_cache, dataset
+from manager.common.router import router
+
+
+def _vector(*values):
+    vector = np.zeros(8, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector
+
+
+INDIA = frozenset({("country", "India")})
+CHINA = frozenset({("country", "China")})
+
+
+def _store(cache, vector=_vector(1), version="v1", intent="country_report", entities=INDIA, terms=frozenset(),
+           answer="India answer"):
+    cache.store(version, vector, "text", "analysis_country_agent", intent, entities, terms, answer, 2.0)
+
+
+def test_hit_needs_the_same_intent_entities_and_terms():
+    cache = answer_cache.AnswerCache(max_size=4, ttl_seconds=60, threshold=0.9)
+    _store(cache)
+    assert cache.lookup("v1", _vector(1, 0.1), "country_report", INDIA, frozenset()).answer == "India answer"
+    assert cache.lookup("v1", _vector(1), "country_report", CHINA, frozenset()) is None
+    assert cache.lookup("v1", _vector(1), "country_trend", INDIA, frozenset()) is None
+    assert cache.lookup("v1", _vector(1), "country_report", INDIA, frozenset({"2020"})) is None
+    assert cache.lookup("v1", _vector(0, 1), "country_report", INDIA, frozenset()) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 4)
+    assert stats["saved_seconds"] > 0
+
+
+def test_new_dataset_version_drops_entries():
+    cache = answer_cache.AnswerCache(max_size=4, ttl_seconds=60, threshold=0.9)
+    _store(cache)
+    assert cache.lookup("v2", _vector(1), "country_report", INDIA, frozenset()) is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.lookup("v1", _vector(1), "country_report", INDIA, frozenset()) is None
+
+
+def test_expired_and_least_recently_used_entries_are_dropped():
+    cache = answer_cache.AnswerCache(max_size=2, ttl_seconds=60, threshold=0.9)
+    _store(cache, _vector(1), answer="a")
+    _store(cache, _vector(0, 1), answer="b")
+    assert cache.lookup("v1", _vector(1), "country_report", INDIA, frozenset()).answer == "a"
+    _store(cache, _vector(0, 0, 1), answer="c")
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup("v1", _vector(0, 1), "country_report", INDIA, frozenset()) is None
+    cache.ttl_seconds = -1
+    assert cache.lookup("v1", _vector(1), "country_report", INDIA, frozenset()) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_domain_and_filler_words_are_not_terms():
+    # Masked forms of "India CO2 report" and "emissions of India".
+    assert answer_cache.terms("country co2 report", router) == frozenset()
+    assert answer_cache.terms("emissions of country", router) == frozenset()
+    assert answer_cache.terms("Give me the CO2 report for Atlantis in 2020", router) == {"atlantis", "2020"}
+
+
+def _context(invocation_id, *authors, text="Give me a CO2 report for India"):
+    agent = SimpleNamespace(name="manager")
+    agent.root_agent = agent
+    return SimpleNamespace(
+        agent=agent,
+        invocation_id=invocation_id,
+        user_content=types.Content(role="user", parts=[types.Part(text=text)]),
+        session=SimpleNamespace(events=[SimpleNamespace(author=author) for author in authors]),
+    )
+
+
+def _answer(author, text):
+    from google.adk.events import Event
+
+    return Event(author=author, content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+@pytest.fixture
+def plugin(monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(answer_cache, "describe", lambda text: (_vector(1), "country_report", INDIA, frozenset()))
+    monkeypatch.setattr(dataset, "peek_version", lambda: "v1")
+    return answer_cache.AnswerCachePlugin("manager", answer_cache.AnswerCache(max_size=4, threshold=0.9))
+
+
+def test_plugin_serves_a_first_turn_from_an_earlier_session(plugin):
+    async def run():
+        first = _context("i1", "user")
+        await plugin.before_run_callback(invocation_context=first)
+        assert await plugin.before_agent_callback(agent=first.agent, callback_context=first) is None
+        await plugin.on_event_callback(invocation_context=first, event=_answer("analysis_country_agent", "India answer"))
+        await plugin.after_run_callback(invocation_context=first)
+
+        second = _context("i2", "user")
+        await plugin.before_run_callback(invocation_context=second)
+        return await plugin.before_agent_callback(agent=second.agent, callback_context=second)
+
+    content = asyncio.run(run())
+    assert content.parts[0].text == "India answer"
+
+
+def test_plugin_skips_follow_up_turns(plugin):
+    _store(plugin.cache)
+
+    async def run():
+        follow_up = _context("i3", "user", "manager", "user", text="now compare with Industry")
+        await plugin.before_run_callback(invocation_context=follow_up)
+        return await plugin.before_agent_callback(agent=follow_up.agent, callback_context=follow_up)
+
+    assert asyncio.run(run()) is None
+    assert plugin.cache.stats()["skipped"] == 1
+    assert plugin.cache.stats()["lookups"] == 0
+
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks import synthetic
+from manager.common import snapshot
+
+
+@pytest.fixture
+def slow_snapshot(monkeypatch):
+    loaded = snapshot.EmissionsSnapshot(
+        snapshot.ColumnarTable.from_documents(synthetic.sector_documents(50), snapshot.SECTOR_CATEGORIES, snapshot.NUMERIC_FIELDS),
+        snapshot.ColumnarTable.from_documents(synthetic.country_documents(10), snapshot.COUNTRY_CATEGORIES, snapshot.NUMERIC_FIELDS),
+    )
+
+    def load():
+        time.sleep(0.5)
+        return loaded
+
+    monkeypatch.setattr(snapshot.EmissionsSnapshot, "load", load)
+    monkeypatch.setattr(snapshot, "SNAPSHOT_MODE", True)
+    monkeypatch.setattr(snapshot, "SNAPSHOT_CHANGE_STREAMS", False)
+    monkeypatch.setattr(snapshot, "_snapshot", None)
+    return loaded
+
+
+# Longest gap between ticks of a 10 ms heartbeat while the tool runs.
+async def _longest_stall(tool, *args) -> tuple:
+    gaps = []
+
+    async def heartbeat():
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    ticker = asyncio.create_task(heartbeat())
+    start = time.perf_counter()
+    result = await tool(*args)
+    ticker.cancel()
+    # No tick at all means the loop was blocked for the whole call.
+    return max(gaps, default=time.perf_counter() - start), result
+
+
+def test_cold_snapshot_load_does_not_block_the_loop(slow_snapshot):
+    from manager.sub_agents.analysis_country_agent import async_tools as country_tools
+    from manager.sub_agents.analysis_sector_agent import async_tools as sector_tools
+
+    stall, result = asyncio.run(_longest_stall(country_tools.find_country_list.__wrapped__))
+    assert stall < 0.2
+    assert "Country 00000" in result["result"]
+    assert snapshot._snapshot is slow_snapshot
+
+    snapshot._snapshot = None
+    stall, result = asyncio.run(_longest_stall(sector_tools.get_sector_list.__wrapped__))
+    assert stall < 0.2
+    assert "Power" in str(result)
@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+from manager.common import charts, storage
+
+
+class _Store(storage.BlobStore):
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.uploaded = threading.Event()
+        self.keys = set()
+
+    def url_for(self, key: str) -> str:
+        return f"/blobs/{key}"
+
+    def exists(self, key: str) -> bool:
+        return key in self.keys
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        self.uploaded.set()
+        if self.fail:
+            raise OSError("bucket unavailable")
+        self.keys.add(key)
+
+
+def _spec():
+    return charts.ChartSpec("India", "2025_YTD", ["2024", "2025"], [1.0, 2.0], "India", "trend_line")
+
+
+def _chart_url(monkeypatch, fail: bool, wait: bool = True):
+    publisher = storage.Publisher(_Store(fail), concurrency=1)
+    monkeypatch.setattr(storage, "get_publisher", lambda: publisher)
+    monkeypatch.setattr(storage, "BLOB_WAIT_FOR_UPLOAD", wait)
+    monkeypatch.setattr(charts, "submit_render", lambda spec: _done(b"png"))
+    cache = charts.ChartCache()
+    monkeypatch.setattr(charts, "chart_cache", cache)
+    try:
+        url = charts.chart_url(_spec())
+    finally:
+        publisher._executor.shutdown(wait=True)
+    return url, cache
+
+
+def _done(value):
+    from concurrent.futures import Future
+
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def test_chart_url_is_cached_after_upload(monkeypatch):
+    url, cache = _chart_url(monkeypatch, fail=False)
+    assert cache.get(_spec().cache_key()) == url
+
+
+def test_failed_upload_is_an_error(monkeypatch):
+    with pytest.raises(RuntimeError, match="bucket unavailable"):
+        _chart_url(monkeypatch, fail=True)
+    assert charts.chart_cache.get(_spec().cache_key()) is None
+
+
+def test_failed_upload_without_waiting_is_not_cached(monkeypatch):
+    _, cache = _chart_url(monkeypatch, fail=True, wait=False)
+    assert cache.get(_spec().cache_key()) is None
+
+
+def test_finished_uploads_are_not_kept():
+    store = _Store()
+    publisher = storage.Publisher(store, concurrency=2)
+    urls = [publisher.publish(f"image {i}".encode()) for i in range(20)]
+    assert publisher.publish(b"image 0") == urls[0]
+    publisher._executor.shutdown(wait=True)
+    assert publisher._uploads == {}
+    stats = publisher.stats()
+    assert (stats["uploaded"], stats["deduplicated"], stats["pending"]) == (20, 1, 0)
+
+
+def test_render_workers_do_not_import_the_manager_package():
+    charts.shutdown()
+    try:
+        image = charts.submit_render(_spec()).result(timeout=120)
+        assert image.startswith(b"\x89PNG")
+        assert not charts._get_pool().submit(eval, "'manager' in __import__('sys').modules").result(timeout=60)
+    finally:
+        charts.shutdown()
+
+
+def test_chart_url_times_out(monkeypatch):
+    from concurrent.futures import Future
+
+    monkeypatch.setattr(charts, "CHART_RENDER_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(charts, "submit_render", lambda spec: Future())
+    monkeypatch.setattr(charts, "chart_cache", charts.ChartCache())
+    with pytest.raises(RuntimeError, match="timed out"):
+        charts.chart_url(_spec())
+
+
+def test_blob_store_without_put_cannot_be_built():
+    class Unfinished(storage.BlobStore):
+        def url_for(self, key: str) -> str:
+            return key
+
+        def exists(self, key: str) -> bool:
+            return False
+
+    with pytest.raises(TypeError, match="put"):
+        Unfinished()
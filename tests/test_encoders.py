@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+
+from manager.common import models
+
+# The int8 export must stay close enough to the PyTorch model that vectors
+# stored with one can be searched with the other.
+MIN_COSINE = 0.99
+MIN_NEIGHBOUR_AGREEMENT = 0.9
+
+TEXTS = [
+    "Power", "Industry", "Ground Transport", "Residential", "Domestic Aviation",
+    "International Aviation", "International Shipping", "Fossil Fuel Operations",
+    "Agriculture", "Waste", "United States", "China", "India", "Germany",
+    "United Kingdom", "Brazil", "emissions from planes", "coal power plants",
+    "cars and trucks", "heating homes", "which country emits the most",
+]
+
+
+@pytest.fixture(scope="module")
+def encoders():
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    pytest.importorskip("sentence_transformers")
+    if not os.path.exists(os.path.join(models.ONNX_MODEL_DIR, "model.onnx")):
+        pytest.skip(f"no exported model in {models.ONNX_MODEL_DIR}; run python -m manager.common.models")
+    return models.SentenceTransformerEncoder(), models.OnnxEncoder()
+
+
+def test_onnx_vectors_match_sentence_transformers(encoders):
+    reference, candidate = (np.asarray(encoder.encode(TEXTS), dtype=np.float32) for encoder in encoders)
+    assert candidate.shape == reference.shape
+    cosines = np.sum(reference * candidate, axis=1)
+    assert cosines.min() >= MIN_COSINE, TEXTS[int(cosines.argmin())]
+
+
+def test_onnx_nearest_neighbours_match(encoders):
+    def neighbours(vectors):
+        scores = vectors @ vectors.T
+        np.fill_diagonal(scores, -np.inf)
+        return scores.argmax(axis=1)
+
+    reference, candidate = (np.asarray(encoder.encode(TEXTS), dtype=np.float32) for encoder in encoders)
+    assert np.mean(neighbours(reference) == neighbours(candidate)) >= MIN_NEIGHBOUR_AGREEMENT
+
+
+def test_onnx_encodes_single_text_as_vector(encoders):
+    _, onnx = encoders
+    vector = onnx.encode("Power")
+    assert vector.ndim == 1
+    assert abs(float(np.linalg.norm(vector)) - 1.0) < 1e-5
+    assert onnx.encode([]).size == 0
+
+
+def test_encoder_without_encode_cannot_be_built():
+    class Unfinished(models.Encoder):
+        pass
+
+    with pytest.raises(TypeError, match="encode"):
+        Unfinished()
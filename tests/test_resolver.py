@@ -0,0 +1,87 @@
+import pytest
+
+from benchmarks import synthetic
+from manager.common import db, resolver
+
+COUNTRIES = ["United States", "United Kingdom", "United Arab Emirates", "Argentina", "India", "Indonesia",
+             "Nigeria", "Germany", "Peru", "China", "Canada", "Ethiopia"]
+NAMES = {"sector": synthetic.SECTORS, "country": COUNTRIES}
+
+
+# Trigrams only: the decisions below must not depend on the encoder.
+@pytest.fixture(scope="module")
+def instance():
+    return resolver.Resolver(NAMES, semantic=False)
+
+
+@pytest.mark.parametrize("kind, query, expected, match", [
+    ("country", "  GERMANY ", "Germany", "exact"),
+    ("country", "U.S.A.", "United States", "alias"),
+    ("country", "uae", "United Arab Emirates", "alias"),
+    ("sector", "Oil & gas", "Fossil Fuel Operations", "alias"),
+    ("country", "Germny", "Germany", "fused"),
+    ("country", "Preu", "Peru", "fused"),
+    ("sector", "Indsutry", "Industry", "fused"),
+    ("sector", "Fossil Fuel", "Fossil Fuel Operations", "fused"),
+])
+def test_resolves_known_names(instance, kind, query, expected, match):
+    best = instance.resolve(kind, query, limit=1)[0]
+    assert (best.name, best.match) == (expected, match)
+
+
+@pytest.mark.parametrize("kind, query", [
+    ("country", "Atlantis"),
+    ("country", "Narnia"),
+    ("country", "Wakanda"),
+    ("sector", "nonsense xyz"),
+    ("sector", "Mordor"),
+])
+def test_unknown_names_are_only_suggestions(instance, kind, query):
+    candidates = instance.resolve(kind, query)
+    assert all(candidate.match == "suggestion" for candidate in candidates)
+
+
+def test_scores_are_raw(instance):
+    best = instance.resolve("country", "Germny", limit=1)[0]
+    # One ranking only: at most 1 / (k + 1), never rescaled to 1.0.
+    assert 0 < best.score <= 1 / (resolver.RESOLVER_RRF_K + 1)
+    assert best.overlap < 1.0
+    assert best.similarity is None
+
+
+def test_spelling_counts_a_swap_as_one_edit():
+    assert resolver.spelling("peru", "preu") == 0.75
+    assert resolver.spelling("india", "india") == 1.0
+
+
+@pytest.fixture
+def dataset_resolver(monkeypatch, instance):
+    database = db.get_database()
+    database[db.SECTOR_COLLECTION].drop()
+    database[db.COUNTRY_COLLECTION].drop()
+    database[db.SECTOR_COLLECTION].insert_many(synthetic.sector_documents(200))
+    database[db.COUNTRY_COLLECTION].insert_many(
+        [dict(doc, Country=name) for doc, name in zip(synthetic.country_documents(len(COUNTRIES)), COUNTRIES)]
+    )
+    monkeypatch.setattr(resolver, "get_resolver", lambda: instance)
+    monkeypatch.setattr(resolver, "RESOLVER_ENABLED", True)
+    yield
+    database[db.SECTOR_COLLECTION].drop()
+    database[db.COUNTRY_COLLECTION].drop()
+
+
+def test_unknown_country_report_is_an_error(dataset_resolver):
+    from manager.sub_agents.analysis_country_agent import agent as country_agent
+
+    assert resolver.resolve_name("country", "Atlantis") is None
+    result = country_agent.get_country_report.__wrapped__("Atlantis")
+    assert "error" in result and "Argentina" not in result.get("result", "")
+    assert country_agent.get_country_report.__wrapped__("Germny")["result"]
+
+
+def test_unknown_sector_is_reported_missing(dataset_resolver):
+    from manager.sub_agents.analysis_sector_agent import agent as sector_agent
+
+    result = str(sector_agent.compare_sectors_many.__wrapped__(["nonsense xyz", "Power"]))
+    assert "Sectors not found: nonsense xyz" in result
+    assert "Fossil Fuel Operations" not in result
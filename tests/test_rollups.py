@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from manager.common import dataset, db, rollups
+
+
+@pytest.fixture
+def loaded():
+    database = db.get_database()
+    for name in (db.SECTOR_COLLECTION, db.COUNTRY_COLLECTION, dataset.DATASET_META_COLLECTION, rollups.ROLLUP_COLLECTION):
+        database[name].drop()
+    database[db.SECTOR_COLLECTION].insert_many(synthetic.sector_documents(300, subsectors_per_sector=5))
+    database[db.COUNTRY_COLLECTION].insert_many(synthetic.country_documents(30))
+    rollups.rebuild(dataset.publish_version())
+    yield
+    for name in (db.SECTOR_COLLECTION, db.COUNTRY_COLLECTION, dataset.DATASET_META_COLLECTION, rollups.ROLLUP_COLLECTION):
+        database[name].drop()
+    rollups.invalidate()
+
+
+def _raw(collection, keys: list) -> pd.DataFrame:
+    rows = pd.DataFrame(list(collection.find({}, {"_id": 0, "embedding": 0})))
+    aggregations = {field: "sum" for field in rollups.SUM_FIELDS}
+    aggregations.update({field: "mean" for field in rollups.MEAN_FIELDS})
+    return rows.groupby(keys).agg(aggregations)
+
+
+def _assert_row(expected: pd.Series, row: dict):
+    for field, value in expected.items():
+        assert row[field] == pytest.approx(value), field
+
+
+def test_rollups_match_the_raw_rows(loaded):
+    current = rollups.get_rollups()
+    assert current is not None
+    subsectors = _raw(db.get_sector_collection(), ["Sector_name", "Subsector_Name"])
+    for sector in synthetic.SECTORS:
+        rows = current.sector_subsectors(sector.upper())
+        assert [row["Subsector_Name"] for row in rows] == list(subsectors.loc[sector].index)
+        for row in rows:
+            _assert_row(subsectors.loc[(sector, row["Subsector_Name"])], row)
+    for sector, expected in _raw(db.get_sector_collection(), ["Sector_name"]).iterrows():
+        _assert_row(expected, current.sector_total(sector))
+    for continent, expected in _raw(db.get_country_collection(), ["Continent"]).iterrows():
+        _assert_row(expected, current.continent_total(continent))
+
+
+def test_manual_load_invalidates_the_rollups(loaded):
+    version = dataset.current_version()
+    assert rollups.get_rollups() is not None
+    # As mongoimport would: rows appear without a published version.
+    db.get_sector_collection().insert_many(synthetic.sector_documents(10, seed=9))
+    dataset.invalidate()
+    assert dataset.current_version() != version
+    assert rollups.get_rollups() is None
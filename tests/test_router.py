@@ -0,0 +1,85 @@
+import asyncio
+import re
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from google.genai import types
+
+from benchmarks import synthetic
+from manager.common import dataset, embedding_cache, models
+from manager.common import router as router_module
+
+COUNTRIES = ["France", "India", "United States"]
+
+
+# Bag of words: requests that share most words with an exemplar score high,
+# so the decisions below follow the exemplars rather than a trained model.
+def _encode(texts):
+    single = isinstance(texts, str)
+    vectors = np.zeros((1 if single else len(texts), 512), dtype=np.float32)
+    for row, text in enumerate([texts] if single else texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, zlib.crc32(word.encode()) % 512] += 1.0
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+    return vectors[0] if single else vectors
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(models, "encode", _encode)
+    monkeypatch.setattr(router_module, "embedding_cache", embedding_cache.EmbeddingCache(path=None))
+    monkeypatch.setattr(dataset, "current_version", lambda: "v1")
+    monkeypatch.setattr(router_module.EntityDictionary, "load",
+                        classmethod(lambda cls: cls(synthetic.SECTORS, COUNTRIES)))
+    instance = router_module.Router(threshold=0.6, margin=0.05)
+    monkeypatch.setattr(router_module, "router", instance)
+    return instance
+
+
+def test_clear_sector_request_calls_the_report_tool(router):
+    route, reason = router.route("Give me a report on Power")
+    assert reason == ""
+    assert (route.agent, route.tool, route.args) == (router_module.SECTOR_AGENT, "get_sector_report", {"sector_name": "Power"})
+    assert route.score >= router.threshold and route.margin >= router.margin
+
+
+def test_clear_country_request_calls_the_report_tool(router):
+    route, reason = router.route("country report for India")
+    assert reason == ""
+    assert (route.agent, route.tool, route.args) == (router_module.COUNTRY_AGENT, "get_country_report", {"country": "India"})
+
+
+@pytest.mark.parametrize("text, reason", [
+    ("What should I cook tonight?", "low_score"),
+    ("report", "ambiguous"),
+    ("Power sector report for France", "entity_conflict"),
+])
+def test_unclear_requests_fall_back_to_the_llm(router, text, reason):
+    assert router.route(text) == (None, reason)
+
+
+def _request(text):
+    return SimpleNamespace(contents=[types.Content(role="user", parts=[types.Part(text=text)])])
+
+
+def _callback(mode, monkeypatch, text):
+    monkeypatch.setattr(router_module, "ROUTER_MODE", mode)
+    context = SimpleNamespace(invocation_id=f"{mode}-{text}", agent_name="manager")
+    return asyncio.run(router_module.route_manager_request(context, _request(text)))
+
+
+def test_on_transfers_without_the_llm(router, monkeypatch):
+    response = _callback("on", monkeypatch, "Give me a report on Power")
+    call = response.content.parts[0].function_call
+    assert (call.name, call.args) == ("transfer_to_agent", {"agent_name": router_module.SECTOR_AGENT})
+
+
+def test_off_does_not_encode(router, monkeypatch):
+    def fail(text):
+        raise AssertionError("routed while off")
+
+    monkeypatch.setattr(router, "route", fail)
+    assert _callback("off", monkeypatch, "Give me a report on Power") is None
+    assert router._exemplars is None
@@ -0,0 +1,161 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+from google.adk.errors.already_exists_error import AlreadyExistsError
+from google.adk.events.event import Event
+from google.adk.events.event_actions import EventActions
+from google.genai import types
+
+from manager.common import db, session_store
+
+APP = "manager"
+
+
+@pytest.fixture(params=["sqlite", "mongo"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return session_store.SqliteSessionStore(str(tmp_path / "sessions.db"))
+    database = db.get_database()
+    for name in (session_store.SESSIONS_COLLECTION, session_store.SESSION_EVENTS_COLLECTION, session_store.SESSION_STATE_COLLECTION):
+        database[name].drop()
+    return session_store.MongoSessionStore()
+
+
+def _event(author: str, text: str, state_delta: dict = None) -> Event:
+    role = "user" if author == "user" else "model"
+    return Event(author=author, invocation_id="turn", content=types.Content(role=role, parts=[types.Part(text=text)]),
+                 actions=EventActions(state_delta=state_delta or {}))
+
+
+def _texts(session) -> list:
+    return [event.content.parts[0].text for event in session.events]
+
+
+def test_create_append_get_list_delete(store):
+    service = session_store.StoreSessionService(store)
+
+    async def main():
+        session = await service.create_session(app_name=APP, user_id="ann", session_id="s1", state={"topic": "Power"})
+        await service.append_event(session, _event("user", "Report on Power"))
+        await service.append_event(session, _event("manager", "Power emissions rose."))
+        loaded = await service.get_session(app_name=APP, user_id="ann", session_id="s1")
+        listed = await service.list_sessions(app_name=APP, user_id="ann")
+        await service.delete_session(app_name=APP, user_id="ann", session_id="s1")
+        return loaded, listed, await service.get_session(app_name=APP, user_id="ann", session_id="s1"), \
+            await service.list_sessions(app_name=APP)
+
+    loaded, listed, deleted, remaining = asyncio.run(main())
+    assert _texts(loaded) == ["Report on Power", "Power emissions rose."]
+    assert loaded.state == {"topic": "Power"}
+    assert [session.id for session in listed.sessions] == ["s1"]
+    assert deleted is None
+    assert remaining.sessions == []
+    # The final answer ended the turn, so both events went out in one chunk.
+    assert service.stats()["flushes"] == 1
+
+
+def test_events_are_written_in_batched_chunks(store):
+    service = session_store.StoreSessionService(store, batch_size=3, flush_ms=60_000)
+
+    async def main():
+        session = await service.create_session(app_name=APP, user_id="ann", session_id="s1")
+        for i in range(7):
+            await service.append_event(session, _event("user", f"message {i}"))
+        flushed = service.stats()["flushes"]
+        return flushed, await service.get_session(app_name=APP, user_id="ann", session_id="s1")
+
+    flushed, loaded = asyncio.run(main())
+    assert flushed == 2
+    assert _texts(loaded) == [f"message {i}" for i in range(7)]
+    _, chunks = store.load(APP, "ann", "s1")
+    assert [len(session_store.decode_events(data, compressed)) for compressed, data in chunks] == [3, 3, 1]
+    assert service.stats()["pending_events"] == 0
+
+
+def test_large_chunks_are_compressed(store, monkeypatch):
+    monkeypatch.setattr(session_store, "SESSION_COMPRESS_MIN_BYTES", 512)
+    service = session_store.StoreSessionService(store)
+    long_answer = "Power emissions by subsector. " * 100
+
+    async def main():
+        session = await service.create_session(app_name=APP, user_id="ann", session_id="s1")
+        await service.append_event(session, _event("manager", "ok"))
+        await service.append_event(session, _event("manager", long_answer))
+        return await service.get_session(app_name=APP, user_id="ann", session_id="s1")
+
+    loaded = asyncio.run(main())
+    assert _texts(loaded) == ["ok", long_answer]
+    _, chunks = store.load(APP, "ann", "s1")
+    assert [compressed for compressed, _ in chunks] == [False, True]
+    stats = service.stats()
+    assert stats["stored_bytes"] < stats["raw_bytes"]
+
+
+def test_expired_sessions_are_not_returned_and_can_be_recreated(store, monkeypatch):
+    monkeypatch.setattr(session_store, "SESSION_TTL_SECONDS", 60)
+    old = time.time() - 120
+    store.create(APP, "ann", "old", {"topic": "Power"}, old)
+    store.write(APP, "ann", "old", {"topic": "Power"}, old, None)
+    store.create(APP, "ann", "new", {}, time.time())
+    assert store.load(APP, "ann", "old") is None
+    assert [row["id"] for row in store.list(APP, "ann")] == ["new"]
+    store.create(APP, "ann", "old", {"topic": "Waste"}, time.time())
+    row, _ = store.load(APP, "ann", "old")
+    assert row["state"] == {"topic": "Waste"}
+
+
+def test_zero_ttl_keeps_sessions(store, monkeypatch):
+    monkeypatch.setattr(session_store, "SESSION_TTL_SECONDS", 0)
+    store.create(APP, "ann", "old", {}, time.time() - 365 * 24 * 3600)
+    assert store.load(APP, "ann", "old") is not None
+
+
+def test_sqlite_purges_expired_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_store, "SESSION_TTL_SECONDS", 60)
+    path = str(tmp_path / "sessions.db")
+    store = session_store.SqliteSessionStore(path)
+    old = time.time() - 120
+    store.create(APP, "ann", "old", {}, old)
+    store.write(APP, "ann", "old", {}, old, {"ts": old, "ts_last": old, "count": 0, "z": False, "data": b"[]"})
+    store._purged_at = 0.0
+    store.create(APP, "ann", "new", {}, time.time())
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT session_id FROM sessions").fetchall() == [("new",)]
+        assert connection.execute("SELECT COUNT(*) FROM session_events").fetchone() == (0,)
+
+
+def test_duplicate_session_raises_already_exists(store):
+    service = session_store.StoreSessionService(store)
+
+    async def main():
+        await service.create_session(app_name=APP, user_id="ann", session_id="s1")
+        await service.create_session(app_name=APP, user_id="ann", session_id="s1")
+
+    with pytest.raises(AlreadyExistsError):
+        asyncio.run(main())
+
+
+def test_app_and_user_state_are_merged_into_every_session(store):
+    service = session_store.StoreSessionService(store)
+
+    async def main():
+        first = await service.create_session(app_name=APP, user_id="ann", session_id="s1",
+                                             state={"app:units": "Mt", "user:name": "Ann", "topic": "Power"})
+        await service.append_event(first, _event("manager", "noted", {"user:country": "India", "app:year": 2025}))
+        second = await service.create_session(app_name=APP, user_id="ann", session_id="s2")
+        other = await service.create_session(app_name=APP, user_id="bob", session_id="s3")
+        reloaded = await service.get_session(app_name=APP, user_id="ann", session_id="s1")
+        return second, other, reloaded, await service.get_user_state(app_name=APP, user_id="ann")
+
+    second, other, reloaded, user_state = asyncio.run(main())
+    assert second.state == {"app:units": "Mt", "app:year": 2025, "user:name": "Ann", "user:country": "India"}
+    assert other.state == {"app:units": "Mt", "app:year": 2025}
+    assert reloaded.state == {"topic": "Power", "app:units": "Mt", "app:year": 2025, "user:name": "Ann", "user:country": "India"}
+    assert user_state == {"name": "Ann", "country": "India"}
+
+
+def test_store_is_abstract():
+    with pytest.raises(TypeError):
+        session_store.SessionStore()
@@ -0,0 +1,70 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from manager.common import db, snapshot
+
+
+# Sector rows where about a fifth of the numbers are missing, and one
+# subsector has no Monthly_%_change at all.
+def _documents_with_gaps() -> list:
+    rng = random.Random(7)
+    docs = synthetic.sector_documents(400, subsectors_per_sector=6)
+    for doc in docs:
+        for field in synthetic.NUMERIC_FIELDS:
+            if rng.random() < 0.2:
+                doc[field] = None
+        if doc["Subsector_Name"] == "Power subsector 0":
+            doc["Monthly_%_change"] = None
+    return docs
+
+
+@pytest.fixture(scope="module")
+def loaded():
+    database = db.get_database()
+    database[db.SECTOR_COLLECTION].drop()
+    database[db.COUNTRY_COLLECTION].drop()
+    database[db.SECTOR_COLLECTION].insert_many(_documents_with_gaps())
+    database[db.COUNTRY_COLLECTION].insert_many(synthetic.country_documents(20))
+    yield snapshot.EmissionsSnapshot.load()
+    database[db.SECTOR_COLLECTION].drop()
+    database[db.COUNTRY_COLLECTION].drop()
+
+
+def _assert_same(expected: list, actual: list):
+    assert [row["Subsector_Name"] for row in actual] == [row["Subsector_Name"] for row in expected]
+    for want, got in zip(expected, actual):
+        for field, value in want.items():
+            if field != "Subsector_Name":
+                np.testing.assert_allclose(got[field], value, rtol=1e-9, equal_nan=True, err_msg=field)
+
+
+@pytest.mark.parametrize("sector", ["Power", "Industry", "Waste"])
+def test_group_matches_pandas_on_the_mongo_path(loaded, sector):
+    from manager.sub_agents.analysis_sector_agent import agent as sector_agent
+
+    expected = sector_agent._summarize_sector_rows(pd.DataFrame(db.find_sector_rows(sector)))
+    mask = loaded.sectors.mask_eq("Sector_name", sector)
+    actual = loaded.sectors.group("Subsector_Name", mask, sector_agent.SUMMED_FIELDS, ["Monthly_%_change"])
+    _assert_same(expected, actual)
+    power = {row["Subsector_Name"]: row for row in actual}.get("Power subsector 0")
+    if power is not None:
+        assert np.isnan(power["Monthly_%_change"])
+        assert not np.isnan(power["Mar_2025_Total"])
+
+
+def test_pivot_matches_pandas_pivot_table(loaded):
+    sectors = ["Power", "Agriculture"]
+    rows = pd.DataFrame(db.find_rows_for_sectors(sectors, fields=["Sector_name", "Subsector_Name", "Mar_2025_Total", "Monthly_%_change"]))
+    masks = [loaded.sectors.mask_eq("Sector_name", name) for name in sectors]
+    subsectors = loaded.sectors.categories["Subsector_Name"]
+    for field, how in (("Mar_2025_Total", "sum"), ("Monthly_%_change", "mean")):
+        expected = rows.groupby(["Sector_name", "Subsector_Name"])[field].agg(how)
+        present, values = loaded.sectors.pivot("Subsector_Name", masks, field, how=how)
+        for i, name in enumerate(sectors):
+            for code in np.flatnonzero(present[i]):
+                np.testing.assert_allclose(values[i, code], expected[(name, subsectors[code])], equal_nan=True)
+            assert present[i].sum() == len(expected[name])
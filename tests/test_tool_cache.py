@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from manager.common import dataset, tool_cache
+
+N = 8
+
+
+class _Slow:
+    """Counts calls and holds each one until released."""
+
+    def __init__(self, value="result", error: Exception = None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+# Runs N identical calls on threads and releases the first one only after all
+# the others are waiting on it.
+def _concurrent_calls(cache, compute):
+    def call():
+        try:
+            return cache.get_or_compute("tool", "key", compute)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(N) as pool:
+        first = pool.submit(call)
+        compute.started.wait(5)
+        others = [pool.submit(call) for _ in range(N - 1)]
+        while cache.stats()["coalesced"] < N - 1:
+            time.sleep(0.001)
+        compute.release.set()
+        return [first.result()] + [future.result() for future in others]
+
+
+def test_concurrent_identical_calls_run_once():
+    cache = tool_cache.ToolCache()
+    compute = _Slow()
+    assert _concurrent_calls(cache, compute) == ["result"] * N
+    assert compute.calls == 1
+    assert cache.get_or_compute("tool", "key", compute) == "result"
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, N - 1, 1)
+
+
+def test_concurrent_identical_coroutine_calls_run_once():
+    cache = tool_cache.ToolCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute_async("tool", "key", compute) for _ in range(N)))
+
+    assert asyncio.run(main()) == ["result"] * N
+    assert len(calls) == 1
+
+
+def test_exception_reaches_every_waiter_and_is_not_cached():
+    cache = tool_cache.ToolCache()
+    compute = _Slow(error=ValueError("boom"))
+    results = _concurrent_calls(cache, compute)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert compute.calls == 1
+    assert cache.stats()["size"] == 0
+    assert cache.get_or_compute("tool", "key", lambda: "recovered") == "recovered"
+
+
+def test_coroutine_exception_is_not_cached():
+    cache = tool_cache.ToolCache()
+
+    async def fail():
+        raise ValueError("boom")
+
+    async def succeed():
+        return "recovered"
+
+    with pytest.raises(ValueError):
+        asyncio.run(cache.get_or_compute_async("tool", "key", fail))
+    assert asyncio.run(cache.get_or_compute_async("tool", "key", succeed)) == "recovered"
+
+
+def test_sync_caller_shares_an_in_flight_coroutine_call():
+    cache = tool_cache.ToolCache()
+    started = threading.Event()
+
+    async def compute():
+        started.set()
+        await asyncio.sleep(0.2)
+        return "from coroutine"
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(asyncio.run(cache.get_or_compute_async("tool", "key", compute))))
+    owner.start()
+    started.wait(5)
+    assert cache.get_or_compute("tool", "key", lambda: "recomputed") == "from coroutine"
+    owner.join()
+    assert results == ["from coroutine"]
+
+
+def test_sync_caller_on_the_owning_loop_computes_instead_of_blocking():
+    cache = tool_cache.ToolCache()
+
+    async def compute():
+        await asyncio.sleep(0.1)
+        return "from coroutine"
+
+    async def main():
+        running = asyncio.ensure_future(cache.get_or_compute_async("tool", "key", compute))
+        await asyncio.sleep(0)
+        inline = cache.get_or_compute("tool", "key", lambda: "computed inline")
+        return inline, await running
+
+    assert asyncio.run(main()) == ("computed inline", "from coroutine")
+
+
+def test_new_dataset_version_misses(monkeypatch):
+    monkeypatch.setattr(tool_cache, "tool_cache", tool_cache.ToolCache())
+    monkeypatch.setattr(tool_cache, "TOOL_CACHE_ENABLED", True)
+    version = ["v1"]
+    monkeypatch.setattr(dataset, "current_version", lambda: version[0])
+    calls = []
+
+    @tool_cache.cached_tool
+    def report(name: str) -> dict:
+        calls.append(name)
+        return {"result": f"{name} {version[0]}"}
+
+    assert report("India") == {"result": "India v1"}
+    assert report("  india ") == {"result": "India v1"}
+    version[0] = "v2"
+    assert report("India") == {"result": "India v2"}
+    assert calls == ["India", "India"]
+
+
+def test_expiry_and_eviction_are_counted():
+    cache = tool_cache.ToolCache(max_size=2, ttl_seconds=0.05)
+    for key in ("a", "b", "c"):
+        cache.get_or_compute("tool", key, lambda: key)
+    assert cache.stats()["evictions"] == 1
+    time.sleep(0.1)
+    cache.get_or_compute("tool", "c", lambda: "c again")
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["misses"] == 4
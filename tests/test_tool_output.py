@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+
+from manager.common import tool_output
+
+
+def _record(response):
+    tool_output.record_tool_output(SimpleNamespace(name="rank_subsectors"), {}, None, response)
+
+
+def test_truncation_is_counted_for_every_response(monkeypatch):
+    monkeypatch.setattr(tool_output, "output_stats", tool_output.OutputStats())
+    monkeypatch.setitem(tool_output._budgets, "rank_subsectors", 20)
+    rows = [[f"subsector {i}", 1000.0 * i] for i in range(50)]
+    text = tool_output.table("rank_subsectors", "Top subsectors:", ["Subsector", "2025_YTD"], rows,
+                             rank_by="2025_YTD", sum_columns=("2025_YTD",))
+    kept = len(text.splitlines()) - 3
+    # The second call is what a tool cache hit returns: the same result,
+    # without formatting it again.
+    _record({"result": text})
+    _record({"result": text})
+    entry = tool_output.output_stats.stats()["tools"]["rank_subsectors"]
+    assert entry["calls"] == 2
+    assert entry["truncated"] == 2
+    assert entry["rows_omitted"] == 2 * (50 - kept)
+
+
+def test_name_list_truncation_is_counted(monkeypatch):
+    monkeypatch.setattr(tool_output, "output_stats", tool_output.OutputStats())
+    monkeypatch.setitem(tool_output._budgets, "rank_subsectors", 20)
+    text = tool_output.name_list("rank_subsectors", "Sectors", [f"Sector number {i}" for i in range(40)])
+    _record({"result": text})
+    entry = tool_output.output_stats.stats()["tools"]["rank_subsectors"]
+    assert entry["truncated"] == 1
+    assert entry["rows_omitted"] == int(text.rsplit("(", 1)[1].split()[0])
+
+
+def test_verbose_is_the_default():
+    assert tool_output.TOOL_OUTPUT_MODE == "verbose" or tool_output.os.environ.get("TOOL_OUTPUT")